@@ -19,6 +19,7 @@
 
 """Definition of administration interface for club management application"""
 
+import csv
 import datetime
 
 from admin_numeric_filter.admin import NumericFilterModelAdmin, RangeNumericFilter
@@ -31,6 +32,7 @@ from adminfilters.filters import RelatedFieldCheckBoxFilter
 from advanced_filters.admin import AdminAdvancedFiltersMixin
 
 from django import forms
+from django.conf import settings
 from django.contrib import admin, messages
 from django.contrib.admin import site
 from django.contrib.admin.templatetags.admin_list import _boolean_icon
@@ -39,8 +41,20 @@ from django.contrib.contenttypes.models import ContentType
 from django.core import serializers
 from django.core.exceptions import ValidationError
 from django.core.validators import EmailValidator
-from django.db.models import CharField, Count, F, Max, Min, OuterRef, Q, Subquery, Sum
-from django.http import HttpResponse, HttpResponseRedirect
+from django.db.models import (
+    CharField,
+    Count,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    prefetch_related_objects,
+)
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.urls import resolve
 from django.utils.html import format_html, format_html_join, mark_safe
@@ -84,10 +98,11 @@ from related_admin import RelatedFieldAdmin
 import requests
 
 from smmapdfs.admin_abcs import PdfSandwichAdmin
-from smmapdfs.actions import make_pdfsandwich
+from smmapdfs.models import PdfSandwichType
 
 
-from . import filters, mailing, tasks
+from . import filters, mailing, profile_search, tasks, tax_confirmations
+from .admin_views import FastChangeListAdminMixin, SearchRankChangeList
 from .filters import (
     DPCHEventName,
     DPCHEventPaymentsAmount,
@@ -140,6 +155,8 @@ from aklub.models import (
     Source,
     TaxConfirmation,
     TaxConfirmationPdf,
+    TaxConfirmationRun,
+    TaxConfirmationRunProfile,
     Telephone,
     UserBankAccount,
     UserProfile,
@@ -150,9 +167,11 @@ from .profile_model_resources import (
 )
 from .profile_model_resources_mixin import ProfileModelResourceMixin
 from .utils import (
-    annotation_friendly_search_results,
     check_annotate_filters,
     edit_donor_annotate_filter,
+    get_unit_access,
+    payments_by_year,
+    payments_by_year_lines,
     sweet_text,
 )
 
@@ -310,9 +329,9 @@ class DonorPaymentChannelInline(admin.StackedInline):
     get_dpch_details.short_description = _("DPCH details")
 
     def get_queryset(self, request):
-        if not request.user.has_perm("aklub.can_edit_all_units"):
+        if not get_unit_access(request).all_units:
             queryset = DonorPaymentChannel.objects.filter(
-                money_account__administrative_unit__in=request.user.administrated_units.all()
+                money_account__administrative_unit__in=get_unit_access(request).unit_ids
             )
         else:
             queryset = super().get_queryset(request)
@@ -324,17 +343,17 @@ class DonorPaymentChannelInline(admin.StackedInline):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "money_account":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
+            if not get_unit_access(request).all_units:
                 kwargs["queryset"] = MoneyAccount.objects.filter(
-                    administrative_unit__in=request.user.administrated_units.all()
+                    administrative_unit__in=get_unit_access(request).unit_ids
                 )
             else:
                 kwargs["queryset"] = MoneyAccount.objects.all()
 
         if db_field.name == "event":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
+            if not get_unit_access(request).all_units:
                 kwargs["queryset"] = Event.objects.filter(
-                    administrative_units__in=request.user.administrated_units.all()
+                    administrative_units__in=get_unit_access(request).unit_ids
                 )
             else:
                 kwargs["queryset"] = Event.objects.all()
@@ -376,25 +395,36 @@ class PaymentsInlineNoExtra(PaymentsInline):
 
 
 def show_payments_by_year(self, request, queryset):
-    payments = Payment.objects.filter(user_donor_payment_channel__in=queryset)
-    payment_dates = payments.dates("date", "year")
-    amount_string = [
-        "%s: %s"
-        % (
-            date_year.year,
-            payments.filter(date__year=date_year.year).aggregate(Sum("amount"))[
-                "amount__sum"
-            ],
+    if queryset.count() > settings.PAYMENTS_BY_YEAR_BACKGROUND_LIMIT:
+        tasks.show_payments_by_year.delay(
+            list(queryset.values_list("pk", flat=True)),
+            request.user.pk,
         )
-        for date_year in payment_dates
-    ]
-    amount_string += (_("TOT.: %s") % payments.aggregate(Sum("amount"))["amount__sum"],)
-    self.message_user(request, mark_safe("<br/>".join(amount_string)))
+        self.message_user(
+            request, _("Payments by year will be sent to you as a notification")
+        )
+        return
+    lines = payments_by_year_lines(payments_by_year(queryset))
+    self.message_user(request, mark_safe("<br/>".join(lines)))
 
 
 show_payments_by_year.short_description = _("Show payments by year")
 
 
+def download_payments_by_year(self, request, queryset):
+    years = payments_by_year(queryset)
+    response = HttpResponse(content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="payments_by_year.csv"'
+    writer = csv.writer(response)
+    writer.writerow((_("Year"), _("Amount")))
+    writer.writerows(years)
+    writer.writerow((_("Total"), sum(amount for year, amount in years)))
+    return response
+
+
+download_payments_by_year.short_description = _("Download payments by year as CSV")
+
+
 def send_mass_communication_action(self, request, queryset):
     """Mass communication action
 
@@ -691,9 +721,9 @@ class PreferenceInline(admin.StackedInline):
     )
 
     def get_queryset(self, request):
-        if not request.user.has_perm("aklub.can_edit_all_units"):
+        if not get_unit_access(request).all_units:
             return Preference.objects.filter(
-                administrative_unit__in=request.user.administrated_units.all()
+                administrative_unit__in=get_unit_access(request).unit_ids
             )
         else:
             return super().get_queryset(request)
@@ -724,13 +754,10 @@ class ProfileEmailInline(admin.TabularInline):
             return ""
 
         filter_kwargs = {"email": obj.email}
-        if not self.form.request.user.has_perm("can_edit_all_units"):
-            filter_kwargs[
-                "company__administrative_units__in"
-            ] = self.form.request.user.administrated_units.all()
-            filter_kwargs[
-                "administrative_unit__in"
-            ] = self.form.request.user.administrated_units.all()
+        unit_access = get_unit_access(self.form.request)
+        if not unit_access.all_units:
+            filter_kwargs["company__administrative_units__in"] = unit_access.unit_ids
+            filter_kwargs["administrative_unit__in"] = unit_access.unit_ids
 
         contact = CompanyContact.objects.filter(**filter_kwargs)
         if contact.exists():
@@ -805,21 +832,23 @@ class ApiAccountAdmin(
         "api_id",
         "administrative_unit",
         "is_active",
+        "last_pledge_date",
+        "last_full_download",
     )
     readonly_fields = ("darujme_url",)
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "event":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
+            if not get_unit_access(request).all_units:
                 kwargs["queryset"] = Event.objects.filter(
-                    administrative_units__in=request.user.administrated_units.all()
+                    administrative_units__in=get_unit_access(request).unit_ids
                 )
             else:
                 kwargs["queryset"] = Event.objects.all()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
     def darujme_url(self, obj):
-        if self.request.user.has_perm("aklub.can_edit_all_units"):
+        if get_unit_access(self.request).all_units:
             is_correct = _boolean_icon(
                 "pledges" in requests.get(obj.darujme_url()).json()
             )
@@ -869,34 +898,41 @@ class ProfileAdminMixin:
     """ProfileAdmin mixin"""
 
     def get_search_results(self, request, queryset, search_term):
-        # overwrited django default method for admin search!
-        return annotation_friendly_search_results(self, request, queryset, search_term)
+        # profiles are searched in their search documents, ranked by relevance
+        return profile_search.search(queryset, search_term), False
+
+    def get_changelist(self, request, **kwargs):
+        return SearchRankChangeList
 
     def date_format(self, obj):
         return list(map(lambda o: o.strftime("%d. %m. %Y"), obj))
 
+    def get_donor_channels_prefetch(self, request):
+        """
+        Regular donor payment channels of the profiles visible to the user,
+        prefetched for all the donor columns of the page at once
+        """
+        channels = DonorPaymentChannel.objects.filter(
+            regular_payments="regular",
+        ).select_related("event", "money_account__administrative_unit")
+        if self.filtered_events:
+            channels = channels.filter(event_id__in=self.filtered_events)
+        unit_access = get_unit_access(request)
+        if not unit_access.all_units:
+            channels = channels.filter(
+                money_account__administrative_unit__in=unit_access.unit_ids,
+            )
+        return Prefetch("userchannels", queryset=channels, to_attr="donor_channels")
+
     def get_donor_details(self, obj, *args):
         """soft sort of donor payment channels"""
-        channels = obj.userchannels.all()
-        results = []
-        for channel in channels:
-            if channel.regular_payments == "regular":
-
-                if (
-                    self.filtered_events
-                    and str(channel.event.id) not in self.filtered_events
-                ):
-                    continue
-
-                if self.request.user.has_perm("aklub.can_edit_all_units"):
-                    results.append(channel)
-                # self.user_administrated_units is defined in queryset below
-                elif (
-                    channel.money_account.administrative_unit
-                    in self.user_administrated_units
-                ):
-                    results.append(channel)
-        return results
+        if not hasattr(obj, "donor_channels"):
+            # profile was not loaded by the changelist queryset
+            prefetch_related_objects(
+                [obj],
+                self.get_donor_channels_prefetch(self.request),
+            )
+        return obj.donor_channels
 
     def registered_support_date(self, obj):
         result = self.get_donor_details(obj)
@@ -948,22 +984,56 @@ class ProfileAdminMixin:
 
     donor_frequency.short_description = _("Donor frequency")
 
-    def total_payment(self, obj):
-        if self.request.user.has_perm("aklub.can_edit_all_units"):
-            administrative_units = obj.administrative_units.all()
-        else:
-            administrative_units = self.request.user.administrated_units.all()
-
-        results = []
-        for unit in administrative_units:
-            result = Payment.objects.filter(
-                user_donor_payment_channel__user=obj,
-                user_donor_payment_channel__money_account__administrative_unit=unit,
-            ).aggregate(Count("amount"), Sum("amount"))
-            results.append(
-                f"{unit}: {result['amount__sum']} Kč ({result['amount__count']})"
+    def attach_total_payments(self, profiles):
+        """Sum the payments of all the profiles by administrative units at once"""
+        unit_access = get_unit_access(self.request)
+        totals = {
+            (
+                row["user_donor_payment_channel__user"],
+                row["user_donor_payment_channel__money_account__administrative_unit"],
+            ): row
+            for row in Payment.objects.filter(
+                user_donor_payment_channel__user__in=[
+                    profile.pk for profile in profiles
+                ],
+            )
+            .order_by()
+            .values(
+                "user_donor_payment_channel__user",
+                "user_donor_payment_channel__money_account__administrative_unit",
+            )
+            .annotate(Count("amount"), Sum("amount"))
+        }
+        for profile in profiles:
+            units = (
+                profile.administrative_units.all()
+                if unit_access.all_units
+                else unit_access.administrated_units
             )
-        return ",\n".join(results)
+            profile.total_payments = [
+                (
+                    unit,
+                    totals.get(
+                        (profile.pk, unit.pk),
+                        {"amount__sum": None, "amount__count": 0},
+                    ),
+                )
+                for unit in units
+            ]
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        if "total_payment" in changelist.list_display:
+            self.attach_total_payments(list(changelist.result_list))
+        return changelist
+
+    def total_payment(self, obj):
+        if not hasattr(obj, "total_payments"):
+            self.attach_total_payments([obj])
+        return ",\n".join(
+            f"{unit}: {result['amount__sum']} Kč ({result['amount__count']})"
+            for unit, result in obj.total_payments
+        )
 
     total_payment.short_description = _("Total payment")
 
@@ -1111,15 +1181,16 @@ class ProfileAdmin(
         """admin form view to generate tax confirmations"""
         if request.method == "POST":
             data = request.POST
-            parameters = (
+            run = TaxConfirmationRun.start(
                 data.get("year"),
                 data.getlist("profile"),
-                data.get("pdf_type"),
+                PdfSandwichType.objects.get(id=data.get("pdf_type")),
+                created_by=request.user,
             )
-            tasks.generate_tax_confirmations.apply_async(args=parameters)
+            tasks.generate_tax_confirmations.apply_async(args=(run.id,))
             messages.info(request, _("TaxConfirmations created"))
             return HttpResponseRedirect(
-                reverse("admin:aklub_taxconfirmation_changelist")
+                reverse("admin:aklub_taxconfirmationrun_change", args=(run.id,))
             )
         else:
             from django.shortcuts import render
@@ -1142,9 +1213,7 @@ class ProfileAdmin(
                     _("You can not remove administrative unit from your own profile"),
                 )
             else:
-                profile.administrative_units.remove(
-                    request.user.administrated_units.first()
-                )
+                profile.administrative_units.remove(get_unit_access(request).first_unit)
                 messages.info(
                     request,
                     _(
@@ -1161,7 +1230,7 @@ class ProfileAdmin(
         else:
             profile = Profile.objects.get(pk=pk)
             if (
-                request.user.administrated_units.first()
+                get_unit_access(request).first_unit
                 not in profile.administrative_units.all()
             ):
                 messages.warning(
@@ -1336,6 +1405,7 @@ class DonorPaymentChannelResource(ModelResource):
 # -- ADMIN FORMS --
 class DonorPaymetChannelAdmin(
     unit_admin_mixin_generator("user__administrative_units"),
+    FastChangeListAdminMixin,
     ImportExportMixin,
     AdminAdvancedFiltersMixin,
     RelatedFieldAdmin,
@@ -1395,6 +1465,7 @@ class DonorPaymetChannelAdmin(
     actions = (
         send_mass_communication_action,
         show_payments_by_year,
+        download_payments_by_year,
     )
     resource_class = DonorPaymentChannelResource
     save_as = True
@@ -1528,10 +1599,10 @@ payment_pair_action.short_description = _(
 
 
 def payment_request_pair_action(self, request, queryset):
-    if request.user.administrated_units.count() == 1:
+    if len(get_unit_access(request).unit_ids) == 1:
         # Create imagine AccountStatement to use payment_pair method with user's administrated_units
         statement = AccountStatements()
-        statement.administrative_unit = request.user.administrated_units.first()
+        statement.administrative_unit = get_unit_access(request).first_unit
         for payment in queryset:
             statement.payment_pair(payment)
         messages.info(
@@ -1610,6 +1681,7 @@ class PaymentResource(ModelResource):
 
 
 class PaymentAdmin(
+    FastChangeListAdminMixin,
     ImportExportMixin,
     RelatedFieldAdmin,
 ):
@@ -1780,8 +1852,9 @@ class PaymentAdmin(
             )
         )
 
-        if not request.user.has_perm("aklub.can_edit_all_units"):
-            administrated_unit = request.user.administrated_units.first()
+        unit_access = get_unit_access(request)
+        if not unit_access.all_units:
+            administrated_unit = unit_access.first_unit
             qs = qs.filter(
                 Q(recipient_account__administrative_unit=administrated_unit)
                 | Q(
@@ -1793,9 +1866,9 @@ class PaymentAdmin(
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "recipient_account":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
+            if not get_unit_access(request).all_units:
                 kwargs["queryset"] = MoneyAccount.objects.filter(
-                    administrative_unit=request.user.administrated_units.first()
+                    administrative_unit=get_unit_access(request).first_unit
                 )
             else:
                 kwargs["queryset"] = MoneyAccount.objects.all()
@@ -1963,9 +2036,9 @@ class MassCommunicationAdmin(
     def formfield_for_manytomany(self, db_field, request, **kwargs):
         if db_field.name == "send_to_users":
             # lets make it a little easier for superadmin (if he has administrated_units)
-            if not request.user.has_perm("aklub.can_edit_all_units"):
+            if not get_unit_access(request).all_units:
                 users_ids = Preference.objects.filter(
-                    administrative_unit=request.user.administrated_units.first(),
+                    administrative_unit=get_unit_access(request).first_unit,
                     send_mailing_lists=True,
                 ).values_list("user__id", flat=True)
 
@@ -2081,22 +2154,67 @@ class TaxConfirmationAdmin(
     ),
     admin.ModelAdmin,
 ):
+    def get_pdfs(self, queryset):
+        return (
+            TaxConfirmationPdf.objects.filter(obj__in=queryset.values("pk"))
+            .exclude(pdf="")
+            .order_by("obj__year", "obj_id")
+        )
+
     def batch_download(self, request, queryset):
-        links = []
-        for q in queryset:
-            file_field = q.taxconfirmationpdf_set.get().pdf
-            if file_field:
-                links.append(file_field.url)
+        storage = TaxConfirmationPdf._meta.get_field("pdf").storage
+        links = [
+            storage.url(pdf)
+            for pdf in self.get_pdfs(queryset).values_list("pdf", flat=True)
+        ]
         return HttpResponse("\n".join(links), content_type="text/plain")
 
     batch_download.short_description = _("generate download links for pdf files")
 
+    def download_pdfs_zip(self, request, queryset):
+        pdfs = [
+            (f"{year}/tax_confirmation_{year}_{profile_id}_{obj_id}.pdf", pdf)
+            for year, profile_id, obj_id, pdf in self.get_pdfs(queryset).values_list(
+                "obj__year",
+                "obj__user_profile_id",
+                "obj_id",
+                "pdf",
+            )
+        ]
+        response = StreamingHttpResponse(
+            tax_confirmations.iter_pdfs_zip(pdfs),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = 'attachment; filename="tax_confirmations.zip"'
+        return response
+
+    download_pdfs_zip.short_description = _("download pdf files as ZIP archive")
+
+    def make_missing_pdfs(self, request, queryset):
+        tasks.make_missing_tax_confirmation_pdfs.delay(
+            list(queryset.values_list("pk", flat=True)),
+        )
+        messages.info(request, _("Missing PDF files will be created"))
+
+    make_missing_pdfs.short_description = _("Create missing PDF files")
+
+    def make_pdfs(self, request, queryset):
+        confirmations_ids = list(queryset.values_list("pk", flat=True))
+        TaxConfirmation.objects.filter(id__in=confirmations_ids).update(
+            pdf_rendered=False,
+        )
+        tasks.make_missing_tax_confirmation_pdfs.delay(confirmations_ids)
+        messages.info(request, _("PDF files will be created again"))
+
+    make_pdfs.short_description = _("Create PDF files again")
+
     list_display = (
         "get_name",
         "get_email",
         "year",
         "amount",
         "get_pdf",
+        "pdf_rendered",
         "get_administrative_unit",
         "pdf_type",
     )
@@ -2108,6 +2226,7 @@ class TaxConfirmationAdmin(
     list_filter = [
         "year",
         "pdf_type",
+        "pdf_rendered",
         "pdf_type__pdfsandwichtypeconnector__administrative_unit",
         "pdf_type__pdfsandwichtypeconnector__profile_type",
         filters.ProfileHasEmail,
@@ -2122,15 +2241,21 @@ class TaxConfirmationAdmin(
         "user_profile__userchannels__VS",
     )
     raw_id_fields = ("user_profile",)
-    actions = (make_pdfsandwich, batch_download)
+    actions = (make_pdfs, make_missing_pdfs, batch_download, download_pdfs_zip)
     list_max_show_all = 10000
     list_select_related = (
         "user_profile__userprofile",
         "user_profile__companyprofile",
     )
 
-    readonly_fields = ["get_pdf", "get_email", "pdf_type", "get_administrative_unit"]
-    fields = ["user_profile", "year", "amount", "get_pdf", "pdf_type"]
+    readonly_fields = [
+        "get_pdf",
+        "get_email",
+        "pdf_type",
+        "get_administrative_unit",
+        "pdf_rendered",
+    ]
+    fields = ["user_profile", "year", "amount", "get_pdf", "pdf_rendered", "pdf_type"]
 
     def get_queryset(self, request):
         """
@@ -2201,6 +2326,101 @@ class TaxConfirmationAdmin(
     get_name.short_description = _("Name")
 
 
+class TaxConfirmationRunAdmin(
+    unit_admin_mixin_generator("administrative_unit"),
+    admin.ModelAdmin,
+):
+    def resume_failed(self, request, queryset):
+        for run in queryset:
+            tasks.resume_tax_confirmation_run.delay(run.id)
+        messages.info(request, _("Failed profiles will be processed again"))
+
+    resume_failed.short_description = _("Resume failed profiles only")
+
+    list_display = (
+        "__str__",
+        "year",
+        "pdf_type",
+        "administrative_unit",
+        "created_by",
+        "created",
+        "finished",
+        "get_progress",
+    )
+    list_filter = ("year", "pdf_type")
+    actions = (resume_failed,)
+    readonly_fields = (
+        "year",
+        "pdf_type",
+        "administrative_unit",
+        "created_by",
+        "created",
+        "finished",
+        "get_progress",
+        "get_run_profiles",
+    )
+    fields = readonly_fields
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .select_related(
+                "pdf_type",
+                "administrative_unit",
+                "created_by",
+            )
+            .annotate(
+                **{
+                    f"{status}_count": Count(
+                        "run_profiles",
+                        filter=Q(run_profiles__status=status),
+                    )
+                    for status, name in TaxConfirmationRunProfile.STATUS_CHOICES
+                }
+            )
+        )
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_progress(self, obj):
+        return ", ".join(
+            f"{name}: {getattr(obj, f'{status}_count')}"
+            for status, name in TaxConfirmationRunProfile.STATUS_CHOICES
+        )
+
+    get_progress.short_description = _("Progress")
+
+    def get_run_profiles(self, obj):
+        url = reverse("admin:aklub_taxconfirmationrunprofile_changelist")
+        return format_html(
+            "<a href='{}?run__id__exact={}'>{}</a>", url, obj.id, _("Profiles")
+        )
+
+    get_run_profiles.short_description = _("Profiles")
+
+
+class TaxConfirmationRunProfileAdmin(
+    unit_admin_mixin_generator("run__administrative_unit"),
+    admin.ModelAdmin,
+):
+    list_display = (
+        "profile",
+        "run",
+        "status",
+        "tax_confirmation",
+        "error",
+    )
+    list_filter = ("status",)
+    list_select_related = ("profile", "run__administrative_unit", "tax_confirmation")
+    raw_id_fields = ("profile", "tax_confirmation")
+    readonly_fields = ("run", "profile", "tax_confirmation", "status", "error")
+
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(TaxConfirmationPdf)
 class TaxConfirmationPdfAdmin(PdfSandwichAdmin):
     pass
@@ -2282,6 +2502,7 @@ sync_with_daktela.short_description = _("Sync profiles with Daktela app contacts
 class UserProfileAdmin(
     child_redirect_mixin("userprofile"),
     filters.AdministrativeUnitAdminMixin,
+    FastChangeListAdminMixin,
     ImportExportMixin,
     RelatedFieldAdmin,
     AdminAdvancedFiltersMixin,
@@ -2668,22 +2889,17 @@ class UserProfileAdmin(
         return super().add_view(request)
 
     def get_queryset(self, request, *args, **kwargs):
-        # save request user's adminsitratived_unit here, so we dont have to peek in every loop
-        self.user_administrated_units = request.user.administrated_units.all()
-
         donor_filter = edit_donor_annotate_filter(self, request)
 
         filter_kwargs = {}
-        extra_related = []
         filter_kwargs = check_annotate_filters(
             self.list_display, request, filter_kwargs
         )
         # annotate_kwargs = check_annotate_subqueries(self, request)
-        if not request.user.has_perm("aklub.can_edit_all_units"):
+        if not get_unit_access(request).all_units:
             donor_filter[
                 "userchannels__money_account__administrative_unit__in"
-            ] = self.user_administrated_units
-            extra_related.append("userchannels__money_account__administrative_unit")
+            ] = get_unit_access(request).unit_ids
 
         queryset = (
             super()
@@ -2692,9 +2908,8 @@ class UserProfileAdmin(
                 "telephone_set",
                 "profileemail_set",
                 "administrative_units",
-                "userchannels__event",
                 "interaction_set",
-                *extra_related,
+                self.get_donor_channels_prefetch(request),
             )
             .annotate(
                 sum_amount=Sum(
@@ -2742,10 +2957,9 @@ class CompanyContactInline(admin.TabularInline):
             return ""
 
         filter_kwargs = {"email": obj.email}
-        if not self.form.request.user.has_perm("can_edit_all_units"):
-            filter_kwargs[
-                "user__administrative_units__in"
-            ] = self.form.request.user.administrated_units.all()
+        unit_access = get_unit_access(self.form.request)
+        if not unit_access.all_units:
+            filter_kwargs["user__administrative_units__in"] = unit_access.unit_ids
         email = ProfileEmail.objects.filter(**filter_kwargs)
         if email.exists():
             email = email.first()
@@ -2759,9 +2973,9 @@ class CompanyContactInline(admin.TabularInline):
     is_email_in_userprofile.short_description = _("Is email in userprofile")
 
     def get_queryset(self, request):
-        if not request.user.has_perm("aklub.can_edit_all_units"):
+        if not get_unit_access(request).all_units:
             queryset = CompanyContact.objects.filter(
-                administrative_unit__in=request.user.administrated_units.all()
+                administrative_unit__in=get_unit_access(request).unit_ids
             )
         else:
             queryset = super().get_queryset(request)
@@ -2769,8 +2983,8 @@ class CompanyContactInline(admin.TabularInline):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "administrative_unit":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
-                kwargs["queryset"] = request.user.administrated_units.all()
+            if not get_unit_access(request).all_units:
+                kwargs["queryset"] = get_unit_access(request).units
             else:
                 kwargs["queryset"] = AdministrativeUnit.objects.all()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -2969,13 +3183,13 @@ class CompanyProfileAdmin(
     )
 
     def get_company_email(self, obj):
-        if self.request.user.has_perm("aklub.can_edit_all_units"):
+        if get_unit_access(self.request).all_units:
             emails = obj.get_email()
         else:
             com = [
                 c
                 for c in obj.companycontact_set.all()
-                if c.administrative_unit_id in self.user_administrated_units_ids
+                if c.administrative_unit_id in get_unit_access(self.request).unit_ids
             ]
             emails = obj.get_email(com)
         # if in edit form add anchor to inlines
@@ -2993,26 +3207,26 @@ class CompanyProfileAdmin(
 
     def get_company_telephone(self, obj):
 
-        if self.request.user.has_perm("aklub.can_edit_all_units"):
+        if get_unit_access(self.request).all_units:
             return obj.get_main_telephone()
         else:
             com = [
                 c
                 for c in obj.companycontact_set.all()
-                if c.administrative_unit_id in self.user_administrated_units_ids
+                if c.administrative_unit_id in get_unit_access(self.request).unit_ids
             ]
             return obj.get_main_telephone(com)
 
     get_company_telephone.short_description = _("Main telephone")
 
     def get_contact_name(self, obj):
-        if self.request.user.has_perm("aklub.can_edit_all_units"):
+        if get_unit_access(self.request).all_units:
             return obj.get_main_contact_name()
         else:
             com = [
                 c
                 for c in obj.companycontact_set.all()
-                if c.administrative_unit_id in self.user_administrated_units_ids
+                if c.administrative_unit_id in get_unit_access(self.request).unit_ids
             ]
             return obj.get_main_contact_name(com)
 
@@ -3073,25 +3287,17 @@ class CompanyProfileAdmin(
         return super().add_view(request)
 
     def get_queryset(self, request, *args, **kwargs):
-        # save request user's adminsitratived_unit here, so we dont have to peek in every loop
-        self.user_administrated_units = request.user.administrated_units.all()
-        self.user_administrated_units_ids = (
-            request.user.administrated_units.all().values_list("id", flat=True)
-        )
-
         donor_filter = edit_donor_annotate_filter(self, request)
 
         filter_kwargs = {}
-        extra_related = []
         filter_kwargs = check_annotate_filters(
             self.list_display, request, filter_kwargs
         )
         # annotate_kwargs = check_annotate_subqueries(self, request)
-        if not request.user.has_perm("aklub.can_edit_all_units"):
+        if not get_unit_access(request).all_units:
             donor_filter[
                 "userchannels__money_account__administrative_unit__in"
-            ] = self.user_administrated_units
-            extra_related.append("userchannels__money_account__administrative_unit")
+            ] = get_unit_access(request).unit_ids
 
         queryset = (
             super()
@@ -3099,8 +3305,7 @@ class CompanyProfileAdmin(
             .prefetch_related(
                 "companycontact_set",
                 "administrative_units",
-                "userchannels__event",
-                *extra_related,
+                self.get_donor_channels_prefetch(request),
             )
             .annotate(
                 sum_amount=Sum(
@@ -3128,6 +3333,8 @@ admin.site.register(AutomaticCommunication, AutomaticCommunicationAdmin)
 admin.site.register(MassCommunication, MassCommunicationAdmin)
 admin.site.register(Recruiter, RecruiterAdmin)
 admin.site.register(TaxConfirmation, TaxConfirmationAdmin)
+admin.site.register(TaxConfirmationRun, TaxConfirmationRunAdmin)
+admin.site.register(TaxConfirmationRunProfile, TaxConfirmationRunProfileAdmin)
 admin.site.register(Source, SourceAdmin)
 admin.site.register(Profile, ProfileAdmin)
 # register all adminactions
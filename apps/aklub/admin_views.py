@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+""" Changelists with estimated counts and keyset pagination """
+import functools
+import json
+import operator
+
+from django.conf import settings
+from django.contrib.admin.utils import NotRelationField, get_fields_from_path
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+EXACT_COUNT_VAR = "exact_count"
+AFTER_VAR = "after"
+
+
+def estimate_count(queryset):
+    """Number of rows of the queryset estimated by the PostgreSQL planner"""
+    try:
+        sql, params = queryset.order_by().query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return 0
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+def keyset_filter(keyset, values):
+    """
+    Rows following the row with the values in the keyset ordering,
+    NULLs are last in ascending and first in descending order
+    """
+    conditions = []
+    same = Q()
+    for path, descending, nullable in keyset:
+        value = values[path]
+        if value is None:
+            following = Q(**{f"{path}__isnull": False}) if descending else None
+            equal = Q(**{f"{path}__isnull": True})
+        else:
+            following = Q(**{f"{path}__{'lt' if descending else 'gt'}": value})
+            if nullable and not descending:
+                following |= Q(**{f"{path}__isnull": True})
+            equal = Q(**{path: value})
+        if following is not None:
+            conditions.append(same & following)
+        same &= equal
+    return functools.reduce(operator.or_, conditions, Q(pk__in=[]))
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using the planner estimate for big counts, unless exact count is requested"""
+
+    def __init__(self, *args, exact_count=False, **kwargs):
+        self.exact_count = exact_count
+        self.count_estimated = False
+        super().__init__(*args, **kwargs)
+
+    @cached_property
+    def count(self):
+        if not self.exact_count:
+            estimate = estimate_count(self.object_list)
+            if estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+                self.count_estimated = True
+                return estimate
+        return super().count
+
+
+class SearchRankChangeList(ChangeList):
+    """Search results annotated with search_rank are ordered by relevance first"""
+
+    def get_ordering(self, request, queryset):
+        ordering = super().get_ordering(request, queryset)
+        if ORDER_VAR not in self.params and "search_rank" in queryset.query.annotations:
+            return ["-search_rank", *ordering]
+        return ordering
+
+
+class FastChangeList(SearchRankChangeList):
+    """
+    Pages of the default ordering are selected by the last row
+    of the previous page, so deep pages are as fast as the first one
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(EXACT_COUNT_VAR, None)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_keyset(self):
+        """Fields of the default ordering up to the primary key or None"""
+        if ORDER_VAR in self.params:
+            return None
+        keyset = []
+        for ordering in self.queryset.query.order_by:
+            if not isinstance(ordering, str) or ordering == "?":
+                return None
+            path = ordering.lstrip("-")
+            if path == "pk":
+                path = self.model._meta.pk.name
+            try:
+                fields = get_fields_from_path(self.model, path)
+            except (FieldDoesNotExist, NotRelationField):
+                return None
+            nullable = any(getattr(field, "null", True) for field in fields)
+            keyset.append((path, ordering.startswith("-"), nullable))
+            if fields[-1] == self.model._meta.pk:
+                return keyset
+        return None
+
+    def get_results(self, request):
+        super().get_results(request)
+        after = self.params.pop(AFTER_VAR, None)
+        self.result_count_estimated = self.paginator.count_estimated
+        self.exact_count_url = self.get_query_string({EXACT_COUNT_VAR: 1})
+        self.keyset_pagination = False
+        if not self.multi_page or (self.show_all and self.can_show_all):
+            return
+        keyset = self.get_keyset()
+        if keyset is None:
+            return
+        self.keyset_pagination = True
+        self.first_page_url = None
+        if after:
+            values = (
+                self.model._default_manager.filter(pk=after)
+                .values(*(path for path, descending, nullable in keyset))
+                .first()
+            )
+            if values is not None:
+                self.first_page_url = self.get_query_string()
+                self.result_list = self.queryset.filter(
+                    keyset_filter(keyset, values),
+                )[: self.list_per_page]
+        results = list(self.result_list)
+        self.next_page_url = None
+        if len(results) == self.list_per_page:
+            self.next_page_url = self.get_query_string({AFTER_VAR: results[-1].pk})
+
+
+class FastChangeListAdminMixin:
+    """Estimated counts and keyset pagination for changelists of big tables"""
+
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_changelist(self, request, **kwargs):
+        return FastChangeList
+
+    def get_paginator(
+        self, request, queryset, per_page, orphans=0, allow_empty_first_page=True
+    ):
+        return self.paginator(
+            queryset,
+            per_page,
+            orphans,
+            allow_empty_first_page,
+            exact_count=EXACT_COUNT_VAR in request.GET,
+        )
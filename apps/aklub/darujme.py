@@ -1,76 +1,245 @@
 # -*- coding: utf-8 -*-
 """ Parse reports from Darujme.cz """
 import datetime
+import itertools
 import logging
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from aklub.models import (
     AccountStatements,
     ApiAccount,
+    DarujmePledge,
     DonorPaymentChannel,
+    OutdatedStatisticsMonth,
     Payment,
+    Profile,
     ProfileEmail,
     Telephone,
     UserProfile,
 )
+from aklub.utils import (
+    invalidate_campaign_statistics,
+    invalidate_paid_section,
+    normalize_telephone,
+)
 from aklub.views import get_unique_username
 
+from computedfields.models import update_dependent
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models import Min
+from django.db.transaction import atomic
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
+import ijson
+
 import requests
 
 logger = logging.getLogger(__name__)
 
+PAID_TRANSACTION_STATES = (
+    "success",
+    "sent_to_organization",
+    "success_money_on_account",
+)
 
-def create_statement(response, api_account):
-    payments = parse_darujme_json(response, api_account)
-    if len(payments) > 0:
-        a = AccountStatements(
-            type="darujme", administrative_unit=api_account.administrative_unit
-        )
-        a.payments = payments
-        a.save()
-    else:
-        a = None
+
+def create_statement(pledges_file, api_account):
+    a = None
+    for payments in parse_darujme_json(pledges_file, api_account):
+        if not payments:
+            continue
+        if a is None:
+            a = AccountStatements(
+                type="darujme", administrative_unit=api_account.administrative_unit
+            )
+            a.save(parse_csv=False)
+        for payment in payments:
+            payment.account_statement = a
+        save_payments(payments)
     return a
 
 
-def create_statement_from_API(api_account):
-    url = api_account.darujme_url()
-    response = requests.get(url)
-    if response.status_code == 200:
-        try:
-            return create_statement(response, api_account)
-        except Exception as e:  # noqa
-            logger.error(f"Error while parsing url: {url} error: {e}")
-            raise e
-    else:
-        logger.error(f"{url} error status not 200: {response.status_code}")
+def get_session():
+    session = requests.Session()
+    session.mount(
+        "https://",
+        requests.adapters.HTTPAdapter(
+            pool_maxsize=settings.DARUJME_DOWNLOAD_WORKERS,
+        ),
+    )
+    return session
+
+
+def get_download_url(api_account, full_download):
+    """
+    url of new pledges from the api_account last pledge date,
+    or all of them if full_download
+
+    the pledges-by-filter api filters only by the pledge date,
+    so there is no transaction date watermark
+    """
+    if full_download:
+        return api_account.darujme_url()
+    return api_account.darujme_url(
+        from_pledged_date=api_account.incremental_download_date(),
+    )
+
+
+def download_pledges(url, session):
+    """
+    download pledges into temporary file
+
+    doesn't touch the database, so it can run in a thread
+    """
+    response = session.get(url, stream=True, timeout=settings.DARUJME_API_TIMEOUT)
+    try:
+        if response.status_code != 200:
+            logger.error(f"{url} error status not 200: {response.status_code}")
+            return
+        # big responses are rolled over to disk
+        pledges_file = tempfile.SpooledTemporaryFile(
+            max_size=settings.DARUJME_SPOOL_MAX_SIZE,
+        )
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, pledges_file)
+        pledges_file.seek(0)
+        return pledges_file
+    finally:
+        response.close()
+
+
+def download_concurrently(urls):
+    """
+    download {api_account: url} concurrently and yield
+    (api_account, pledges_file) as the downloads finish,
+    pledges_file is None if the download failed
+    """
+    with get_session() as session, ThreadPoolExecutor(
+        max_workers=settings.DARUJME_DOWNLOAD_WORKERS,
+    ) as executor:
+        futures = {
+            executor.submit(download_pledges, url, session): api_account
+            for api_account, url in urls.items()
+        }
+        for future in as_completed(futures):
+            api_account = futures[future]
+            # failing account doesn't stop the others
+            try:
+                pledges_file = future.result()
+            except Exception:  # noqa
+                logger.exception(f"Darujme download of {api_account} failed")
+                pledges_file = None
+            yield api_account, pledges_file
+
+
+def import_pledges(pledges_file, api_account, full_download):
+    try:
+        statement = create_statement(pledges_file, api_account)
+    except Exception as e:  # noqa
+        logger.error(f"Error while parsing pledges of {api_account} error: {e}")
+        raise e
+    finally:
+        pledges_file.close()
+    update_fields = ["last_pledge_date"]
+    if full_download:
+        api_account.last_full_download = timezone.now()
+        update_fields.append("last_full_download")
+    api_account.save(update_fields=update_fields)
+    return statement
+
+
+def create_statement_from_API(api_account, full_download=None):
+    """
+    download and import new pledges, all of them if full_download
+    (by default periodically)
+    """
+    if full_download is None:
+        full_download = api_account.needs_full_download()
+    with get_session() as session:
+        pledges_file = download_pledges(
+            get_download_url(api_account, full_download),
+            session,
+        )
+    if pledges_file is None:
         return
+    return import_pledges(pledges_file, api_account, full_download)
+
+
+def get_known_data(pledges, api_account):
+    """
+    Load everything the import needs to know about already stored data
+    for the given pledges at once, instead of querying it per pledge
+    """
+    emails = {
+        pledge["donor"]["email"].lower()
+        for pledge in pledges
+        if pledge["donor"]["email"]
+    }
+    profile_emails = {
+        profile_email.email: profile_email
+        for profile_email in ProfileEmail.objects.filter(
+            email__in=emails
+        ).select_related("user")
+    }
+    users_ids = [
+        profile_email.user_id
+        for profile_email in profile_emails.values()
+        if profile_email.user_id
+    ]
+    return {
+        "transactions": set(
+            Payment.objects.filter(
+                type="darujme",
+                SS__in=[str(pledge["pledgeId"]) for pledge in pledges],
+            ).values_list("SS", "operation_id")
+        ),
+        "emails": profile_emails,
+        "units": set(
+            Profile.administrative_units.through.objects.filter(
+                profile_id__in=users_ids,
+            ).values_list("profile_id", "administrativeunit_id")
+        ),
+        "telephones": set(
+            Telephone.objects.filter(user_id__in=users_ids).values_list(
+                "user_id", "normalized_telephone"
+            )
+        ),
+        "channels": {
+            dpch.user_id: dpch
+            for dpch in DonorPaymentChannel.objects.filter(
+                user_id__in=users_ids,
+                event=api_account.event,
+            )
+        },
+    }
 
 
-def create_payments(pledge, api_account):
+def create_payments(pledge, api_account, known):
+    """
+    return unsaved payments, they are inserted at once by save_payments()
+    """
     is_donor = False  # check if user has any succeful payment
     new_payments = []
     for transaction in pledge["transactions"]:
+        transaction_key = (str(pledge["pledgeId"]), str(transaction["transactionId"]))
         # proces only payments which are sent and doesnt exist
         if transaction["state"] != "sent_to_organization":
             logger.info(
                 f"skipping payment id:{transaction['transactionId']} for {pledge['donor']['email']}  => not sent "
             )
-        elif Payment.objects.filter(
-            type="darujme",
-            SS=pledge["pledgeId"],
-            operation_id=transaction["transactionId"],
-        ).exists():
+        elif transaction_key in known["transactions"]:
             logger.info(
                 f"skipping payment id:{transaction['transactionId']} for {pledge['donor']['email']}  => exists "
             )
             is_donor = True
             continue
         else:
-            payment = Payment.objects.create(
+            payment = Payment(
                 type="darujme",
                 SS=pledge["pledgeId"],
                 date=parse_datetime(transaction["receivedAt"]).date(),
@@ -81,69 +250,98 @@ def create_payments(pledge, api_account):
                 recipient_account=api_account,
                 custom_fields=pledge["customFields"],
             )
+            known["transactions"].add(transaction_key)
 
             new_payments.append(payment)
             is_donor = True
     return is_donor, new_payments
 
 
-def create_donor_profile(pledge, api_account):  # noqa
+def save_payments(payments):
     """
-    update or create new UserProfile and DonorPaymentChannel
+    insert new payments with one query and recompute
+    the donor payment channels computed fields
     """
-    email, email_created = ProfileEmail.objects.get_or_create(
-        email=pledge["donor"]["email"].lower(),
-        defaults={"is_primary": True},
+    payments = Payment.objects.bulk_create(payments)
+    update_dependent(
+        Payment.objects.filter(id__in=[payment.id for payment in payments])
+    )
+    # bulk_create doesn't send post_save signal
+    channels = list(
+        DonorPaymentChannel.objects.filter(
+            id__in={payment.user_donor_payment_channel_id for payment in payments},
+        ).values_list("user_id", "event_id")
     )
+    invalidate_paid_section({user_id for user_id, event_id in channels})
+    invalidate_campaign_statistics({event_id for user_id, event_id in channels})
+    OutdatedStatisticsMonth.mark(
+        OutdatedStatisticsMonth.PAYMENTS,
+        [payment.date for payment in payments],
+    )
+    return payments
 
-    if settings.DARUJME_EMAIL_AS_USERNAME:
-        username = email.email
-    else:
-        username = get_unique_username(email.email)
 
-    try:
-        user = UserProfile.objects.get(profileemail__email=email.email)
-    except UserProfile.DoesNotExist:
+def create_donor_profile(pledge, api_account, known):  # noqa
+    """
+    update or create new UserProfile and DonorPaymentChannel
+    """
+    email_address = pledge["donor"]["email"].lower()
+    email = known["emails"].get(email_address)
+    email_created = email is None
+    if email_created:
+        email = ProfileEmail(email=email_address, is_primary=True)
+
+    if email.user_id:
+        user = email.user
+    else:
         user = UserProfile()
         user.country = ""  # replace default value
     # update only if empty! maybe better handle?
-    user.first_name = (
-        pledge["donor"]["firstName"] if not user.first_name else user.first_name
-    )
-    user.last_name = (
-        pledge["donor"]["lastName"] if not user.last_name else user.last_name
-    )
-    user.username = username if not user.username else user.username
-    user.street = (
-        pledge["donor"]["address"]["street"] if not user.street else user.street
-    )
-    user.city = pledge["donor"]["address"]["city"] if not user.city else user.city
-    user.zip_code = (
-        pledge["donor"]["address"]["postCode"] if not user.zip_code else user.zip_code
-    )
-    user.country = (
-        pledge["donor"]["address"]["country"] if not user.country else user.country
-    )
-    user.save()
+    profile_values = {
+        "first_name": pledge["donor"]["firstName"],
+        "last_name": pledge["donor"]["lastName"],
+        "street": pledge["donor"]["address"]["street"],
+        "city": pledge["donor"]["address"]["city"],
+        "zip_code": pledge["donor"]["address"]["postCode"],
+        "country": pledge["donor"]["address"]["country"],
+    }
+    user_changed = user.pk is None
+    for field, value in profile_values.items():
+        if not getattr(user, field) and value:
+            setattr(user, field, value)
+            user_changed = True
+    if not user.username:
+        if settings.DARUJME_EMAIL_AS_USERNAME:
+            user.username = email.email
+        else:
+            user.username = get_unique_username(email.email)
+        user_changed = True
+    if user_changed:
+        user.save()
 
-    email.user = user
-    email.save()
+    if email.user_id != user.pk:
+        email.user = user
+        email.save()
+        known["emails"][email.email] = email
     if email_created:
         logger.info(f"New User created email {email.email}")
     else:
         logger.info(f"Duplicate email {email.email}")
-    user.administrative_units.add(api_account.administrative_unit)
+    if (user.pk, api_account.administrative_unit_id) not in known["units"]:
+        user.administrative_units.add(api_account.administrative_unit)
+        known["units"].add((user.pk, api_account.administrative_unit_id))
 
     if pledge["donor"]["phone"]:
         tel_number = str(pledge["donor"]["phone"]).replace(" ", "")
         try:
-            if not Telephone.objects.filter(telephone=tel_number, user=user).exists():
+            if (user.pk, normalize_telephone(tel_number)) not in known["telephones"]:
                 new_telephone = Telephone(
                     telephone=tel_number,
                     user=user,
                 )
                 new_telephone.full_clean()  # check phone number validations
                 new_telephone.save()
+                known["telephones"].add((user.pk, new_telephone.normalized_telephone))
             else:
                 logger.info(
                     f"Duplicate telephone {tel_number} for email: {email.email}"
@@ -154,27 +352,35 @@ def create_donor_profile(pledge, api_account):  # noqa
             )
 
     end_of_regular_payments = pledge.get("lastTransactionExpectedOn", None)
-    dpch, dpch_created = DonorPaymentChannel.objects.update_or_create(
-        user=user,
-        event=api_account.event,
-        defaults={
-            "regular_frequency": "monthly" if pledge["isRecurrent"] else None,
-            "regular_payments": "regular" if pledge["isRecurrent"] else "onetime",
-            "regular_amount": pledge["pledgedAmount"]["cents"] / 100,  # in cents
-            "expected_date_of_first_payment": parse_datetime(
-                pledge["pledgedAt"]
-            ).date(),
-            "end_of_regular_payments": parse_datetime(end_of_regular_payments).date()
-            if end_of_regular_payments
-            else None,
-            "money_account": api_account,
-        },
-    )
+    dpch_values = {
+        "regular_frequency": "monthly" if pledge["isRecurrent"] else None,
+        "regular_payments": "regular" if pledge["isRecurrent"] else "onetime",
+        "regular_amount": pledge["pledgedAmount"]["cents"] / 100,  # in cents
+        "expected_date_of_first_payment": parse_datetime(pledge["pledgedAt"]).date(),
+        "end_of_regular_payments": parse_datetime(end_of_regular_payments).date()
+        if end_of_regular_payments
+        else None,
+        "money_account_id": api_account.pk,
+    }
+    dpch = known["channels"].get(user.pk)
+    dpch_created = dpch is None
     if dpch_created:
+        dpch = DonorPaymentChannel(
+            user=user,
+            event=api_account.event,
+            **dpch_values,
+        )
+        dpch.save()
+        known["channels"][user.pk] = dpch
         logger.info(
             f"DonorPaymentChannel for user with email: {pledge['donor']['email']} created"
         )
     else:
+        # save only changed channels
+        if any(getattr(dpch, field) != value for field, value in dpch_values.items()):
+            for field, value in dpch_values.items():
+                setattr(dpch, field, value)
+            dpch.save()
         logger.info(
             f"DonorPaymentChannel for user with email: {pledge['donor']['email']} exists => updating"
         )
@@ -182,7 +388,7 @@ def create_donor_profile(pledge, api_account):  # noqa
 
 
 def pair_payments(dpch, user_payments):
-    payment_ids = [payment.id for payment in user_payments]
+    payment_ids = [payment.operation_id for payment in user_payments]
     logger.info(
         "Pairing payments {payments} with donor channel {dpch}".format(
             payments=payment_ids, dpch=dpch
@@ -192,29 +398,176 @@ def pair_payments(dpch, user_payments):
         payment.user_donor_payment_channel_id = dpch.id
 
 
-def parse_darujme_json(response, api_account):
+def update_last_pledge_date(pledge, api_account):
+    """
+    move the api_account watermark, it is saved after successful import
+    """
+    pledged_date = parse_datetime(pledge["pledgedAt"]).date()
+    if api_account.last_pledge_date is None or (
+        pledged_date > api_account.last_pledge_date
+    ):
+        api_account.last_pledge_date = pledged_date
+
+
+def iter_pledges(pledges_file):
+    """
+    parse pledges from the downloaded file one by one,
+    numbers are parsed to the same types as json.load does
+    """
+    return ijson.items(pledges_file, "pledges.item", use_float=True)
+
+
+def iter_batches(items, size):
+    items = iter(items)
+    batch = list(itertools.islice(items, size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(items, size))
+
+
+def parse_darujme_json(pledges_file, api_account):
+    """
+    yield new unsaved payments paired with donor payment channels
+    for every batch of pledges
+    """
     logger.info("Darujme.cz import started at %s" % datetime.datetime.now())
-    new_payments = []
-    for pledge in response.json()["pledges"]:
-        # skip payments where is unknows email
-        if not pledge["donor"]["email"]:
-            continue
-        else:
-            is_donor, user_payments = create_payments(pledge, api_account)
+    for pledges in iter_batches(
+        iter_pledges(pledges_file), settings.DARUJME_IMPORT_BATCH_SIZE
+    ):
+        new_payments = []
+        known = get_known_data(pledges, api_account)
+        for pledge in pledges:
+            update_last_pledge_date(pledge, api_account)
+            # skip payments where is unknows email
+            if not pledge["donor"]["email"]:
+                continue
+            else:
+                is_donor, user_payments = create_payments(pledge, api_account, known)
 
-            if is_donor:
-                dpch = create_donor_profile(pledge, api_account)
-                if user_payments:
-                    pair_payments(dpch, user_payments)
-                    new_payments += user_payments
+                if is_donor:
+                    dpch = create_donor_profile(pledge, api_account, known)
+                    if user_payments:
+                        pair_payments(dpch, user_payments)
+                        new_payments += user_payments
 
-    return new_payments
+        yield new_payments
 
 
 def check_for_new_payments(log_function=None):
+    """
+    download pledges of all active api accounts concurrently,
+    then import them one account after another as they come
+    """
     if log_function is None:
         log_function = lambda _: None  # noqa
-    for api_account in ApiAccount.objects.filter(is_active=True):
+    full_downloads = {
+        api_account: api_account.needs_full_download()
+        for api_account in ApiAccount.objects.filter(is_active=True)
+    }
+    urls = {
+        api_account: get_download_url(api_account, full_download)
+        for api_account, full_download in full_downloads.items()
+    }
+    for api_account, pledges_file in download_concurrently(urls):
         log_function(api_account)
-        payments = create_statement_from_API(api_account)
+        payments = None
+        if pledges_file is not None:
+            # failing account doesn't stop import of the others
+            try:
+                payments = import_pledges(
+                    pledges_file, api_account, full_downloads[api_account]
+                )
+            except Exception:  # noqa
+                logger.exception(f"Darujme check of {api_account} failed")
         log_function(payments)
+
+
+def is_paid_pledge(pledge):
+    return any(
+        transaction["state"] in PAID_TRANSACTION_STATES
+        for transaction in pledge["transactions"]
+    )
+
+
+def mirror_pledges(pledges_file, api_account, since):
+    """
+    replace mirrored pledges of the api_account by the downloaded ones
+    """
+    try:
+        pledges = [
+            DarujmePledge(
+                api_account=api_account,
+                pledge_id=pledge["pledgeId"],
+                email=pledge["donor"]["email"].lower(),
+                pledged_date=parse_datetime(pledge["pledgedAt"]).date(),
+                is_paid=is_paid_pledge(pledge),
+            )
+            for pledge in iter_pledges(pledges_file)
+            if pledge["donor"]["email"]
+        ]
+    finally:
+        pledges_file.close()
+    pledges = [pledge for pledge in pledges if pledge.pledged_date >= since]
+    mirrored = DarujmePledge.objects.filter(api_account=api_account)
+    paid_emails = {pledge.email for pledge in pledges if pledge.is_paid}
+    newly_paid_emails = paid_emails - set(
+        mirrored.filter(is_paid=True).values_list("email", flat=True)
+    )
+    with atomic():
+        mirrored.delete()
+        DarujmePledge.objects.bulk_create(
+            pledges,
+            batch_size=settings.DARUJME_IMPORT_BATCH_SIZE,
+        )
+    invalidate_paid_section(
+        ProfileEmail.objects.filter(
+            email__in=newly_paid_emails,
+            user__isnull=False,
+        ).values_list("user_id", flat=True)
+    )
+
+
+def get_mirror_dates():
+    """
+    {api_account: date} of the api accounts with newcomers (channels without
+    imported payment), their pledges are mirrored since the oldest registered
+    support of the newcomers, but at least for DARUJME_PLEDGE_MIRROR_DAYS
+    """
+    recent = datetime.date.today() - datetime.timedelta(
+        days=settings.DARUJME_PLEDGE_MIRROR_DAYS,
+    )
+    oldest_newcomers = dict(
+        DonorPaymentChannel.objects.filter(
+            money_account__in=ApiAccount.objects.all(),
+            payment_total=0,
+        )
+        .order_by()
+        .values_list("money_account")
+        .annotate(Min("registered_support"))
+    )
+    return {
+        api_account: min(recent, oldest_newcomers[api_account.pk].date())
+        for api_account in ApiAccount.objects.filter(pk__in=oldest_newcomers)
+    }
+
+
+def refresh_pledge_mirror():
+    """
+    download pledges of the api accounts with newcomers, so the paid section
+    check doesn't have to call the Darujme api
+    """
+    mirror_dates = get_mirror_dates()
+    # accounts without newcomers are not checked
+    DarujmePledge.objects.exclude(api_account__in=list(mirror_dates)).delete()
+    urls = {
+        api_account: api_account.darujme_url(from_pledged_date=since)
+        for api_account, since in mirror_dates.items()
+    }
+    for api_account, pledges_file in download_concurrently(urls):
+        if pledges_file is None:
+            # keep the old mirror
+            continue
+        try:
+            mirror_pledges(pledges_file, api_account, mirror_dates[api_account])
+        except Exception:  # noqa
+            logger.exception(f"Darujme pledges mirror of {api_account} failed")
@@ -47,15 +47,57 @@ from aklub.models import AccountStatements, MassCommunication, UserProfile
 cache = caches["default"]
 
 
-def get_users_by_condition_cached(cond):
-    items = cache.get("condition_filter_%i" % cond.pk, None)
-    if not items:
-        items = cond.filter_queryset(UserProfile.objects.all())
-        now = timezone.now()
-        td = now.replace(hour=23, minute=59, second=59, microsecond=999) - now
-        seconds_till_midnight = td.seconds + (td.days * 24 * 3600)
-        cache.set("condition_filter_%i" % cond.pk, items, seconds_till_midnight)
-    return items
+# number of profiles listed on the dashboard for each condition
+DASHBOARD_CONDITION_ITEMS = 10
+
+# missing results are computed by one task at a time,
+# the lock expires after X seconds if the task dies
+PRECOMPUTE_CONDITIONS_LOCK_KEY = "dashboard_conditions_precompute_lock"
+PRECOMPUTE_CONDITIONS_LOCK_TIMEOUT = 60 * 60
+
+
+def condition_cache_key(cond_id):
+    return "dashboard_condition_%i" % cond_id
+
+
+def precompute_condition(cond):
+    """Store count and first profiles ids of the condition"""
+    profiles = cond.filter_queryset(UserProfile.objects.all())
+    results = {
+        "count": profiles.count(),
+        "ids": list(profiles.values_list("id", flat=True)[:DASHBOARD_CONDITION_ITEMS]),
+        "computed": timezone.now(),
+    }
+    # refreshed by the periodic task
+    cache.set(condition_cache_key(cond.pk), results, None)
+    return results
+
+
+def precompute_conditions():
+    try:
+        for cond in NamedCondition.objects.filter(on_dashboard=True):
+            precompute_condition(cond)
+    finally:
+        cache.delete(PRECOMPUTE_CONDITIONS_LOCK_KEY)
+
+
+def get_conditions_results(conditions):
+    """
+    Return precomputed results of the conditions by id,
+    conditions are never evaluated in the request
+    """
+    keys = {condition_cache_key(cond.pk): cond.pk for cond in conditions}
+    results = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    if len(results) < len(keys) and cache.add(
+        PRECOMPUTE_CONDITIONS_LOCK_KEY,
+        1,
+        PRECOMPUTE_CONDITIONS_LOCK_TIMEOUT,
+    ):
+        from .tasks import precompute_dashboard_conditions
+
+        precompute_dashboard_conditions.delay()
+        results = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    return results
 
 
 class AklubIndexDashboard(Dashboard):
@@ -152,35 +194,51 @@ class AklubIndexDashboard(Dashboard):
                     "external": False,
                 }
             )
-        for cond in NamedCondition.objects.filter(on_dashboard=True):
+        conditions = list(NamedCondition.objects.filter(on_dashboard=True))
+        conditions_results = get_conditions_results(conditions)
+        for cond in conditions:
             children.append(
                 {
                     "title": _(u"%(name)s: %(items)s items")
                     % {
                         "name": str(cond.name),
-                        "items": get_users_by_condition_cached(cond).count(),
+                        "items": conditions_results.get(cond.pk, {}).get("count", "?"),
                     },
                     "url": reverse("admin:aklub_userprofile_changelist")
                     + "?user_condition=%i" % cond.id,
                     "external": False,
                 }
             )
+        computed = [results["computed"] for results in conditions_results.values()]
         self.children.append(
             modules.LinkList(
                 _("Conditions"),
                 children=children,
+                post_content=_(u"Computed at: %s")
+                % timezone.localtime(min(computed)).strftime("%Y-%m-%d %H:%M")
+                if computed
+                else "",
             ),
         )
 
-        for cond in NamedCondition.objects.filter(on_dashboard=True):
+        members = UserProfile.objects.in_bulk(
+            [
+                profile_id
+                for results in conditions_results.values()
+                for profile_id in results["ids"]
+            ]
+        )
+        for cond in conditions:
             children = []
-            members = get_users_by_condition_cached(cond)
-            for member in members[:10]:
+            results = conditions_results.get(cond.pk, {"count": 0, "ids": []})
+            for member_id in results["ids"]:
+                if member_id not in members:
+                    continue
                 children.append(
                     {
-                        "title": member.person_name(),
+                        "title": members[member_id].person_name(),
                         "url": reverse(
-                            "admin:aklub_donorpaymentchannel_change", args=[member.id]
+                            "admin:aklub_donorpaymentchannel_change", args=[member_id]
                         ),
                         "external": False,
                     }
@@ -191,7 +249,7 @@ class AklubIndexDashboard(Dashboard):
                     title_url=reverse("admin:aklub_userprofile_changelist")
                     + "/?user_condition=%i" % cond.id,
                     children=children,
-                    pre_content=_(u"Total number of items: %i") % members.count(),
+                    pre_content=_(u"Total number of items: %i") % results["count"],
                 ),
             )
 
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+""" Clusters of profiles sharing the email, telephone or name """
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Concat, Lower, Replace, Right, Trim
+from django.db.transaction import atomic
+
+from .models import (
+    CompanyContact,
+    CompanyProfile,
+    ProfileDuplicate,
+    ProfileEmail,
+    Telephone,
+    UserProfile,
+)
+from .utils import get_unit_access
+
+
+def clean_telephone(field):
+    """Last nine digits of the telephone number"""
+    return Right(Replace(field, Value(" "), Value("")), 9)
+
+
+def clean_text(field):
+    return Lower(Trim(field))
+
+
+def user_name():
+    return Trim(
+        Concat(clean_text("first_name"), Value(" "), clean_text("last_name")),
+    )
+
+
+def address():
+    return Concat(clean_text("street"), Value("|"), clean_text("city"))
+
+
+def get_sources():
+    """Kind, queryset, normalized value and profile field of the clustered rows"""
+    named_users = UserProfile.objects.exclude(first_name="", last_name="")
+    named_companies = CompanyProfile.objects.exclude(
+        Q(name="") | Q(name__isnull=True),
+    )
+    return (
+        (
+            ProfileDuplicate.EMAIL,
+            ProfileEmail.objects.filter(user__isnull=False),
+            Lower("email"),
+            "user",
+        ),
+        (
+            ProfileDuplicate.EMAIL,
+            CompanyContact.objects.all(),
+            Lower("email"),
+            "company",
+        ),
+        (
+            ProfileDuplicate.TELEPHONE,
+            Telephone.objects.filter(user__isnull=False),
+            F("normalized_telephone"),
+            "user",
+        ),
+        (
+            ProfileDuplicate.TELEPHONE,
+            CompanyContact.objects.all(),
+            clean_telephone("telephone"),
+            "company",
+        ),
+        (ProfileDuplicate.NAME, named_users, user_name(), "id"),
+        (ProfileDuplicate.NAME, named_companies, clean_text("name"), "id"),
+        (
+            ProfileDuplicate.NAME_ADDRESS,
+            named_users.exclude(street=""),
+            Concat(user_name(), Value("|"), address()),
+            "id",
+        ),
+        (
+            ProfileDuplicate.NAME_ADDRESS,
+            named_companies.exclude(street=""),
+            Concat(clean_text("name"), Value("|"), address()),
+            "id",
+        ),
+    )
+
+
+def find_clusters(queryset, key, profile_field):
+    """Values shared by more profiles with ids of the profiles"""
+    return (
+        queryset.annotate(duplicate_key=key)
+        .exclude(Q(duplicate_key="") | Q(duplicate_key__isnull=True))
+        .order_by()
+        .values("duplicate_key")
+        .annotate(
+            profile_count=Count(profile_field, distinct=True),
+            profile_ids=ArrayAgg(profile_field, distinct=True),
+        )
+        .filter(profile_count__gt=1)
+        .values_list("duplicate_key", "profile_ids")
+    )
+
+
+def get_duplicates():
+    cluster = 0
+    for kind, queryset, key, profile_field in get_sources():
+        for value, profile_ids in find_clusters(queryset, key, profile_field):
+            cluster += 1
+            for profile_id in profile_ids:
+                yield ProfileDuplicate(
+                    kind=kind,
+                    cluster=cluster,
+                    key=value,
+                    profile_id=profile_id,
+                )
+
+
+@atomic
+def rebuild():
+    """Compute all clusters of the duplicate profiles again"""
+    ProfileDuplicate.objects.all().delete()
+    ProfileDuplicate.objects.bulk_create(get_duplicates(), batch_size=1000)
+
+
+def duplicate_profiles(request, kind):
+    """
+    Ids of the profiles in the clusters of the kind,
+    profiles outside of the administrated units are not counted
+    """
+    duplicates = ProfileDuplicate.objects.filter(kind=kind)
+    unit_access = get_unit_access(request)
+    if unit_access.all_units:
+        return duplicates.values("profile")
+    duplicates = duplicates.filter(
+        profile__administrative_units__in=unit_access.unit_ids,
+    )
+    clusters = (
+        duplicates.order_by()
+        .values("cluster")
+        .annotate(profile_count=Count("profile", distinct=True))
+        .filter(profile_count__gt=1)
+        .values("cluster")
+    )
+    return duplicates.filter(cluster__in=clusters).values("profile")
@@ -1,14 +1,14 @@
 # custom filters
 
-import operator
 from datetime import date, timedelta
-from functools import reduce
 from abc import ABC
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin import SimpleListFilter
 from django.contrib.admin.filters import FieldListFilter, RelatedFieldListFilter
 from django.contrib.admin.utils import reverse_field_path
+from django.core.cache import cache
 from django.db.models import (
     BooleanField,
     Case,
@@ -24,19 +24,37 @@ from django.db.models import (
     Value,
     When,
 )
-from django.db.models.functions import Lower, Replace, Right
 from django.utils.translation import ugettext as _
 
 from interactions.models import Interaction
 
+from aklub.duplicates import duplicate_profiles
 from aklub.models import (
     CompanyContact,
     CompanyProfile,
     DonorPaymentChannel,
+    ProfileDuplicate,
     ProfileEmail,
-    Telephone,
     UserProfile,
 )
+from aklub.utils import get_unit_access, list_filter_choices_cache_key
+
+
+def get_cached_choices(request, name, get_choices):
+    """
+    Choices of the list filter for the units of the user,
+    cached until an event or administrative unit changes
+    """
+    unit_access = get_unit_access(request)
+    cache_key = list_filter_choices_cache_key(
+        name,
+        None if unit_access.all_units else unit_access.unit_ids,
+    )
+    choices = cache.get(cache_key)
+    if choices is None:
+        choices = list(get_choices(unit_access))
+        cache.set(cache_key, choices, settings.LIST_FILTER_CHOICES_CACHE_TIMEOUT)
+    return choices
 
 
 class ProfileMultiSelectDonorEvent(FieldListFilter):
@@ -64,17 +82,18 @@ class ProfileMultiSelectDonorEvent(FieldListFilter):
         else:
             queryset = parent_model._default_manager.all()
 
-        if request.user.has_perm("can_edit_all_units"):
-            look_up = queryset.distinct().order_by(field.name)
-        else:
-            look_up = (
-                queryset.filter(
-                    administrative_units__in=request.user.administrated_units.all()
-                )
-                .distinct()
-                .order_by(field.name)
-            )
-        self.lookup_choices = [(event.id, event.name) for event in look_up]
+        def get_choices(unit_access):
+            look_up = queryset
+            if not unit_access.all_units:
+                look_up = look_up.filter(administrative_units__in=unit_access.unit_ids)
+            look_up = look_up.distinct().order_by(field.name)
+            return look_up.values_list("id", "name")
+
+        self.lookup_choices = get_cached_choices(
+            request,
+            f"{model._meta.label}.{field_path}",
+            get_choices,
+        )
 
     def expected_parameters(self):
         return [self.lookup_kwarg, self.lookup_kwarg_isnull]
@@ -136,12 +155,9 @@ class PreferenceMailingListAllowed(SimpleListFilter):
 
     def queryset(self, request, queryset):
         filters = {}
-        if not request.user.has_perm("can_edit_all_units"):
-            filters.update(
-                {
-                    "preference__administrative_unit": request.user.administrated_units.first()
-                }
-            )
+        unit_access = get_unit_access(request)
+        if not unit_access.all_units:
+            filters.update({"preference__administrative_unit": unit_access.first_unit})
 
         if self.value() == "yes":
             filters.update({"preference__send_mailing_lists": True})
@@ -171,13 +187,12 @@ class IsUserInCompanyProfile(SimpleListFilter):
                 user_id__in=queryset.values_list("id", flat=True)
             )
             filter_kwargs = {"email__in": emails.values_list("email", flat=True)}
-            if not request.user.has_perm("can_edit_all_units"):
+            unit_access = get_unit_access(request)
+            if not unit_access.all_units:
                 filter_kwargs[
                     "company__administrative_units__in"
-                ] = request.user.administrated_units.all()
-                filter_kwargs[
-                    "administrative_unit__in"
-                ] = request.user.administrated_units.all()
+                ] = unit_access.unit_ids
+                filter_kwargs["administrative_unit__in"] = unit_access.unit_ids
             # duplicate emails
             contacts = CompanyContact.objects.filter(**filter_kwargs)
             profile_emails = ProfileEmail.objects.filter(
@@ -330,47 +345,9 @@ class EmailFilter(SimpleListFilter):
                 queryset = queryset.exclude(blank_filter)
 
             if self.value() == "duplicate":
-                if queryset.first().is_userprofile():
-                    # right now.. this shoud never ever return smth cuz of model definition.
-                    duplicates = (
-                        ProfileEmail.objects.filter(
-                            email__isnull=False, user__isnull=False
-                        )
-                        .exclude(email__exact="")
-                        .annotate(email_lower=Lower("email"))
-                        .values("email_lower")
-                        .annotate(Count("id"))
-                        .values("email_lower")
-                        .order_by()
-                        .filter(id__count__gt=1)
-                        .values_list("email_lower", flat=True)
-                    )
-                    duplicates = ProfileEmail.objects.annotate(
-                        email_lower=Lower("email")
-                    ).filter(email_lower__in=duplicates)
-                    return queryset.filter(profileemail__in=duplicates)
-                else:
-                    if request.user.has_perm("can_edit_all_units"):
-                        filter_kwargs = {}
-                    else:
-                        filter_kwargs = {
-                            "administrative_unit__in": request.user.administrated_units.all()
-                        }
-
-                    duplicates = (
-                        CompanyContact.objects.filter(email__isnull=False)
-                        .filter(**filter_kwargs)
-                        .exclude(email__exact="")
-                        .annotate(email_lower=Lower("email"))
-                        .values("email_lower")
-                        .annotate(Count("company", distinct=True))
-                        .filter(company__count__gt=1)
-                        .values_list("email_lower", flat=True)
-                    )
-                    duplicates = CompanyContact.objects.annotate(
-                        email_lower=Lower("email")
-                    ).filter(email_lower__in=duplicates)
-                    return queryset.filter(companycontact__in=duplicates)
+                return queryset.filter(
+                    pk__in=duplicate_profiles(request, ProfileDuplicate.EMAIL),
+                )
 
             if self.value() == "email-format":
                 if queryset.first().is_userprofile():
@@ -445,74 +422,9 @@ class TelephoneFilter(SimpleListFilter):
             else:
                 queryset = queryset.exclude(blank_filter)
             if self.value() == "duplicate":
-                filter_kwargs = {}
-                # check what perm admin has
-                if queryset.first().is_userprofile():
-                    if not request.user.has_perm("aklub.can_edit_all_units"):
-                        filter_kwargs = {
-                            "user__administrative_units__in": request.user.administrated_units.all()
-                        }
-                    # TODO: shoud be nicer
-                    duplicate = (
-                        Telephone.objects.annotate(
-                            clean_telephone=Right(
-                                Replace("telephone", Value(" "), Value("")),
-                                9,
-                            )
-                        )
-                        .values("clean_telephone")
-                        .filter(**filter_kwargs)
-                        .annotate(total_clean=Count("clean_telephone"))
-                        .filter(total_clean__gt=1)
-                        .values_list("clean_telephone", flat=True)
-                    )
-
-                    users_ids = (
-                        Telephone.objects.annotate(
-                            clean_telephone=Right(
-                                Replace("telephone", Value(" "), Value("")),
-                                9,
-                            )
-                        )
-                        .filter(clean_telephone__in=duplicate)
-                        .order_by("clean_telephone")
-                        .values_list("user", flat=True)
-                        .order_by("clean_telephone")
-                    )
-                    return queryset.filter(id__in=users_ids).distinct()
-                else:
-                    if not request.user.has_perm("aklub.can_edit_all_units"):
-                        filter_kwargs = {
-                            "company__administrative_units__in": request.user.administrated_units.all()
-                        }
-                    # TODO: shoud be nicer
-                    duplicate = (
-                        CompanyContact.objects.filter(**filter_kwargs)
-                        .annotate(
-                            clean_telephone=Right(
-                                Replace("telephone", Value(" "), Value("")),
-                                9,
-                            )
-                        )
-                        .values("clean_telephone")
-                        .annotate(total_clean=Count("clean_telephone"))
-                        .filter(total_clean__gt=1)
-                        .values_list("clean_telephone", flat=True)
-                    )
-
-                    companies_ids = (
-                        CompanyContact.objects.annotate(
-                            clean_telephone=Right(
-                                Replace("telephone", Value(" "), Value("")),
-                                9,
-                            )
-                        )
-                        .filter(clean_telephone__in=duplicate)
-                        .order_by("clean_telephone")
-                        .values_list("company", flat=True)
-                        .order_by("clean_telephone")
-                    )
-                    return queryset.filter(id__in=companies_ids).distinct()
+                return queryset.filter(
+                    pk__in=duplicate_profiles(request, ProfileDuplicate.TELEPHONE),
+                )
 
             if self.value() == "bad-format":
                 if queryset.first().is_userprofile():
@@ -546,49 +458,28 @@ class ProfileTypeFilter(SimpleListFilter):
 class NameFilter(SimpleListFilter):
     title = _("Name")
     parameter_name = "name"
+    duplicate_kinds = {
+        "duplicate": ProfileDuplicate.NAME,
+        "duplicate-address": ProfileDuplicate.NAME_ADDRESS,
+    }
 
     def lookups(self, request, model_admin):
         return (
             ("duplicate", _("Duplicate")),
+            ("duplicate-address", _("Duplicate name and address")),
             ("blank", _("Blank")),
         )
 
     def queryset(self, request, queryset):
         user_profile_qs = queryset.instance_of(UserProfile)
         company_profile_qs = queryset.instance_of(CompanyProfile)
-        if self.value() == "duplicate":
-            if user_profile_qs:
-                duplicates = UserProfile.objects.filter(
-                    first_name__isnull=False, last_name__isnull=False
-                )
-                duplicates = duplicates.exclude(
-                    first_name__exact="", last_name__exact=""
-                )
-                duplicates = duplicates.values("first_name", "last_name")
-                duplicates = duplicates.annotate(Count("id"))
-                duplicates = duplicates.values("first_name", "last_name", "id")
-                duplicates = duplicates.order_by()
-                duplicates = duplicates.filter(id__count__gt=1)
-                duplicates = duplicates.values_list("first_name", "last_name")
-                query = reduce(
-                    operator.or_,
-                    (Q(first_name=fn, last_name=ln) for fn, ln in duplicates),
-                )
-                return queryset.filter(query)
-            if company_profile_qs:
-                duplicates = CompanyProfile.objects.filter(name__isnull=False)
-                duplicates = duplicates.exclude(name__exact="")
-                duplicates = duplicates.values("name")
-                duplicates = duplicates.annotate(Count("id"))
-                duplicates = duplicates.values("name", "id")
-                duplicates = duplicates.order_by()
-                duplicates = duplicates.filter(id__count__gt=1)
-                duplicates = duplicates.values_list("name", flat=True)
-                query = reduce(
-                    operator.or_,
-                    (Q(name=name) for name in duplicates),
-                )
-                return queryset.filter(query)
+        if self.value() in self.duplicate_kinds:
+            return queryset.filter(
+                pk__in=duplicate_profiles(
+                    request,
+                    self.duplicate_kinds[self.value()],
+                ),
+            )
 
         if self.value() == "blank":
             if user_profile_qs:
@@ -605,14 +496,20 @@ class NameFilter(SimpleListFilter):
 
 class UnitFilter(RelatedFieldListFilter):
     def field_choices(self, field, request, model_admin):
-        if request.user.has_perm("aklub.can_edit_all_units"):
-            return field.get_choices(include_blank=False)
-        else:
+        def get_choices(unit_access):
+            if unit_access.all_units:
+                return field.get_choices(include_blank=False)
             return field.get_choices(
                 include_blank=False,
-                limit_choices_to={"pk__in": request.user.administrated_units.all()},
+                limit_choices_to={"pk__in": unit_access.unit_ids},
             )
 
+        return get_cached_choices(
+            request,
+            f"{model_admin.model._meta.label}.{self.field_path}",
+            get_choices,
+        )
+
 
 class AdministrativeUnitAdminMixin(object):
     queryset_unit_param = "administrative_units"
@@ -620,11 +517,10 @@ class AdministrativeUnitAdminMixin(object):
     def get_queryset(self, request):
         self.request = request
         queryset = super().get_queryset(request)
-        if request.user.has_perm("aklub.can_edit_all_units"):
+        unit_access = get_unit_access(request)
+        if unit_access.all_units:
             return queryset
-        kwargs = {
-            self.queryset_unit_param + "__in": request.user.administrated_units.all()
-        }
+        kwargs = {self.queryset_unit_param + "__in": unit_access.unit_ids}
         return queryset.filter(
             **kwargs
         ).distinct()  # The distinct is necessarry here for unit admins, that have more cities
@@ -640,13 +536,13 @@ class AdministrativeUnitAdminMixin(object):
         return super().lookup_allowed(key, value)
 
     def gate_admined_units(self, db_field, request, **kwargs):
-        if not request.user.has_perm("aklub.can_edit_all_units"):
-            administrated_units = request.user.administrated_units.all()
+        unit_access = get_unit_access(request)
+        if not unit_access.all_units:
             if db_field.name == self.queryset_unit_param:
-                kwargs["queryset"] = administrated_units
+                kwargs["queryset"] = unit_access.units
                 kwargs["required"] = True
-                if administrated_units.count() == 1:
-                    kwargs["initial"] = administrated_units
+                if len(unit_access.unit_ids) == 1:
+                    kwargs["initial"] = unit_access.units
         return kwargs
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
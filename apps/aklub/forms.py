@@ -18,6 +18,7 @@ from django.utils.translation import ugettext_lazy as _
 from smmapdfs.models import PdfSandwichType
 
 from aklub.models import AdministrativeUnit, CompanyContact, ProfileEmail, Telephone
+from aklub.utils import get_unit_access
 
 Profile = get_user_model()
 
@@ -49,8 +50,9 @@ class TaxConfirmationForm(forms.Form):
             else:
                 profile_type = "company_profile"
 
-            if not request.user.has_perm("aklub.can_edit_all_units"):
-                au = request.user.administrated_units.all()
+            unit_access = get_unit_access(request)
+            if not unit_access.all_units:
+                au = unit_access.unit_ids
             else:
                 au = AdministrativeUnit.objects.all()
 
@@ -219,9 +221,8 @@ class UnitUserProfileAddForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.non_hidden_fields = ("email", "administrative_units")
-        self.fields[
-            "administrative_units"
-        ].queryset = self.request.user.administrated_units.all()
+        unit_access = get_unit_access(self.request)
+        self.fields["administrative_units"].queryset = unit_access.units
         self.fields["administrative_units"].required = True
 
         if self.request.method == "GET":
@@ -312,10 +313,9 @@ class CompanyProfileAddForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.non_hidden_fields = ("crn", "tin", "no_crn_check", "administrative_units")
-        if not self.request.user.has_perm("aklub.can_edit_all_units"):
-            self.fields[
-                "administrative_units"
-            ].queryset = self.request.user.administrated_units.all()
+        unit_access = get_unit_access(self.request)
+        if not unit_access.all_units:
+            self.fields["administrative_units"].queryset = unit_access.units
         self.fields["administrative_units"].required = True
         if self.request.method == "GET":
             hidden_fields_switcher(self)
@@ -375,7 +375,7 @@ class CompanyProfileChangeForm(CompanyProfileAddForm):
 
     def __init__(self, *args, **kwargs):
         super(CompanyProfileAddForm, self).__init__(*args, **kwargs)
-        if not self.request.user.has_perm("aklub.can_edit_all_units"):
+        if not get_unit_access(self.request).all_units:
             self.fields[
                 "administrative_units"
             ].queryset = self.instance.administrative_units.all()
@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+
+from aklub import profile_search
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Computes search documents of all profiles again"  # noqa
+
+    def handle(self, *args, **options):
+        profile_search.rebuild_all()
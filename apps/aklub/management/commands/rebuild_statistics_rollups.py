@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+
+from aklub import stat_rollups
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Computes all monthly member and payment statistics rollups again"  # noqa
+
+    def handle(self, *args, **options):
+        stat_rollups.rebuild_all()
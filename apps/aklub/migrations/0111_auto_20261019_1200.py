@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aklub', '0110_auto_20230213_0826'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apiaccount',
+            name='last_full_download',
+            field=models.DateTimeField(blank=True, help_text='When were all pledges of the project downloaded', null=True, verbose_name='Last full download'),
+        ),
+        migrations.AddField(
+            model_name='apiaccount',
+            name='last_pledge_date',
+            field=models.DateField(blank=True, help_text='Date of the newest downloaded pledge, only newer pledges are downloaded between full downloads', null=True, verbose_name='Last pledge date'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-19 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aklub', '0111_auto_20261019_1200'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DarujmePledge',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pledge_id', models.IntegerField(verbose_name='Pledge ID')),
+                ('email', models.EmailField(max_length=254, verbose_name='Donor email')),
+                ('pledged_date', models.DateField(verbose_name='Pledged date')),
+                ('is_paid', models.BooleanField(default=False, help_text='Pledge has any successful transaction', verbose_name='Paid')),
+                ('api_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pledges', to='aklub.apiaccount', verbose_name='Api Account')),
+            ],
+            options={
+                'verbose_name': 'Darujme pledge',
+                'verbose_name_plural': 'Darujme pledges',
+                'unique_together': {('api_account', 'pledge_id')},
+                'index_together': {('api_account', 'email')},
+            },
+        ),
+    ]
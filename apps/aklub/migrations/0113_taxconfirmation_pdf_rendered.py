@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-19 13:30
+
+from django.db import migrations, models
+
+
+def set_pdf_rendered(apps, schema_editor):
+    TaxConfirmation = apps.get_model('aklub', 'TaxConfirmation')
+    TaxConfirmation.objects.filter(
+        taxconfirmationpdf__isnull=False,
+    ).exclude(
+        taxconfirmationpdf__pdf='',
+    ).update(pdf_rendered=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aklub', '0112_darujmepledge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taxconfirmation',
+            name='pdf_rendered',
+            field=models.BooleanField(default=False, help_text='PDF file is rendered with the current amount', verbose_name='PDF rendered'),
+        ),
+        migrations.RunPython(set_pdf_rendered, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.1.14 on 2026-10-19 14:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smmapdfs', '0003_auto_20191126_1611'),
+        ('aklub', '0113_taxconfirmation_pdf_rendered'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxConfirmationRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(verbose_name='Year')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('finished', models.DateTimeField(blank=True, help_text='Last time when all the profiles of the run were processed', null=True, verbose_name='Finished')),
+                ('administrative_unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='aklub.administrativeunit', verbose_name='administrative unit')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tax_confirmation_runs', to=settings.AUTH_USER_MODEL, verbose_name='Created by')),
+                ('pdf_type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='smmapdfs.pdfsandwichtype', verbose_name='PDF type')),
+            ],
+            options={
+                'verbose_name': 'Tax confirmation run',
+                'verbose_name_plural': 'Tax confirmation runs',
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.CreateModel(
+            name='TaxConfirmationRunProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('created', 'Tax confirmation created'), ('failed', 'Failed'), ('pdf_done', 'PDF done'), ('no_payments', 'No payments')], default='pending', max_length=20, verbose_name='Status')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Profile')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='run_profiles', to='aklub.taxconfirmationrun', verbose_name='Tax confirmation run')),
+                ('tax_confirmation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='aklub.taxconfirmation', verbose_name='Tax confirmation')),
+            ],
+            options={
+                'verbose_name': 'Tax confirmation run profile',
+                'verbose_name_plural': 'Tax confirmation run profiles',
+                'unique_together': {('run', 'profile')},
+                'index_together': {('run', 'status')},
+            },
+        ),
+    ]
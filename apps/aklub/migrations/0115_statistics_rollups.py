@@ -0,0 +1,59 @@
+# Generated by Django 3.1.14 on 2026-10-19 15:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_initial'),
+        ('aklub', '0114_taxconfirmationrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutdatedStatisticsMonth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statistics', models.CharField(choices=[('members', 'Members'), ('payments', 'Payments')], max_length=20, verbose_name='Statistics')),
+                ('month', models.DateField(verbose_name='Month')),
+            ],
+            options={
+                'verbose_name': 'Outdated statistics month',
+                'verbose_name_plural': 'Outdated statistics months',
+                'unique_together': {('statistics', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyPaymentStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, verbose_name='Month')),
+                ('type', models.CharField(blank=True, max_length=200, verbose_name='Type')),
+                ('amount', models.BigIntegerField(default=0, verbose_name='Amount')),
+                ('payments', models.PositiveIntegerField(default=0, verbose_name='Number of payments')),
+                ('administrative_unit', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='aklub.administrativeunit', verbose_name='administrative unit')),
+                ('event', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='events.event', verbose_name='Event')),
+            ],
+            options={
+                'verbose_name': 'Monthly payment statistics',
+                'verbose_name_plural': 'Monthly payment statistics',
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyMemberStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, verbose_name='Month')),
+                ('regular', models.PositiveIntegerField(default=0, verbose_name='Regular')),
+                ('irregular', models.PositiveIntegerField(default=0, verbose_name='Irregular')),
+                ('administrative_unit', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='aklub.administrativeunit', verbose_name='administrative unit')),
+                ('event', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='events.event', verbose_name='Event')),
+            ],
+            options={
+                'verbose_name': 'Monthly member statistics',
+                'verbose_name_plural': 'Monthly member statistics',
+            },
+        ),
+    ]
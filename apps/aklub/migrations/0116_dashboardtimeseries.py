@@ -0,0 +1,47 @@
+# Generated by Django 3.1.14 on 2026-10-19 16:30
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_tools_stats', '0001_initial'),
+        ('aklub', '0115_statistics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardTimeSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(max_length=10, verbose_name='Interval')),
+                ('criteria', models.CharField(help_text='Hash of the chart criteria', max_length=32, verbose_name='Criteria')),
+                ('covered_since', models.DateTimeField(null=True, verbose_name='Covered since')),
+                ('covered_until', models.DateTimeField(null=True, verbose_name='Covered until')),
+                ('administrative_unit', models.ForeignKey(help_text='Empty for all administrative units', null=True, on_delete=django.db.models.deletion.CASCADE, to='aklub.administrativeunit', verbose_name='administrative unit')),
+                ('stats', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='admin_tools_stats.dashboardstats', verbose_name='Dashboard stats')),
+            ],
+            options={
+                'verbose_name': 'Dashboard time series',
+                'verbose_name_plural': 'Dashboard time series',
+                'unique_together': {('stats', 'administrative_unit', 'interval', 'criteria')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DashboardTimeSeriesValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='Bucket')),
+                ('values', django.contrib.postgres.fields.jsonb.JSONField(verbose_name='Values')),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='aklub.dashboardtimeseries', verbose_name='Dashboard time series')),
+            ],
+            options={
+                'verbose_name': 'Dashboard time series value',
+                'verbose_name_plural': 'Dashboard time series values',
+                'unique_together': {('series', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.1.14 on 2026-10-19 18:30
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aklub', '0116_dashboardtimeseries'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='ProfileSearchDocument',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='aklub.profile', verbose_name='Profile')),
+                ('document', models.TextField(blank=True, verbose_name='Document')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True, verbose_name='Search vector')),
+            ],
+            options={
+                'verbose_name': 'Profile search document',
+                'verbose_name_plural': 'Profile search documents',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='profilesearchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['vector'], name='aklub_profsearch_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='profilesearchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['document'], name='aklub_profsearch_trgm_gin', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2026-10-19 19:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aklub', '0117_profilesearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileDuplicate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('email', 'Email'), ('telephone', 'Telephone'), ('name', 'Name'), ('name_address', 'Name and address')], max_length=20, verbose_name='Kind')),
+                ('cluster', models.PositiveIntegerField(verbose_name='Cluster')),
+                ('key', models.TextField(verbose_name='Normalized value')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicates', to='aklub.profile', verbose_name='Profile')),
+            ],
+            options={
+                'verbose_name': 'Profile duplicate',
+                'verbose_name_plural': 'Profile duplicates',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='profileduplicate',
+            index=models.Index(fields=['kind', 'profile'], name='aklub_profdup_kind_profile'),
+        ),
+        migrations.AddIndex(
+            model_name='profileduplicate',
+            index=models.Index(fields=['kind', 'cluster'], name='aklub_profdup_kind_cluster'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.1.14 on 2026-10-19 20:30
+
+import logging
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_telephone(telephone):
+    digits = "".join(char for char in telephone or "" if char.isdigit())
+    if not digits:
+        return None
+    if len(digits) > 9:
+        return "+" + digits[-12:]
+    return "+420" + digits[-9:]
+
+
+def set_normalized_telephone(apps, schema_editor):
+    Telephone = apps.get_model('aklub', 'Telephone')
+    known = set()
+    duplicates = []
+    telephones = []
+    # primary numbers are kept before their duplicates
+    for telephone in Telephone.objects.order_by('user_id', 'is_primary', 'pk').iterator():
+        telephone.normalized_telephone = normalize_telephone(telephone.telephone)
+        key = (telephone.user_id, telephone.normalized_telephone)
+        if telephone.normalized_telephone is not None and key in known:
+            logger.warning(
+                'Deleting duplicate telephone pk=%s user_id=%s number=%s',
+                telephone.pk, telephone.user_id, telephone.telephone,
+            )
+            duplicates.append(telephone.pk)
+            continue
+        known.add(key)
+        telephones.append(telephone)
+    Telephone.objects.filter(pk__in=duplicates).delete()
+    Telephone.objects.bulk_update(telephones, ['normalized_telephone'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aklub', '0118_profileduplicate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telephone',
+            name='normalized_telephone',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='+ and the last 12 digits, +420 for numbers of up to 9 digits', max_length=20, null=True, verbose_name='Normalized telephone number'),
+        ),
+        migrations.RunPython(set_normalized_telephone, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='telephone',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_telephone'), name='aklub_telephone_user_normalized'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-19 21:30
+
+from aklub import stat_rollups
+
+from django.db import migrations
+
+
+def rebuild_statistics_rollups(apps, schema_editor):
+    stat_rollups.rebuild_all()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aklub', '0119_telephone_normalized_telephone'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_statistics_rollups, migrations.RunPython.noop),
+    ]
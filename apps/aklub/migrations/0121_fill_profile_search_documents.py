@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-19 22:30
+
+from aklub import profile_search
+
+from django.db import migrations
+
+
+def fill_profile_search_documents(apps, schema_editor):
+    profile_search.rebuild_all()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aklub', '0120_rebuild_statistics_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_profile_search_documents, migrations.RunPython.noop),
+    ]
@@ -32,6 +32,7 @@ from colorfield.fields import ColorField
 from computedfields.models import ComputedFieldsModel, computed
 
 from django.apps import apps
+from django.conf import settings
 from django.contrib.admin.templatetags.admin_list import _boolean_icon
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -43,11 +44,12 @@ from django.contrib.auth.models import (
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.humanize.templatetags.humanize import intcomma
 from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.files.storage import FileSystemStorage
 from django.core.validators import RegexValidator, ValidationError
-from django.db import models, transaction
+from django.db import IntegrityError, models, transaction
 from django.db.models import Count, Q, Sum, signals
-from django.db.models.functions import Trunc
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.html import format_html, format_html_join, mark_safe
@@ -73,7 +75,16 @@ from .sync_with_daktela_app import (
     get_user_auth_token,
     sync_contacts,
 )
-from .utils import WithAdminUrl, create_model
+from .utils import (
+    WithAdminUrl,
+    create_model,
+    get_unit_access,
+    invalidate_campaign_statistics,
+    invalidate_list_filter_choices,
+    invalidate_paid_section,
+    month_start,
+    normalize_telephone,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -1305,6 +1316,30 @@ class Preference(models.Model):
         super().save(*args, **kwargs)
 
 
+class TelephoneQuerySet(models.QuerySet):
+    def by_number(self, telephone):
+        """Telephones with the number written in any format"""
+        return self.filter(normalized_telephone=normalize_telephone(telephone))
+
+    def get_or_create_number(self, telephone, user, defaults=None):
+        """Same as get_or_create(), the number can be written in any format"""
+        existing = self.by_number(telephone).filter(user=user).first()
+        if existing is not None:
+            return existing, False
+        try:
+            with transaction.atomic(using=self.db):
+                telephone_object = self.create(
+                    telephone=telephone, user=user, **(defaults or {})
+                )
+            return telephone_object, True
+        except (IntegrityError, ValidationError):
+            # the number was created by a concurrent request
+            existing = self.by_number(telephone).filter(user=user).first()
+            if existing is not None:
+                return existing, False
+            raise
+
+
 class Telephone(models.Model):
     bool_choices = ((None, "No"), (True, "Yes"))
 
@@ -1337,21 +1372,40 @@ class Telephone(models.Model):
         UserProfile,
         on_delete=models.CASCADE,
     )
+    normalized_telephone = models.CharField(
+        verbose_name=_("Normalized telephone number"),
+        help_text=_("+ and the last 12 digits, +420 for numbers of up to 9 digits"),
+        max_length=20,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+
+    objects = TelephoneQuerySet.as_manager()
 
     class Meta:
         verbose_name = _("Telephone")
         verbose_name_plural = _("Telephones")
         unique_together = ("user", "is_primary")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "normalized_telephone"],
+                name="aklub_telephone_user_normalized",
+            ),
+        ]
 
     def validate_unique(self, exclude=None):
         super().validate_unique(exclude=exclude)
 
     def check_duplicate(self, *args, **kwargs):
-        if self.pk is None:
-            if Telephone.objects.filter(
-                telephone=self.telephone, user=self.user
-            ).exists():
-                raise ValidationError(_("Duplicate phone number for this user"))
+        if (
+            Telephone.objects.by_number(self.telephone)
+            .filter(user=self.user)
+            .exclude(pk=self.pk)
+            .exists()
+        ):
+            raise ValidationError(_("Duplicate phone number for this user"))
 
     def clean(self, *args, **kwargs):
         self.check_duplicate()
@@ -1362,6 +1416,7 @@ class Telephone(models.Model):
         super().clean(*args, **kwargs)
 
     def save(self, *args, **kwargs):
+        self.normalized_telephone = normalize_telephone(self.telephone)
         self.clean()
         super().save(*args, **kwargs)
         # Sync with Daktela app Contacts model
@@ -1380,11 +1435,7 @@ class Telephone(models.Model):
 
     def format_number(self):
         if hasattr(self, "telephone") and self.telephone != "":
-            removed_space_tel = self.telephone.replace(" ", "")
-            if len(removed_space_tel) > 9:
-                return "+" + removed_space_tel[-12:]
-            else:
-                return "+420" + removed_space_tel[-9:]
+            return normalize_telephone(self.telephone)
 
     def create_link(self):
         if hasattr(self, "telephone"):
@@ -1596,19 +1647,91 @@ class ApiAccount(MoneyAccount):
         help_text=_("Is the project active"),
         default=True,
     )
+    last_pledge_date = models.DateField(
+        verbose_name=_("Last pledge date"),
+        help_text=_(
+            "Date of the newest downloaded pledge, "
+            "only newer pledges are downloaded between full downloads"
+        ),
+        blank=True,
+        null=True,
+    )
+    last_full_download = models.DateTimeField(
+        verbose_name=_("Last full download"),
+        help_text=_("When were all pledges of the project downloaded"),
+        blank=True,
+        null=True,
+    )
 
     def __str__(self):
         return f"{self.administrative_unit} -{self.event} - auto api"
 
-    def darujme_url(self):
+    def darujme_url(self, from_pledged_date=None):
         url = "https://www.darujme.cz/api/v1/organization/{0}/pledges-by-filter/?apiId={1}&apiSecret={2}&projectId={3}".format(
             self.api_organization_id,
             self.api_id,
             self.api_secret,
             self.project_id,
         )
+        if from_pledged_date:
+            url += f"&fromPledgedDate={from_pledged_date}"
         return url
 
+    def needs_full_download(self):
+        """Return True if all pledges should be downloaded again
+
+        Incremental download only gets new pledges, so new transactions
+        of older (recurrent) pledges are found by periodic full download.
+        """
+        if self.last_pledge_date is None or self.last_full_download is None:
+            return True
+        return self.last_full_download < timezone.now() - datetime.timedelta(
+            hours=settings.DARUJME_FULL_DOWNLOAD_INTERVAL,
+        )
+
+    def incremental_download_date(self):
+        """Return date from which the pledges are downloaded incrementally"""
+        return self.last_pledge_date - datetime.timedelta(
+            days=settings.DARUJME_INCREMENTAL_DOWNLOAD_OVERLAP,
+        )
+
+
+class DarujmePledge(models.Model):
+    """Recent pledge mirrored from the Darujme.cz api
+
+    Paid section check looks here instead of calling the Darujme api.
+    """
+
+    class Meta:
+        verbose_name = _("Darujme pledge")
+        verbose_name_plural = _("Darujme pledges")
+        unique_together = (("api_account", "pledge_id"),)
+        index_together = (("api_account", "email"),)
+
+    api_account = models.ForeignKey(
+        ApiAccount,
+        verbose_name=_("Api Account"),
+        on_delete=models.CASCADE,
+        related_name="pledges",
+    )
+    pledge_id = models.IntegerField(
+        verbose_name=_("Pledge ID"),
+    )
+    email = models.EmailField(
+        verbose_name=_("Donor email"),
+    )
+    pledged_date = models.DateField(
+        verbose_name=_("Pledged date"),
+    )
+    is_paid = models.BooleanField(
+        verbose_name=_("Paid"),
+        help_text=_("Pledge has any successful transaction"),
+        default=False,
+    )
+
+    def __str__(self):
+        return f"{self.api_account} - {self.pledge_id}"
+
 
 class UserBankAccount(models.Model):
     class Meta:
@@ -1676,6 +1799,12 @@ class DonorPaymentChannel(ComputedFieldsModel):
         ("annually", _("Anually")),
     )
     REGULAR_PAYMENT_FREQUENCIES_MAP = dict(REGULAR_PAYMENT_FREQUENCIES)
+    REGULAR_PAYMENTS_PER_YEAR = {
+        "monthly": 12,
+        "quaterly": 4,
+        "biannually": 2,
+        "annually": 1,
+    }
     REGULAR_PAYMENT_CHOICES = (
         ("regular", _("Regular payments")),
         ("onetime", _("No regular payments")),
@@ -2047,17 +2176,30 @@ class DonorPaymentChannel(ComputedFieldsModel):
             return False
 
     def yearly_regular_amount(self):
-        times = {
-            "monthly": 12,
-            "quaterly": 4,
-            "biannually": 2,
-            "annually": 1,
-        }
         if self.regular_frequency and self.regular_amount:
-            return self.regular_amount * times[self.regular_frequency]
+            return (
+                self.regular_amount
+                * self.REGULAR_PAYMENTS_PER_YEAR[self.regular_frequency]
+            )
         else:
             return 0
 
+    @classmethod
+    def yearly_regular_amount_expression(cls):
+        """SQL counterpart of yearly_regular_amount()"""
+        return models.Case(
+            *[
+                models.When(
+                    regular_frequency=frequency,
+                    regular_amount__isnull=False,
+                    then=models.F("regular_amount") * times,
+                )
+                for frequency, times in cls.REGULAR_PAYMENTS_PER_YEAR.items()
+            ],
+            default=models.Value(0),
+            output_field=models.BigIntegerField(),
+        )
+
     def person_name(self):
         try:
             return self.user.__str__()
@@ -2335,6 +2477,445 @@ class Payment(WithAdminUrl, models.Model):
         }
 
 
+@receiver(signals.post_save, sender=Payment)
+@receiver(signals.post_delete, sender=Payment)
+def Payment_changed_invalidate_paid_section(sender, instance, **kwargs):
+    if instance.user_donor_payment_channel_id:
+        invalidate_paid_section(
+            DonorPaymentChannel.objects.filter(
+                pk=instance.user_donor_payment_channel_id,
+            ).values_list("user_id", flat=True),
+        )
+
+
+@receiver(signals.post_save, sender=DonorPaymentChannel)
+@receiver(signals.post_delete, sender=DonorPaymentChannel)
+def DonorPaymentChannel_changed_invalidate_paid_section(sender, instance, **kwargs):
+    invalidate_paid_section([instance.user_id])
+
+
+@receiver(signals.post_save, sender=AdministrativeUnit)
+@receiver(signals.post_delete, sender=AdministrativeUnit)
+def AdministrativeUnit_changed_invalidate_list_filter_choices(sender, **kwargs):
+    invalidate_list_filter_choices()
+
+
+@receiver(signals.pre_save, sender=Payment)
+def Payment_pre_save_old_values(sender, instance, raw, **kwargs):
+    """Values of the stored row, loaded once for the post_save receivers"""
+    instance.old_values = None
+    if instance.pk and not raw:
+        instance.old_values = (
+            Payment.objects.filter(pk=instance.pk)
+            .values("date", "user_donor_payment_channel_id")
+            .first()
+        )
+
+
+@receiver(signals.pre_save, sender=DonorPaymentChannel)
+def DonorPaymentChannel_pre_save_old_values(sender, instance, raw, **kwargs):
+    """Values of the stored row, loaded once for the post_save receivers"""
+    instance.old_values = None
+    if instance.pk and not raw:
+        instance.old_values = (
+            DonorPaymentChannel.objects.filter(pk=instance.pk)
+            .values("user_id", "event_id", "money_account_id", "regular_payments")
+            .first()
+        )
+
+
+@receiver(signals.post_save, sender=Payment)
+@receiver(signals.post_delete, sender=Payment)
+def Payment_changed_invalidate_campaign_statistics(sender, instance, **kwargs):
+    channel_ids = {instance.user_donor_payment_channel_id}
+    old = getattr(instance, "old_values", None)
+    if old:
+        # payment moved from another channel
+        channel_ids.add(old["user_donor_payment_channel_id"])
+    invalidate_campaign_statistics(
+        DonorPaymentChannel.objects.filter(pk__in=channel_ids - {None}).values_list(
+            "event_id", flat=True
+        ),
+    )
+
+
+@receiver(signals.post_save, sender=DonorPaymentChannel)
+@receiver(signals.post_delete, sender=DonorPaymentChannel)
+def DonorPaymentChannel_changed_invalidate_campaign_statistics(
+    sender, instance, **kwargs
+):
+    event_ids = {instance.event_id}
+    old = getattr(instance, "old_values", None)
+    if old:
+        # channel moved from another event
+        event_ids.add(old["event_id"])
+    invalidate_campaign_statistics(event_ids)
+
+
+class ProfileSearchDocument(models.Model):
+    """Searchable text of the profile and its emails, telephones and channels"""
+
+    class Meta:
+        verbose_name = _("Profile search document")
+        verbose_name_plural = _("Profile search documents")
+        indexes = [
+            GinIndex(fields=["vector"], name="aklub_profsearch_vector_gin"),
+            GinIndex(
+                fields=["document"],
+                name="aklub_profsearch_trgm_gin",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
+
+    profile = models.OneToOneField(
+        Profile,
+        verbose_name=_("Profile"),
+        primary_key=True,
+        related_name="search_document",
+        on_delete=models.CASCADE,
+    )
+    document = models.TextField(
+        verbose_name=_("Document"),
+        blank=True,
+    )
+    vector = SearchVectorField(
+        verbose_name=_("Search vector"),
+        null=True,
+    )
+
+
+def update_search_documents(profile_ids, create=True):
+    from .profile_search import update_documents
+
+    update_documents(profile_ids, create)
+
+
+@receiver(signals.post_save, sender=UserProfile)
+@receiver(signals.post_save, sender=CompanyProfile)
+def Profile_saved_search_document(sender, instance, **kwargs):
+    update_search_documents([instance.pk])
+
+
+@receiver(signals.post_save, sender=ProfileEmail)
+@receiver(signals.post_save, sender=Telephone)
+@receiver(signals.post_save, sender=DonorPaymentChannel)
+def Profile_related_saved_search_document(sender, instance, **kwargs):
+    update_search_documents([instance.user_id])
+
+
+@receiver(signals.post_delete, sender=ProfileEmail)
+@receiver(signals.post_delete, sender=Telephone)
+@receiver(signals.post_delete, sender=DonorPaymentChannel)
+def Profile_related_deleted_search_document(sender, instance, **kwargs):
+    # the document can be already deleted together with the profile
+    update_search_documents([instance.user_id], create=False)
+
+
+@receiver(signals.post_save, sender=CompanyContact)
+def CompanyContact_saved_search_document(sender, instance, **kwargs):
+    update_search_documents([instance.company_id])
+
+
+@receiver(signals.post_delete, sender=CompanyContact)
+def CompanyContact_deleted_search_document(sender, instance, **kwargs):
+    update_search_documents([instance.company_id], create=False)
+
+
+class ProfileDuplicate(models.Model):
+    """Profile in the cluster of profiles sharing the normalized contact"""
+
+    class Meta:
+        verbose_name = _("Profile duplicate")
+        verbose_name_plural = _("Profile duplicates")
+        indexes = [
+            models.Index(fields=["kind", "profile"], name="aklub_profdup_kind_profile"),
+            models.Index(fields=["kind", "cluster"], name="aklub_profdup_kind_cluster"),
+        ]
+
+    EMAIL = "email"
+    TELEPHONE = "telephone"
+    NAME = "name"
+    NAME_ADDRESS = "name_address"
+    KIND_CHOICES = (
+        (EMAIL, _("Email")),
+        (TELEPHONE, _("Telephone")),
+        (NAME, _("Name")),
+        (NAME_ADDRESS, _("Name and address")),
+    )
+
+    kind = models.CharField(
+        verbose_name=_("Kind"),
+        max_length=20,
+        choices=KIND_CHOICES,
+    )
+    cluster = models.PositiveIntegerField(
+        verbose_name=_("Cluster"),
+    )
+    key = models.TextField(
+        verbose_name=_("Normalized value"),
+    )
+    profile = models.ForeignKey(
+        Profile,
+        verbose_name=_("Profile"),
+        related_name="duplicates",
+        on_delete=models.CASCADE,
+    )
+
+
+class OutdatedStatisticsMonth(models.Model):
+    """Month of the statistics rollup which has to be computed again"""
+
+    class Meta:
+        verbose_name = _("Outdated statistics month")
+        verbose_name_plural = _("Outdated statistics months")
+        unique_together = (("statistics", "month"),)
+
+    MEMBERS = "members"
+    PAYMENTS = "payments"
+    STATISTICS_CHOICES = (
+        (MEMBERS, _("Members")),
+        (PAYMENTS, _("Payments")),
+    )
+
+    statistics = models.CharField(
+        verbose_name=_("Statistics"),
+        max_length=20,
+        choices=STATISTICS_CHOICES,
+    )
+    month = models.DateField(
+        verbose_name=_("Month"),
+    )
+
+    @classmethod
+    def mark(cls, statistics, dates):
+        cls.objects.bulk_create(
+            [
+                cls(statistics=statistics, month=month)
+                for month in {month_start(date) for date in dates if date}
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class MonthlyMemberStatistics(models.Model):
+    """Monthly rollup of active members by the date they joined"""
+
+    class Meta:
+        verbose_name = _("Monthly member statistics")
+        verbose_name_plural = _("Monthly member statistics")
+
+    month = models.DateField(
+        verbose_name=_("Month"),
+        db_index=True,
+    )
+    administrative_unit = models.ForeignKey(
+        AdministrativeUnit,
+        verbose_name=_("administrative unit"),
+        on_delete=models.CASCADE,
+        null=True,
+    )
+    event = models.ForeignKey(
+        "events.Event",
+        verbose_name=_("Event"),
+        on_delete=models.CASCADE,
+        null=True,
+    )
+    regular = models.PositiveIntegerField(
+        verbose_name=_("Regular"),
+        default=0,
+    )
+    irregular = models.PositiveIntegerField(
+        verbose_name=_("Irregular"),
+        default=0,
+    )
+
+
+class MonthlyPaymentStatistics(models.Model):
+    """Monthly rollup of received payments"""
+
+    class Meta:
+        verbose_name = _("Monthly payment statistics")
+        verbose_name_plural = _("Monthly payment statistics")
+
+    month = models.DateField(
+        verbose_name=_("Month"),
+        db_index=True,
+    )
+    administrative_unit = models.ForeignKey(
+        AdministrativeUnit,
+        verbose_name=_("administrative unit"),
+        on_delete=models.CASCADE,
+        null=True,
+    )
+    event = models.ForeignKey(
+        "events.Event",
+        verbose_name=_("Event"),
+        on_delete=models.CASCADE,
+        null=True,
+    )
+    type = models.CharField(  # noqa
+        verbose_name=_("Type"),
+        max_length=200,
+        blank=True,
+    )
+    amount = models.BigIntegerField(
+        verbose_name=_("Amount"),
+        default=0,
+    )
+    payments = models.PositiveIntegerField(
+        verbose_name=_("Number of payments"),
+        default=0,
+    )
+
+
+@receiver(signals.post_save, sender=Payment)
+def Payment_saved_statistics(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    months = {instance.date}
+    if instance.old_values:
+        months.add(instance.old_values["date"])
+    OutdatedStatisticsMonth.mark(OutdatedStatisticsMonth.PAYMENTS, months)
+
+
+@receiver(signals.post_delete, sender=Payment)
+def Payment_deleted_statistics(sender, instance, **kwargs):
+    OutdatedStatisticsMonth.mark(OutdatedStatisticsMonth.PAYMENTS, [instance.date])
+
+
+@receiver(signals.post_save, sender=DonorPaymentChannel)
+def DonorPaymentChannel_saved_statistics(sender, instance, raw, **kwargs):
+    """Move members and payments of the changed channel in the statistics"""
+    if raw:
+        return
+    old = instance.old_values
+    users = {instance.user_id}
+    payments_moved = False
+    if old is not None:
+        # dashboard charts of payments can be filtered by regular_payments
+        payments_moved = (
+            old["event_id"],
+            old["money_account_id"],
+            old["regular_payments"],
+        ) != (instance.event_id, instance.money_account_id, instance.regular_payments)
+        if payments_moved or old["user_id"] != instance.user_id:
+            users.add(old["user_id"])
+        else:
+            users = set()
+    if users:
+        OutdatedStatisticsMonth.mark(
+            OutdatedStatisticsMonth.MEMBERS,
+            Profile.objects.filter(pk__in=users).values_list("date_joined", flat=True),
+        )
+    if payments_moved:
+        OutdatedStatisticsMonth.mark(
+            OutdatedStatisticsMonth.PAYMENTS,
+            instance.payment_set.dates("date", "month"),
+        )
+
+
+@receiver(signals.pre_delete, sender=DonorPaymentChannel)
+def DonorPaymentChannel_deleted_statistics(sender, instance, **kwargs):
+    OutdatedStatisticsMonth.mark(
+        OutdatedStatisticsMonth.MEMBERS,
+        Profile.objects.filter(pk=instance.user_id).values_list(
+            "date_joined", flat=True
+        ),
+    )
+    OutdatedStatisticsMonth.mark(
+        OutdatedStatisticsMonth.PAYMENTS,
+        instance.payment_set.dates("date", "month"),
+    )
+
+
+@receiver(signals.pre_save, sender=UserProfile)
+@receiver(signals.pre_save, sender=CompanyProfile)
+def Profile_pre_save_statistics(sender, instance, raw, **kwargs):
+    """Members statistics and charts depend on is_active and date_joined"""
+    instance.statistics_months = set()
+    if instance.pk is None:
+        instance.statistics_months = {instance.date_joined}
+    elif not raw:
+        old = (
+            Profile.objects.filter(pk=instance.pk)
+            .values("is_active", "date_joined")
+            .first()
+        )
+        if old and (
+            old["is_active"] != instance.is_active
+            or old["date_joined"] != instance.date_joined
+        ):
+            instance.statistics_months = {old["date_joined"], instance.date_joined}
+
+
+@receiver(signals.post_save, sender=UserProfile)
+@receiver(signals.post_save, sender=CompanyProfile)
+def Profile_saved_statistics(sender, instance, raw, **kwargs):
+    if instance.statistics_months and not raw:
+        OutdatedStatisticsMonth.mark(
+            OutdatedStatisticsMonth.MEMBERS,
+            instance.statistics_months,
+        )
+
+
+@receiver(signals.post_delete, sender=UserProfile)
+@receiver(signals.post_delete, sender=CompanyProfile)
+def Profile_deleted_statistics(sender, instance, **kwargs):
+    OutdatedStatisticsMonth.mark(
+        OutdatedStatisticsMonth.MEMBERS,
+        [instance.date_joined],
+    )
+
+
+@receiver(signals.m2m_changed, sender=Profile.administrative_units.through)
+def Profile_administrative_units_changed_statistics(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Member charts of the administrative units depend on the units of profiles"""
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        dates = [instance.date_joined]
+    elif action == "pre_clear":
+        dates = Profile.objects.filter(administrative_units=instance).values_list(
+            "date_joined", flat=True
+        )
+    else:
+        dates = Profile.objects.filter(pk__in=pk_set).values_list(
+            "date_joined", flat=True
+        )
+    OutdatedStatisticsMonth.mark(OutdatedStatisticsMonth.MEMBERS, dates)
+
+
+@receiver(signals.pre_save, sender=BankAccount)
+@receiver(signals.pre_save, sender=ApiAccount)
+def MoneyAccount_pre_save_statistics(sender, instance, raw, **kwargs):
+    """Payment charts of the administrative units depend on the money account unit"""
+    instance.statistics_unit_changed = False
+    if instance.pk and not raw:
+        old = (
+            MoneyAccount.objects.filter(pk=instance.pk)
+            .values("administrative_unit_id")
+            .first()
+        )
+        instance.statistics_unit_changed = (
+            old is not None
+            and old["administrative_unit_id"] != instance.administrative_unit_id
+        )
+
+
+@receiver(signals.post_save, sender=BankAccount)
+@receiver(signals.post_save, sender=ApiAccount)
+def MoneyAccount_saved_statistics(sender, instance, raw, **kwargs):
+    if instance.statistics_unit_changed and not raw:
+        OutdatedStatisticsMonth.mark(
+            OutdatedStatisticsMonth.PAYMENTS,
+            Payment.objects.filter(
+                user_donor_payment_channel__money_account=instance,
+            ).dates("date", "month"),
+        )
+
+
 COMMUNICATION_TYPE = (
     ("mass", _("Mass")),
     ("auto", _("Automatic")),
@@ -2665,6 +3246,29 @@ class TaxConfirmation(models.Model):
         null=True,
         blank=True,
     )
+    pdf_rendered = models.BooleanField(
+        verbose_name=_("PDF rendered"),
+        help_text=_("PDF file is rendered with the current amount"),
+        default=False,
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "amount" in field_names and "pdf_type_id" in field_names:
+            instance._rendered_values = (instance.amount, instance.pdf_type_id)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """PDF file has to be rendered again after the amount or PDF type change"""
+        rendered_values = getattr(self, "_rendered_values", None)
+        if rendered_values and rendered_values != (self.amount, self.pdf_type_id):
+            self.pdf_rendered = False
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "pdf_rendered"}
+        super().save(*args, **kwargs)
+        self._rendered_values = (self.amount, self.pdf_type_id)
 
     def get_pdf(self):
         try:
@@ -2706,6 +3310,62 @@ class TaxConfirmation(models.Model):
 
     sandwich_model = TaxConfirmationPdf
 
+    @classmethod
+    def make_tax_confirmations(cls, profiles_ids, year, unit, pdf_type):
+        """Create or update tax confirmations of all the profiles at once
+
+        Yearly amounts of all profiles are summed by one grouped query
+        and the confirmations are written by bulk queries.
+
+        Return tuple (confirmations, created count, updated count)
+        """
+        amounts = dict(
+            Payment.objects.filter(
+                user_donor_payment_channel__user__in=profiles_ids,
+                user_donor_payment_channel__money_account__administrative_unit=unit,
+                date__year=year,
+            )
+            .exclude(type="expected")
+            .order_by()
+            .values("user_donor_payment_channel__user")
+            .annotate(amount=Sum("amount"))
+            .filter(amount__gt=0)
+            .values_list("user_donor_payment_channel__user", "amount")
+        )
+        confirmations = []
+        for confirmation in cls.objects.filter(
+            user_profile__in=amounts.keys(),
+            year=year,
+            pdf_type=pdf_type,
+        ):
+            confirmation.amount = amounts[confirmation.user_profile_id]
+            confirmation.pdf_rendered = False
+            confirmations.append(confirmation)
+        cls.objects.bulk_update(
+            confirmations, ["amount", "pdf_rendered"], batch_size=1000
+        )
+        updated_profiles = {
+            confirmation.user_profile_id for confirmation in confirmations
+        }
+        new_confirmations = cls.objects.bulk_create(
+            [
+                cls(
+                    user_profile_id=profile_id,
+                    year=year,
+                    pdf_type=pdf_type,
+                    amount=amount,
+                )
+                for profile_id, amount in sorted(amounts.items())
+                if profile_id not in updated_profiles
+            ],
+            batch_size=1000,
+        )
+        return (
+            confirmations + new_confirmations,
+            len(new_confirmations),
+            len(confirmations),
+        )
+
     def get_sandwich_type(self):
         return self.pdf_type
 
@@ -2760,6 +3420,155 @@ class TaxConfirmation(models.Model):
         verbose_name_plural = _("Tax confirmations")
 
 
+class TaxConfirmationRun(models.Model):
+    """One run of the yearly tax confirmations generation"""
+
+    class Meta:
+        verbose_name = _("Tax confirmation run")
+        verbose_name_plural = _("Tax confirmation runs")
+        ordering = ("-created",)
+
+    year = models.PositiveIntegerField(verbose_name=_("Year"))
+    pdf_type = models.ForeignKey(
+        "smmapdfs.PdfSandwichType",
+        verbose_name=_("PDF type"),
+        on_delete=models.SET_NULL,
+        null=True,
+    )
+    administrative_unit = models.ForeignKey(
+        AdministrativeUnit,
+        verbose_name=_("administrative unit"),
+        on_delete=models.CASCADE,
+    )
+    created_by = models.ForeignKey(
+        Profile,
+        verbose_name=_("Created by"),
+        related_name="tax_confirmation_runs",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    created = models.DateTimeField(
+        verbose_name=_("Created"),
+        auto_now_add=True,
+    )
+    finished = models.DateTimeField(
+        verbose_name=_("Finished"),
+        help_text=_("Last time when all the profiles of the run were processed"),
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return (
+            f"{self.year} - {self.administrative_unit} ({self.created:%Y-%m-%d %H:%M})"
+        )
+
+    @classmethod
+    def start(cls, year, profiles_ids, pdf_type, created_by=None):
+        run = cls.objects.create(
+            year=year,
+            pdf_type=pdf_type,
+            administrative_unit=pdf_type.pdfsandwichtypeconnector.administrative_unit,
+            created_by=created_by,
+        )
+        TaxConfirmationRunProfile.objects.bulk_create(
+            [
+                TaxConfirmationRunProfile(run=run, profile_id=profile_id)
+                for profile_id in set(profiles_ids)
+            ],
+            batch_size=1000,
+        )
+        return run
+
+    def get_progress(self):
+        """Return number of profiles by status"""
+        progress = dict.fromkeys(
+            (status for status, name in TaxConfirmationRunProfile.STATUS_CHOICES),
+            0,
+        )
+        progress.update(
+            self.run_profiles.order_by()
+            .values("status")
+            .annotate(count=Count("id"))
+            .values_list("status", "count")
+        )
+        return progress
+
+    def resume_failed(self):
+        """Mark failed profiles to be processed again, return their count"""
+        self.finished = None
+        self.save(update_fields=["finished"])
+        return self.run_profiles.filter(
+            status=TaxConfirmationRunProfile.FAILED,
+        ).update(status=TaxConfirmationRunProfile.PENDING, error="")
+
+    def check_finished(self):
+        if not self.run_profiles.filter(
+            status__in=(
+                TaxConfirmationRunProfile.PENDING,
+                TaxConfirmationRunProfile.CREATED,
+            ),
+        ).exists():
+            self.finished = timezone.now()
+            self.save(update_fields=["finished"])
+
+
+class TaxConfirmationRunProfile(models.Model):
+    """State of one profile in the tax confirmation run"""
+
+    class Meta:
+        verbose_name = _("Tax confirmation run profile")
+        verbose_name_plural = _("Tax confirmation run profiles")
+        unique_together = (("run", "profile"),)
+        index_together = (("run", "status"),)
+
+    PENDING = "pending"
+    CREATED = "created"
+    FAILED = "failed"
+    PDF_DONE = "pdf_done"
+    NO_PAYMENTS = "no_payments"
+    STATUS_CHOICES = (
+        (PENDING, _("Pending")),
+        (CREATED, _("Tax confirmation created")),
+        (FAILED, _("Failed")),
+        (PDF_DONE, _("PDF done")),
+        (NO_PAYMENTS, _("No payments")),
+    )
+
+    run = models.ForeignKey(
+        TaxConfirmationRun,
+        verbose_name=_("Tax confirmation run"),
+        related_name="run_profiles",
+        on_delete=models.CASCADE,
+    )
+    profile = models.ForeignKey(
+        Profile,
+        verbose_name=_("Profile"),
+        on_delete=models.CASCADE,
+    )
+    tax_confirmation = models.ForeignKey(
+        TaxConfirmation,
+        verbose_name=_("Tax confirmation"),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(
+        verbose_name=_("Status"),
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    error = models.TextField(
+        verbose_name=_("Error"),
+        blank=True,
+    )
+
+    def __str__(self):
+        return f"{self.run} - {self.profile_id}"
+
+
 User._meta.get_field("email").__dict__["_unique"] = True
 
 
@@ -2832,31 +3641,100 @@ def get_time_series(
         aggregate_dict["agg_%i" % i] = self.get_operation(dkwargs)
 
     # TODO: maybe backport values_list support back to django-qsstats-magic and use it again for the query
-    time_range = {"%s__range" % self.date_field_name: (time_since, time_until)}
     qs = model_name.objects
-    qs = qs.filter(**time_range)
     qs = qs.filter(**kwargs)
     # this lines are added
-    if not request.user.has_perm("aklub.can_edit_all_units"):
+    unit_access = get_unit_access(request)
+    if not unit_access.all_units:
         qs = qs.filter(
-            **{
-                administrative_unit_extra_filters[
-                    self.model_name
-                ]: request.user.administrated_units.all()
-            }
+            **{administrative_unit_extra_filters[self.model_name]: unit_access.unit_ids}
         )
     # ^^^
-    kind = interval[:-1]
-    qs = qs.annotate(d=Trunc(self.date_field_name, kind))
-    qs = qs.values_list("d")
-    qs = qs.order_by("d")
-    qs = qs.annotate(**aggregate_dict)
-    return qs
+    from .time_series import get_values
+
+    return get_values(
+        self,
+        request,
+        qs,
+        kwargs,
+        dynamic_kwargs,
+        aggregate_dict,
+        time_since,
+        time_until,
+        interval[:-1],
+    )
 
 
 DashboardStats.add_to_class("get_time_series", get_time_series)
 
 
+class DashboardTimeSeries(models.Model):
+    """Materialized dashboard chart of one administrative unit
+
+    Buckets between covered_since and covered_until are stored.
+    """
+
+    class Meta:
+        verbose_name = _("Dashboard time series")
+        verbose_name_plural = _("Dashboard time series")
+        unique_together = (("stats", "administrative_unit", "interval", "criteria"),)
+
+    stats = models.ForeignKey(
+        DashboardStats,
+        verbose_name=_("Dashboard stats"),
+        on_delete=models.CASCADE,
+    )
+    administrative_unit = models.ForeignKey(
+        AdministrativeUnit,
+        verbose_name=_("administrative unit"),
+        help_text=_("Empty for all administrative units"),
+        on_delete=models.CASCADE,
+        null=True,
+    )
+    interval = models.CharField(
+        verbose_name=_("Interval"),
+        max_length=10,
+    )
+    criteria = models.CharField(
+        verbose_name=_("Criteria"),
+        help_text=_("Hash of the chart criteria"),
+        max_length=32,
+    )
+    covered_since = models.DateTimeField(
+        verbose_name=_("Covered since"),
+        null=True,
+    )
+    covered_until = models.DateTimeField(
+        verbose_name=_("Covered until"),
+        null=True,
+    )
+
+
+class DashboardTimeSeriesValue(models.Model):
+    class Meta:
+        verbose_name = _("Dashboard time series value")
+        verbose_name_plural = _("Dashboard time series values")
+        unique_together = (("series", "bucket"),)
+
+    series = models.ForeignKey(
+        DashboardTimeSeries,
+        verbose_name=_("Dashboard time series"),
+        related_name="buckets",
+        on_delete=models.CASCADE,
+    )
+    bucket = models.DateTimeField(
+        verbose_name=_("Bucket"),
+    )
+    values = JSONField(
+        verbose_name=_("Values"),
+    )
+
+
+@receiver(signals.post_save, sender=DashboardStats)
+def DashboardStats_changed_time_series(sender, instance, **kwargs):
+    DashboardTimeSeries.objects.filter(stats=instance).delete()
+
+
 class CompanyType(models.Model):
     class Meta:
         verbose_name = _("Company type")
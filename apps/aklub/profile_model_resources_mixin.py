@@ -116,9 +116,9 @@ def import_obj(self, obj, data, dry_run):  # noqa
 
     if obj.is_userprofile():
         if data.get("telephone"):
-            check["telephone"], _ = Telephone.objects.get_or_create(
-                telephone=data["telephone"],
-                user=obj,
+            check["telephone"], _ = Telephone.objects.get_or_create_number(
+                data["telephone"],
+                obj,
                 defaults={"is_primary": True},
             )
         if data.get("email"):
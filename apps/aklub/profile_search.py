@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+""" Full-text and trigram search of the profiles """
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.transaction import atomic
+
+from .models import (
+    CompanyContact,
+    CompanyProfile,
+    DonorPaymentChannel,
+    Profile,
+    ProfileEmail,
+    ProfileSearchDocument,
+    Telephone,
+    UserProfile,
+)
+
+SEARCH_CONFIG = "simple"
+
+# (model, profile field, searched fields)
+DOCUMENT_FIELDS = (
+    (Profile, "pk", ("username", "email", "city")),
+    (
+        UserProfile,
+        "pk",
+        (
+            "title_before",
+            "first_name",
+            "last_name",
+            "title_after",
+            "nickname",
+            "maiden_name",
+        ),
+    ),
+    (CompanyProfile, "pk", ("name", "crn", "tin")),
+    (ProfileEmail, "user", ("email",)),
+    (Telephone, "user", ("telephone",)),
+    (DonorPaymentChannel, "user", ("VS",)),
+    (
+        CompanyContact,
+        "company",
+        ("contact_first_name", "contact_last_name", "email", "telephone"),
+    ),
+)
+
+
+def get_documents(profile_ids):
+    """Lowercase search documents of the existing profiles, by a query per model"""
+    words = {
+        profile_id: []
+        for profile_id in Profile.objects.filter(pk__in=profile_ids).values_list(
+            "pk", flat=True
+        )
+    }
+    for model, profile_field, fields in DOCUMENT_FIELDS:
+        rows = model.objects.filter(**{f"{profile_field}__in": list(words)})
+        for profile_id, *values in rows.values_list(profile_field, *fields):
+            words[profile_id].extend(str(value) for value in values if value)
+    return {
+        profile_id: " ".join(values).lower() for profile_id, values in words.items()
+    }
+
+
+@atomic
+def update_documents(profile_ids, create=True):
+    """
+    Compute the documents of the profiles again,
+    missing documents are created only if create is True
+    """
+    profile_ids = set(profile_ids) - {None}
+    documents = [
+        ProfileSearchDocument(profile_id=profile_id, document=document)
+        for profile_id, document in get_documents(profile_ids).items()
+    ]
+    if create:
+        ProfileSearchDocument.objects.bulk_create(documents, ignore_conflicts=True)
+    ProfileSearchDocument.objects.bulk_update(documents, ["document"], batch_size=1000)
+    ProfileSearchDocument.objects.filter(pk__in=profile_ids).update(
+        vector=SearchVector("document", config=SEARCH_CONFIG),
+    )
+
+
+def rebuild_all(batch_size=1000):
+    profile_ids = Profile.objects.order_by("pk").values_list("pk", flat=True)
+    last_id = 0
+    while True:
+        batch = list(profile_ids.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        update_documents(batch)
+        last_id = batch[-1]
+
+
+def search(queryset, search_term):
+    """
+    Profiles containing all the words of the search term,
+    ordered by relevance annotated as search_rank
+    """
+    bits = search_term.lower().split()
+    if not bits:
+        return queryset
+    query = SearchQuery(" ".join(bits), config=SEARCH_CONFIG)
+    contains = Q()
+    for bit in bits:
+        contains &= Q(document__contains=bit)
+    matching = Q(vector=query) | contains
+    if search_term.strip().isdigit():
+        matching |= Q(profile_id=int(search_term))
+    documents = ProfileSearchDocument.objects.filter(matching)
+    rank = (
+        documents.filter(profile=OuterRef("pk"))
+        .annotate(
+            rank=SearchRank(F("vector"), query)
+            + TrigramSimilarity("document", " ".join(bits)),
+        )
+        .values("rank")
+    )
+    return (
+        queryset.filter(pk__in=documents.values("profile"))
+        .annotate(search_rank=Subquery(rank))
+        .order_by("-search_rank", "pk")
+    )
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+""" Monthly rollups of the member and payment statistics """
+import datetime
+import functools
+import operator
+
+from django.core.cache import cache
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.db.transaction import atomic
+
+from . import time_series
+from .models import (
+    DonorPaymentChannel,
+    MonthlyMemberStatistics,
+    MonthlyPaymentStatistics,
+    OutdatedStatisticsMonth,
+    Payment,
+)
+
+# outdated months are refreshed by one task at a time,
+# the lock expires after X seconds if the task dies
+REFRESH_LOCK_KEY = "statistics_rollups_refresh_lock"
+REFRESH_LOCK_TIMEOUT = 60 * 60
+
+
+def next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def compute_members(months=None):
+    channels = DonorPaymentChannel.objects.filter(user__is_active=True).annotate(
+        month=TruncMonth("user__date_joined", output_field=DateField()),
+    )
+    if months is not None:
+        channels = channels.filter(month__in=months)
+    return [
+        MonthlyMemberStatistics(
+            month=row["month"],
+            administrative_unit_id=row["money_account__administrative_unit"],
+            event_id=row["event"],
+            regular=row["regular"],
+            irregular=row["irregular"],
+        )
+        for row in channels.order_by()
+        .values("month", "money_account__administrative_unit", "event")
+        .annotate(
+            regular=Count("id", filter=Q(regular_payments="regular")),
+            irregular=Count("id", filter=~Q(regular_payments="regular")),
+        )
+    ]
+
+
+def compute_payments(months=None):
+    payments = Payment.objects.exclude(type="expected")
+    if months is not None:
+        payments = payments.filter(
+            functools.reduce(
+                operator.or_,
+                (Q(date__gte=month, date__lt=next_month(month)) for month in months),
+                Q(pk__in=[]),
+            ),
+        )
+    return [
+        MonthlyPaymentStatistics(
+            month=row["month"],
+            administrative_unit_id=row[
+                "user_donor_payment_channel__money_account__administrative_unit"
+            ],
+            event_id=row["user_donor_payment_channel__event"],
+            type=row["type"],
+            amount=row["amount"],
+            payments=row["payments"],
+        )
+        for row in payments.annotate(month=TruncMonth("date"))
+        .order_by()
+        .values(
+            "month",
+            "user_donor_payment_channel__money_account__administrative_unit",
+            "user_donor_payment_channel__event",
+            "type",
+        )
+        .annotate(
+            amount=Sum("amount"),
+            payments=Count("user_donor_payment_channel"),
+        )
+    ]
+
+
+ROLLUPS = {
+    OutdatedStatisticsMonth.MEMBERS: (MonthlyMemberStatistics, compute_members),
+    OutdatedStatisticsMonth.PAYMENTS: (MonthlyPaymentStatistics, compute_payments),
+}
+
+
+def rebuild(statistics, months=None):
+    """Compute the rollup rows of the months again, all months by default"""
+    model, compute = ROLLUPS[statistics]
+    rows = model.objects.all()
+    if months is not None:
+        rows = rows.filter(month__in=months)
+    rows.delete()
+    model.objects.bulk_create(compute(months), batch_size=1000)
+
+
+@atomic
+def refresh_outdated(statistics):
+    """Compute again only the months changed since the last refresh"""
+    outdated = list(
+        OutdatedStatisticsMonth.objects.select_for_update(
+            skip_locked=True,
+        ).filter(statistics=statistics)
+    )
+    if outdated:
+        # locked rows are deleted before the rebuild, so months changed
+        # during the rebuild are marked by new rows after the commit
+        OutdatedStatisticsMonth.objects.filter(
+            pk__in=[outdated_month.pk for outdated_month in outdated],
+        ).delete()
+        months = {outdated_month.month for outdated_month in outdated}
+        rebuild(statistics, months)
+        time_series.invalidate(statistics, months)
+
+
+def refresh_all_outdated():
+    try:
+        for statistics in ROLLUPS:
+            refresh_outdated(statistics)
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+
+
+def request_refresh(statistics):
+    """Start the refresh task, if there are outdated months of the statistics"""
+    if OutdatedStatisticsMonth.objects.filter(
+        statistics=statistics
+    ).exists() and cache.add(REFRESH_LOCK_KEY, 1, REFRESH_LOCK_TIMEOUT):
+        from .tasks import refresh_statistics_rollups
+
+        refresh_statistics_rollups.delay()
+
+
+@atomic
+def rebuild_all():
+    OutdatedStatisticsMonth.objects.all().delete()
+    for statistics in ROLLUPS:
+        rebuild(statistics)
+
+
+def by_months(statistics, **sums):
+    """
+    Sum the rollup by months, with running total of the "total" sum
+
+    The stored rollup is read as is, the outdated months are refreshed
+    by the refresh_statistics_rollups task.
+    """
+    model = ROLLUPS[statistics][0]
+    rows = list(model.objects.order_by("month").values("month").annotate(**sums))
+    run_total = 0
+    for row in rows:
+        run_total += row["total"]
+        row["run_total"] = run_total
+    return rows, run_total
+
+
+def members_by_months():
+    return by_months(
+        OutdatedStatisticsMonth.MEMBERS,
+        regular=Sum("regular"),
+        irregular=Sum("irregular"),
+        total=Sum(F("regular") + F("irregular")),
+    )
+
+
+def payments_by_months():
+    return by_months(
+        OutdatedStatisticsMonth.PAYMENTS,
+        total=Sum("amount"),
+        donors=Sum("payments"),
+    )
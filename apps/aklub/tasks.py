@@ -3,21 +3,20 @@ from urllib.parse import urlparse
 
 import redis
 
-from celery import task
+from celery import group, task
 
 from django.conf import settings
 from django.core.management import call_command
 from django.utils import dateformat, timezone
 from django.utils.translation import ugettext_lazy as _
 
+from notifications.signals import notify
+
 from notifications_edit.utils import send_notification_to_is_staff_members
 
 from oauth2_provider.models import clear_expired
 
-import smmapdfs.actions
-from smmapdfs.models import PdfSandwichType
-
-from . import darujme
+from . import dashboard, darujme, duplicates, stat_rollups, tax_confirmations, utils
 from aklub import models
 from .autocom import check
 from .sync_with_daktela_app import (
@@ -46,44 +45,134 @@ def check_darujme():
     darujme.check_for_new_payments()
 
 
+@task()
+def refresh_darujme_pledges():
+    darujme.refresh_pledge_mirror()
+
+
+@task()
+def refresh_statistics_rollups():
+    stat_rollups.refresh_all_outdated()
+
+
+@task()
+def precompute_dashboard_conditions():
+    dashboard.precompute_conditions()
+
+
+@task()
+def refresh_profile_duplicates():
+    duplicates.rebuild()
+
+
+@task()
+def show_payments_by_year(channels_pks, user_pk):
+    user = models.Profile.objects.get(pk=user_pk)
+    lines = utils.payments_by_year_lines(utils.payments_by_year(channels_pks))
+    notify.send(
+        sender=user,
+        recipient=user,
+        verb=_("Payments by year"),
+        description=", ".join(lines),
+    )
+
+
 @task()
 def post_office_send_mail():
     call_command("send_queued_mail", processes=1)
 
 
 @task()
-def generate_tax_confirmations(year, profiles_ids, pdf_type_id):
+def generate_tax_confirmations(run_id):
+    """Create tax confirmations of the pending profiles of the run"""
     started = timezone.now()
-    payed = models.Payment.objects.filter(date__year=year).exclude(type="expected")
-    users = models.Profile.objects.filter(
-        userchannels__payment__in=payed, id__in=profiles_ids
-    ).distinct()
-    pdf_type = PdfSandwichType.objects.get(id=pdf_type_id)
-    unit = pdf_type.pdfsandwichtypeconnector.administrative_unit
-    confirmations = []
-    logger.info(f"Starting creating tax confirmation for users total: {users.count()}")
-    for index, user in enumerate(users, start=1):
-        try:
-            logger.info(f"Creating Tax Confirmation for user: {index}) {user}")
-            confirmation, created = user.make_tax_confirmation(year, unit, pdf_type)
-        except Exception as e:  # noqa
-            logger.info(f"Creating Tax Confirmation for user: {user} FAILED {e}!!")
-        # we want to rewrite existed confirmations,
-        # but we dont want to send null values to PdfSandwich cuz it raise bug and pdf is not created
-        if confirmation:
-            confirmations.append(confirmation)
-    smmapdfs.actions.make_pdfsandwich(None, None, confirmations)
+    run = models.TaxConfirmationRun.objects.select_related(
+        "pdf_type",
+        "administrative_unit",
+    ).get(id=run_id)
+    run_profiles = list(
+        run.run_profiles.filter(status=models.TaxConfirmationRunProfile.PENDING)
+    )
+    logger.info(
+        f"Starting creating tax confirmation for profiles total: {len(run_profiles)}"
+    )
+    try:
+        (
+            confirmations,
+            created,
+            updated,
+        ) = models.TaxConfirmation.make_tax_confirmations(
+            [run_profile.profile_id for run_profile in run_profiles],
+            run.year,
+            run.administrative_unit,
+            run.pdf_type,
+        )
+    except Exception as e:  # noqa
+        logger.error(f"Creating Tax Confirmations of run {run_id} FAILED {e}!!")
+        tax_confirmations.mark_failed(run_profiles, e)
+        confirmations, created, updated = [], 0, 0
+    else:
+        logger.info(f"Tax Confirmations created: {created} updated: {updated}")
+        tax_confirmations.mark_created(run_profiles, confirmations)
+    run.check_finished()
+    dispatch_tax_confirmation_pdfs(
+        [confirmation.id for confirmation in confirmations],
+        run_id,
+    )
     send_notification_to_is_staff_members(
-        unit,
+        run.administrative_unit,
         _("Tax Confirmation done"),
-        _("Task started at  %(started)s was done for  %(users)s profiles")
+        _(
+            "Task started at  %(started)s was done for  %(users)s profiles, "
+            "%(created)s tax confirmations were created, "
+            "%(updated)s were updated and %(failed)s failed"
+        )
         % {
             "started": dateformat.format(started, "Y-m-d H:i:s"),
-            "users": users.count(),
+            "users": len(run_profiles),
+            "created": created,
+            "updated": updated,
+            "failed": run.get_progress()[models.TaxConfirmationRunProfile.FAILED],
         },
     )
 
 
+@task()
+def resume_tax_confirmation_run(run_id):
+    """Process again only the failed profiles of the run"""
+    run = models.TaxConfirmationRun.objects.get(id=run_id)
+    if run.resume_failed():
+        generate_tax_confirmations(run_id)
+
+
+def dispatch_tax_confirmation_pdfs(confirmations_ids, run_id=None):
+    """Render PDFs in chunks by parallel celery tasks"""
+    group(
+        make_tax_confirmation_pdfs.s(chunk, run_id)
+        for chunk in tax_confirmations.chunks(confirmations_ids)
+    ).apply_async()
+
+
+@task()
+def make_tax_confirmation_pdfs(confirmations_ids, run_id=None):
+    failed = tax_confirmations.make_pdfs(confirmations_ids)
+    if failed:
+        logger.info(f"Creating Tax Confirmation PDFs FAILED for: {list(failed)}")
+    if run_id is not None:
+        tax_confirmations.mark_pdfs_done(run_id, confirmations_ids, failed)
+
+
+@task()
+def make_missing_tax_confirmation_pdfs(confirmations_ids):
+    """Resume PDF rendering, only not rendered PDFs are created"""
+    dispatch_tax_confirmation_pdfs(
+        models.TaxConfirmation.objects.filter(
+            id__in=confirmations_ids,
+            pdf_rendered=False,
+        ).values_list("id", flat=True)
+    )
+
+
 @task()
 def send_communication_task(
     mass_communication_id, communication_type, profile, sending_user_id
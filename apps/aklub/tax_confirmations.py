@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+""" Render Tax Confirmation PDF files in chunks """
+import logging
+import uuid
+import zipfile
+from io import BytesIO
+
+from PyPDF2 import PdfFileReader, PdfFileWriter
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils.translation import ugettext as _
+
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .models import (
+    TaxConfirmation,
+    TaxConfirmationField,
+    TaxConfirmationPdf,
+    TaxConfirmationRun,
+    TaxConfirmationRunProfile,
+)
+
+logger = logging.getLogger(__name__)
+
+# fonts are registered and PDF templates are read only once per worker process
+registered_fonts = set()
+template_pdfs = {}
+
+
+def register_fonts(fields):
+    for field in fields:
+        key = (field.font.pk, field.font.ttf.name)
+        if key not in registered_fonts:
+            pdfmetrics.registerFont(TTFont(field.font.name, field.font.ttf.open("rb")))
+            registered_fonts.add(key)
+
+
+def get_template_pdf(pdf_type):
+    key = (pdf_type.pk, pdf_type.template_pdf.name)
+    if key not in template_pdfs:
+        template_pdf = pdf_type.template_pdf.open("rb")
+        try:
+            template_pdfs[key] = template_pdf.read()
+        finally:
+            template_pdf.close()
+    return template_pdfs[key]
+
+
+def chunks(items, size=None):
+    size = size or settings.TAX_CONFIRMATION_PDF_CHUNK_SIZE
+    items = list(items)
+    for start in range(0, len(items), size):
+        end = start + size
+        yield items[start:end]
+
+
+def render_pdf(sandwich, confirmation, fields):
+    """
+    same as smmapdfs PdfSandwichABC.update_pdf(), but with preloaded
+    fields, fonts and template
+    """
+    pdf_type = confirmation.pdf_type
+    sandwich.status = ""
+    packet = BytesIO()
+    can = canvas.Canvas(packet, pagesize=(pdf_type.height * mm, pdf_type.width * mm))
+    for field in fields:
+        field.draw_on_canvas(can, confirmation)
+    can.save()
+    packet.seek(0)
+    page = PdfFileReader(BytesIO(get_template_pdf(pdf_type)), strict=False).getPage(0)
+    try:
+        page.mergePage(PdfFileReader(packet).getPage(0))
+    except IndexError:
+        sandwich.status += _("\nNo fields rendered.\n")
+    output = PdfFileWriter()
+    output.addPage(page)
+    pdf = BytesIO()
+    output.write(pdf)
+
+    try:
+        sandwich.pdf.delete(save=False)
+    except ValueError:
+        pass
+    sandwich.pdf.save(
+        "%s/pdfsandwich_%s.pdf" % (pdf_type.name, uuid.uuid4()),
+        ContentFile(pdf.getvalue()),
+        save=False,
+    )
+    sandwich.save()
+
+
+def make_pdfs(confirmations_ids):
+    """
+    Render PDFs of the tax confirmations which are not rendered yet,
+    so the chunk can be safely run again after failure
+
+    Return dict of failed confirmations ids with error messages
+    """
+    confirmations = TaxConfirmation.objects.filter(
+        id__in=confirmations_ids,
+        pdf_rendered=False,
+        pdf_type__isnull=False,
+    ).select_related("pdf_type__pdfsandwichtypeconnector__administrative_unit")
+    sandwiches = {
+        (sandwich.obj_id, sandwich.pdfsandwich_type_id): sandwich
+        for sandwich in TaxConfirmationPdf.objects.filter(obj__in=confirmations)
+    }
+    fields = {}
+    rendered = []
+    failed = {}
+    try:
+        for confirmation in confirmations:
+            try:
+                if confirmation.pdf_type_id not in fields:
+                    fields[confirmation.pdf_type_id] = list(
+                        TaxConfirmationField.objects.filter(
+                            pdfsandwich_type_id=confirmation.pdf_type_id,
+                        ).select_related("font")
+                    )
+                    register_fonts(fields[confirmation.pdf_type_id])
+                sandwich = sandwiches.get(
+                    (confirmation.id, confirmation.pdf_type_id),
+                    TaxConfirmationPdf(
+                        obj=confirmation,
+                        pdfsandwich_type_id=confirmation.pdf_type_id,
+                    ),
+                )
+                render_pdf(sandwich, confirmation, fields[confirmation.pdf_type_id])
+            except Exception as e:  # noqa
+                logger.error(
+                    f"Creating Tax Confirmation PDF: {confirmation.id} FAILED {e}!!"
+                )
+                failed[confirmation.id] = str(e)
+            else:
+                rendered.append(confirmation.id)
+    finally:
+        TaxConfirmation.objects.filter(id__in=rendered).update(pdf_rendered=True)
+    return failed
+
+
+def mark_created(run_profiles, confirmations):
+    """Store created confirmations to the run profiles"""
+    confirmations = {
+        confirmation.user_profile_id: confirmation for confirmation in confirmations
+    }
+    for run_profile in run_profiles:
+        run_profile.tax_confirmation = confirmations.get(run_profile.profile_id)
+        if run_profile.tax_confirmation:
+            run_profile.status = TaxConfirmationRunProfile.CREATED
+        else:
+            run_profile.status = TaxConfirmationRunProfile.NO_PAYMENTS
+        run_profile.error = ""
+    TaxConfirmationRunProfile.objects.bulk_update(
+        run_profiles,
+        ["tax_confirmation", "status", "error"],
+        batch_size=1000,
+    )
+
+
+def mark_failed(run_profiles, error):
+    TaxConfirmationRunProfile.objects.filter(
+        id__in=[run_profile.id for run_profile in run_profiles],
+    ).update(status=TaxConfirmationRunProfile.FAILED, error=str(error))
+
+
+def mark_pdfs_done(run_id, confirmations_ids, failed):
+    """Store PDF rendering result of the chunk to the run profiles"""
+    run_profiles = TaxConfirmationRunProfile.objects.filter(
+        run_id=run_id,
+        tax_confirmation__in=confirmations_ids,
+        status=TaxConfirmationRunProfile.CREATED,
+    )
+    run_profiles.filter(tax_confirmation__pdf_rendered=True).update(
+        status=TaxConfirmationRunProfile.PDF_DONE,
+    )
+    for confirmation_id, error in failed.items():
+        run_profiles.filter(tax_confirmation=confirmation_id).update(
+            status=TaxConfirmationRunProfile.FAILED,
+            error=error,
+        )
+    TaxConfirmationRun.objects.get(id=run_id).check_finished()
+
+
+class ZipStream:
+    """Not seekable file object, which collects written data until popped"""
+
+    def __init__(self):
+        self.data = []
+        self.position = 0
+
+    def write(self, data):
+        self.data.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.data)
+        self.data = []
+        return data
+
+
+def iter_pdfs_zip(pdfs):
+    """
+    Yield ZIP archive of the PDF files chunk by chunk,
+    so neither the archive nor the files are held in memory
+
+    pdfs is iterable of tuples (name in archive, name in storage)
+    """
+    storage = TaxConfirmationPdf._meta.get_field("pdf").storage
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for archive_name, file_name in pdfs:
+            try:
+                pdf = storage.open(file_name, "rb")
+            except OSError as e:
+                logger.error(f"Tax Confirmation PDF {file_name} is missing {e}!!")
+                continue
+            with pdf, archive.open(archive_name, mode="w") as archive_file:
+                for chunk in pdf.chunks():
+                    archive_file.write(chunk)
+                    yield stream.pop()
+            yield stream.pop()
+    yield stream.pop()
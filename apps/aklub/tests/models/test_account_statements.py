@@ -18,21 +18,31 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+import copy
 import datetime
+import io
 import json
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
+from django.core.cache import cache
 from django.core.files import File
 from django.test import TestCase
+from django.utils import timezone
 from django.test.utils import override_settings
 
+from freezegun import freeze_time
+
 from model_mommy import mommy
 
+import requests
+
 from ..utils import RunCommitHooksMixin
 from ... import darujme
+from ...utils import campaign_statistics_cache_key
 from aklub.models import (
     AccountStatements,
     AdministrativeUnit,
+    DarujmePledge,
     DonorPaymentChannel,
     Payment,
     ProfileEmail,
@@ -369,11 +379,20 @@ class TestDarujmeCheck(TestCase):
             administrative_unit=self.unit1,
         )
 
-    @patch("aklub.darujme.requests.get")
+    def mock_darujme_response(self, mock_get, response=None):
+        """Every call of the mocked requests.get streams the whole response"""
+        if response is None:
+            with open("apps/aklub/test_data/darujme_response.json") as json_file:
+                response = json.load(json_file)
+        content = json.dumps(response).encode()
+        mock_get.side_effect = lambda *args, **kwargs: Mock(
+            status_code=200,
+            raw=io.BytesIO(content),
+        )
+
+    @patch("aklub.darujme.requests.Session.get")
     def run_check_darujme(self, mock_get):
-        with open("apps/aklub/test_data/darujme_response.json") as json_file:
-            mock_get.return_value.json.return_value = json.load(json_file)
-            mock_get.return_value.status_code = 200
+        self.mock_darujme_response(mock_get)
         darujme.check_for_new_payments()
 
     def test_check_new_payments(self):
@@ -496,6 +515,203 @@ class TestDarujmeCheck(TestCase):
         self.assertEqual(DonorPaymentChannel.objects.count(), 2)
         self.assertEqual(Payment.objects.count(), 3)
 
+    @override_settings(DARUJME_IMPORT_BATCH_SIZE=2)
+    @patch("aklub.darujme.requests.Session.get")
+    def test_check_same_donor_in_more_pledges(self, mock_get):
+        """
+        donor with more pledges in one response (in different batches)
+        => one profile, all payments, one account statement
+        """
+        with open("apps/aklub/test_data/darujme_response.json") as json_file:
+            response = json.load(json_file)
+        pledge = copy.deepcopy(response["pledges"][1])
+        pledge["pledgeId"] = 4
+        for transaction in pledge["transactions"]:
+            transaction["transactionId"] += 100
+        response["pledges"].append(pledge)
+        self.mock_darujme_response(mock_get, response)
+
+        darujme.check_for_new_payments()
+
+        self.assertEqual(ProfileEmail.objects.count(), 2)
+        self.assertEqual(UserProfile.objects.count(), 2)
+        self.assertEqual(Telephone.objects.count(), 2)
+        self.assertEqual(DonorPaymentChannel.objects.count(), 2)
+        self.assertEqual(Payment.objects.count(), 5)
+        self.assertEqual(AccountStatements.objects.count(), 1)
+        dpch = ProfileEmail.objects.get(email="real@one.com").user.userchannels.get()
+        self.assertEqual(dpch.payment_set.count(), 4)
+        self.assertEqual(dpch.number_of_payments, 4)
+
+    @patch("aklub.darujme.requests.Session.get")
+    def test_check_incremental_download(self, mock_get):
+        """
+        only pledges newer than the last pledge date are downloaded
+        between full downloads
+        """
+        self.mock_darujme_response(mock_get)
+        full_url = self.api_acc.darujme_url()
+
+        darujme.check_for_new_payments()
+        mock_get.assert_called_with(full_url, stream=True, timeout=60)
+        self.api_acc.refresh_from_db()
+        self.assertEqual(self.api_acc.last_pledge_date, datetime.date(2012, 11, 30))
+        self.assertIsNotNone(self.api_acc.last_full_download)
+
+        darujme.check_for_new_payments()
+        mock_get.assert_called_with(
+            full_url + "&fromPledgedDate=2012-11-23",
+            stream=True,
+            timeout=60,
+        )
+        self.assertEqual(Payment.objects.count(), 3)
+
+        self.api_acc.refresh_from_db()
+        self.api_acc.last_full_download -= datetime.timedelta(days=2)
+        self.api_acc.save()
+        darujme.check_for_new_payments()
+        mock_get.assert_called_with(full_url, stream=True, timeout=60)
+
+    @patch("aklub.darujme.requests.Session.get")
+    def test_check_failing_account(self, mock_get):
+        """
+        api account with failing download doesn't stop the others
+        """
+        failing_api_acc = mommy.make(
+            "aklub.ApiAccount",
+            project_name="failing_project",
+            project_id="33333",
+            event=mommy.make("events.Event", name="failing_event"),
+            administrative_unit=self.unit2,
+        )
+        with open("apps/aklub/test_data/darujme_response.json", "rb") as json_file:
+            content = json_file.read()
+
+        def get(url, **kwargs):
+            if url == failing_api_acc.darujme_url():
+                raise requests.exceptions.Timeout()
+            return Mock(status_code=200, raw=io.BytesIO(content))
+
+        mock_get.side_effect = get
+
+        darujme.check_for_new_payments()
+
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(Payment.objects.count(), 3)
+        failing_api_acc.refresh_from_db()
+        self.assertIsNone(failing_api_acc.last_full_download)
+        self.api_acc.refresh_from_db()
+        self.assertIsNotNone(self.api_acc.last_full_download)
+
+    @freeze_time("2012-12-15")
+    @patch("aklub.darujme.requests.Session.get")
+    def test_refresh_pledge_mirror(self, mock_get):
+        """
+        recent pledges are mirrored with the paid flag, older are skipped
+        """
+        self.mock_darujme_response(mock_get)
+        mommy.make(
+            "aklub.DarujmePledge",
+            api_account=self.api_acc,
+            pledge_id=99,
+            pledged_date=datetime.date(2012, 12, 1),
+        )
+        mommy.make(
+            "aklub.DonorPaymentChannel",
+            money_account=self.api_acc,
+            registered_support=timezone.make_aware(datetime.datetime(2012, 12, 1)),
+        )
+
+        darujme.refresh_pledge_mirror()
+
+        mock_get.assert_called_with(
+            self.api_acc.darujme_url() + "&fromPledgedDate=2012-10-14",
+            stream=True,
+            timeout=60,
+        )
+        self.assertQuerysetEqual(
+            DarujmePledge.objects.filter(api_account=self.api_acc).order_by(
+                "pledge_id"
+            ),
+            [
+                (1, "trickyone@test.cz", datetime.date(2012, 11, 21), False),
+                (2, "real@one.com", datetime.date(2012, 11, 30), True),
+                (3, "big@tester.com", datetime.date(2012, 11, 22), True),
+            ],
+            transform=lambda pledge: (
+                pledge.pledge_id,
+                pledge.email,
+                pledge.pledged_date,
+                pledge.is_paid,
+            ),
+        )
+
+    @freeze_time("2012-12-15")
+    def test_pledge_mirror_dates(self):
+        """
+        pledges are mirrored since the oldest newcomer registration,
+        only for the api accounts with newcomers
+        """
+        mommy.make(
+            "aklub.ApiAccount",
+            project_name="no_newcomers",
+            event=self.event,
+        )
+        mommy.make(
+            "aklub.DonorPaymentChannel",
+            money_account=self.api_acc,
+            registered_support=timezone.make_aware(datetime.datetime(2012, 8, 1)),
+        )
+        paid_channel = mommy.make(
+            "aklub.DonorPaymentChannel",
+            money_account=self.api_acc,
+            registered_support=timezone.make_aware(datetime.datetime(2012, 1, 1)),
+        )
+        mommy.make(
+            "aklub.Payment",
+            amount=100,
+            date=datetime.date(2012, 2, 1),
+            user_donor_payment_channel=paid_channel,
+        )
+
+        self.assertEqual(
+            darujme.get_mirror_dates(),
+            {self.api_acc: datetime.date(2012, 8, 1)},
+        )
+
+    def test_save_payments_invalidates_campaign_statistics(self):
+        """
+        bulk created payments invalidate public statistics of the campaign
+        """
+        channel = mommy.make("aklub.DonorPaymentChannel", event=self.event)
+        cache_key = campaign_statistics_cache_key(self.event.id)
+        cache.set(cache_key, {"total_amount": 0})
+
+        darujme.save_payments(
+            [
+                Payment(
+                    user_donor_payment_channel=channel,
+                    date=datetime.date(2020, 1, 1),
+                    amount=100,
+                    type="darujme",
+                ),
+            ],
+        )
+
+        self.assertIsNone(cache.get(cache_key))
+
+    def test_iter_pledges_numbers(self):
+        """
+        pledge numbers are parsed to JSON serializable types
+        """
+        pledges_file = io.BytesIO(
+            b'{"pledges": [{"pledgeId": 1, "customFields": {"amount": 10.5}}]}',
+        )
+        pledges = list(darujme.iter_pledges(pledges_file))
+        self.assertEqual(pledges, [{"pledgeId": 1, "customFields": {"amount": 10.5}}])
+        self.assertIsInstance(pledges[0]["customFields"]["amount"], float)
+        json.dumps(pledges)
+
     def test_pair_with_existed_data(self):
         """
         user and dpch exists already
@@ -17,9 +17,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+import io
+import zipfile
+from unittest.mock import patch
+
 import PyPDF2
 
-from aklub.models import Profile, TaxConfirmation
+from aklub import tasks, tax_confirmations
+from aklub.models import Profile, TaxConfirmation, TaxConfirmationRun
 
 from django.core.files import File
 from django.test import RequestFactory, TestCase
@@ -318,6 +323,141 @@ class TestTaxConfirmation(CreateSuperUserMixin, TestCase):
         self.assertEqual(tax_confirmation.year, 2016)
         self.assertEqual(tax_confirmation.amount, 350)
 
+    def test_make_tax_confirmations(self):
+        """Test, that make_tax_confirmations creates and updates confirmations of more profiles"""
+        bank_acc = mommy.make(
+            "aklub.BankAccount",
+            bank_account_number="1111",
+            administrative_unit=self.unit,
+        )
+        other_bank_acc = mommy.make(
+            "aklub.BankAccount",
+            bank_account_number="2222",
+            administrative_unit=mommy.make("aklub.AdministrativeUnit"),
+        )
+        pdf_type = mommy.make(
+            "smmapdfs.PdfSandwichType",
+            name="sandwitch_type",
+            template_pdf=File(open("apps/aklub/test_data/empty_pdf.pdf", "rb")),
+        )
+        user = mommy.make("aklub.UserProfile")
+        company = mommy.make("aklub.CompanyProfile")
+        without_payment = mommy.make("aklub.UserProfile")
+        for profile, money_account, amount, date, payment_type in (
+            (user, bank_acc, 350, "2016-01-01", "regular"),
+            (user, bank_acc, 150, "2016-12-31", "darujme"),
+            (user, bank_acc, 1000, "2016-12-31", "expected"),
+            (user, bank_acc, 1000, "2015-12-31", "regular"),
+            (user, other_bank_acc, 1000, "2016-06-01", "regular"),
+            (company, bank_acc, 200, "2016-06-01", "regular"),
+        ):
+            mommy.make(
+                "aklub.Payment",
+                amount=amount,
+                date=date,
+                type=payment_type,
+                user_donor_payment_channel=mommy.make(
+                    "aklub.DonorPaymentChannel",
+                    user=profile,
+                    event=mommy.make("Event"),
+                    money_account=money_account,
+                ),
+            )
+        existing = mommy.make(
+            "aklub.TaxConfirmation",
+            user_profile=company,
+            year=2016,
+            pdf_type=pdf_type,
+            amount=100,
+        )
+
+        confirmations, created, updated = TaxConfirmation.make_tax_confirmations(
+            [user.id, company.id, without_payment.id], 2016, self.unit, pdf_type
+        )
+
+        self.assertEqual(created, 1)
+        self.assertEqual(updated, 1)
+        self.assertEqual(len(confirmations), 2)
+        existing.refresh_from_db()
+        self.assertEqual(existing.amount, 200)
+        tax_confirmation = TaxConfirmation.objects.get(user_profile=user)
+        self.assertEqual(tax_confirmation.year, 2016)
+        self.assertEqual(tax_confirmation.amount, 500)
+        self.assertEqual(tax_confirmation.pdf_type, pdf_type)
+        self.assertFalse(
+            TaxConfirmation.objects.filter(user_profile=without_payment).exists()
+        )
+
+    @override_settings(
+        CELERY_ALWAYS_EAGER=True,
+    )
+    def test_resume_tax_confirmation_run(self):
+        """Test, that resumed tax confirmation run processes only failed profiles"""
+        bank_acc = mommy.make(
+            "aklub.BankAccount",
+            bank_account_number="1111",
+            administrative_unit=self.unit,
+        )
+        pdf_type = mommy.make(
+            "smmapdfs.PdfSandwichType",
+            name="sandwitch_type",
+            template_pdf=File(open("apps/aklub/test_data/empty_pdf.pdf", "rb")),
+        )
+        mommy.make(
+            "smmapdfs_edit.PdfSandwichTypeConnector",
+            pdfsandwichtype=pdf_type,
+            profile_type="user_profile",
+            administrative_unit=self.unit,
+        )
+        profiles = mommy.make("aklub.UserProfile", _quantity=2)
+        without_payment = mommy.make("aklub.UserProfile")
+        for profile in profiles:
+            mommy.make(
+                "aklub.Payment",
+                amount=100,
+                date="2016-01-01",
+                type="regular",
+                user_donor_payment_channel=mommy.make(
+                    "aklub.DonorPaymentChannel",
+                    user=profile,
+                    event=mommy.make("Event"),
+                    money_account=bank_acc,
+                ),
+            )
+        run = TaxConfirmationRun.start(
+            2016,
+            [profile.id for profile in profiles] + [without_payment.id],
+            pdf_type,
+        )
+
+        def render_pdf(sandwich, confirmation, fields):
+            if confirmation.user_profile_id == profiles[0].id:
+                raise ValueError("Broken template")
+            return original_render_pdf(sandwich, confirmation, fields)
+
+        original_render_pdf = tax_confirmations.render_pdf
+        with patch("aklub.tax_confirmations.render_pdf", side_effect=render_pdf):
+            tasks.generate_tax_confirmations(run.id)
+
+        self.assertEqual(
+            run.get_progress(),
+            {"pending": 0, "created": 0, "failed": 1, "pdf_done": 1, "no_payments": 1},
+        )
+        failing = run.run_profiles.get(status="failed")
+        self.assertEqual(failing.profile_id, profiles[0].id)
+        self.assertEqual(failing.error, "Broken template")
+        run.refresh_from_db()
+        self.assertIsNotNone(run.finished)
+
+        with patch("aklub.tax_confirmations.render_pdf") as render_pdf_mock:
+            render_pdf_mock.side_effect = original_render_pdf
+            tasks.resume_tax_confirmation_run(run.id)
+        self.assertEqual(render_pdf_mock.call_count, 1)
+        self.assertEqual(
+            run.get_progress(),
+            {"pending": 0, "created": 0, "failed": 0, "pdf_done": 2, "no_payments": 1},
+        )
+
     @override_settings(
         CELERY_ALWAYS_EAGER=True,
     )
@@ -466,6 +606,27 @@ class TestTaxConfirmation(CreateSuperUserMixin, TestCase):
         self.assertEqual(t.email, None)
         self.assertEqual(tax_confirmation.year, 2016)
         self.assertEqual(tax_confirmation.amount, 350)
+        self.assertTrue(tax_confirmation.pdf_rendered)
+        run = TaxConfirmationRun.objects.get()
+        self.assertEqual(run.get_progress()["pdf_done"], 1)
+        self.assertEqual(run.created_by, self.superuser)
+        self.assertIsNotNone(run.finished)
+
+        # download PDF files as ZIP archive
+        response = self.client.post(
+            reverse("admin:aklub_taxconfirmation_changelist"),
+            {
+                "action": "download_pdfs_zip",
+                "_selected_action": [tax_confirmation.id],
+            },
+        )
+        self.assertEqual(response["Content-Type"], "application/zip")
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(
+            archive.namelist(),
+            [f"2016/tax_confirmation_2016_1111_{tax_confirmation.id}.pdf"],
+        )
+        self.assertTrue(archive.read(archive.namelist()[0]).startswith(b"%PDF"))
 
         pdf = tax_confirmation.taxconfirmationpdf_set.get().pdf
         read_pdf = PyPDF2.PdfFileReader(pdf)
@@ -483,6 +644,24 @@ class TestTaxConfirmation(CreateSuperUserMixin, TestCase):
 
         # notification created
         self.assertEqual(self.admin_user.notifications.count(), 1)
+        self.assertIn(
+            "was done for  1 profiles",
+            self.admin_user.notifications.get().description,
+        )
+
+        # changed amount makes the PDF file outdated until it is created again
+        tax_confirmation.amount = 400
+        tax_confirmation.save()
+        self.assertFalse(tax_confirmation.pdf_rendered)
+        self.client.post(
+            reverse("admin:aklub_taxconfirmation_changelist"),
+            {"action": "make_pdfs", "_selected_action": [tax_confirmation.id]},
+        )
+        tax_confirmation.refresh_from_db()
+        self.assertTrue(tax_confirmation.pdf_rendered)
+        pdf = tax_confirmation.taxconfirmationpdf_set.get().pdf
+        page = PyPDF2.PdfFileReader(pdf).getPage(0)
+        self.assertTrue("400 K" in page.extractText())
 
     @override_settings(
         CELERY_ALWAYS_EAGER=True,
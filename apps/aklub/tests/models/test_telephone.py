@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from model_mommy import mommy
+
+from aklub.models import Telephone, TelephoneQuerySet
+
+
+class TelephoneTest(TestCase):
+    """Test Telephone model"""
+
+    def test_normalized_telephone(self):
+        profile = mommy.make("aklub.UserProfile")
+        telephone = mommy.make("aklub.Telephone", telephone="123 456 789", user=profile)
+        self.assertEqual(telephone.normalized_telephone, "+420123456789")
+        self.assertEqual(telephone.format_number(), "+420123456789")
+
+        telephone.telephone = "+421 987 654 321"
+        telephone.save()
+        self.assertEqual(telephone.normalized_telephone, "+421987654321")
+
+    def test_by_number(self):
+        profile = mommy.make("aklub.UserProfile")
+        telephone = mommy.make("aklub.Telephone", telephone="123456789", user=profile)
+        mommy.make("aklub.Telephone", telephone="987654321", user=profile)
+        self.assertQuerysetEqual(
+            Telephone.objects.by_number("+420 123 456 789"),
+            [repr(telephone)],
+        )
+
+        found, created = Telephone.objects.get_or_create_number(
+            "00420123456789", profile
+        )
+        self.assertEqual(found, telephone)
+        self.assertFalse(created)
+
+    def test_duplicate_number(self):
+        profile = mommy.make("aklub.UserProfile")
+        mommy.make("aklub.Telephone", telephone="123456789", user=profile)
+        with self.assertRaises(ValidationError):
+            mommy.make("aklub.Telephone", telephone="+420 123 456 789", user=profile)
+
+    def test_get_or_create_number_concurrently(self):
+        """Number created by a concurrent request is returned"""
+        profile = mommy.make("aklub.UserProfile")
+        telephone = mommy.make("aklub.Telephone", telephone="123456789", user=profile)
+        first = TelephoneQuerySet.first
+        calls = []
+
+        def first_missing_once(queryset):
+            calls.append(queryset)
+            return None if len(calls) == 1 else first(queryset)
+
+        with patch.object(
+            TelephoneQuerySet, "first", autospec=True, side_effect=first_missing_once
+        ), patch.object(Telephone, "check_duplicate"):
+            found, created = Telephone.objects.get_or_create_number(
+                "+420 123 456 789", profile
+            )
+        self.assertEqual(found, telephone)
+        self.assertFalse(created)
+        self.assertEqual(Telephone.objects.count(), 1)
@@ -18,13 +18,17 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+import datetime
+from unittest.mock import patch
+
 from django.contrib import admin as django_admin, auth
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import RequestFactory, TestCase, TransactionTestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
 
 from django_admin_smoke_tests import tests
@@ -47,6 +51,7 @@ from aklub.models import (
     CompanyContact,
     DonorPaymentChannel,
     MassCommunication,
+    Payment,
     Profile,
     Telephone,
     UserProfile,
@@ -616,6 +621,201 @@ class UserProfileAdminTests(TestCase):
             response, '<td class="field-get_administrative_units">test2</td>', html=True
         )
 
+    def test_donor_columns_queries(self):
+        """Donor columns of the whole page are loaded at once"""
+        au1 = mommy.make("aklub.AdministrativeUnit", name="test1")
+        user = mommy.make("UserProfile", is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+
+        def make_donors(count):
+            for i in range(count):
+                profile = mommy.make("UserProfile", administrative_units=[au1])
+                channel = mommy.make(
+                    "DonorPaymentChannel",
+                    user=profile,
+                    money_account__administrative_unit=au1,
+                    regular_payments="regular",
+                    regular_amount=120,
+                    regular_frequency="monthly",
+                )
+                mommy.make("Payment", user_donor_payment_channel=channel, amount=100)
+
+        address = reverse("admin:aklub_userprofile_changelist")
+        make_donors(1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(address)
+        self.assertContains(
+            response,
+            '<td class="field-regular_amount"><nobr>120</nobr></td>',
+            html=True,
+        )
+
+        make_donors(5)
+        with CaptureQueriesContext(connection) as more_queries:
+            response = self.client.get(address)
+        self.assertContains(
+            response,
+            '<td class="field-regular_amount"><nobr>120</nobr></td>',
+            html=True,
+            count=6,
+        )
+        self.assertEqual(len(more_queries), len(queries))
+
+    def test_total_payment(self):
+        """Total payments of the profiles are summed by a single query"""
+        au1 = mommy.make("aklub.AdministrativeUnit", name="test1")
+        au2 = mommy.make("aklub.AdministrativeUnit", name="test2")
+        superuser = mommy.make("UserProfile", is_staff=True, is_superuser=True)
+        u1 = mommy.make("UserProfile", administrative_units=[au1])
+        u2 = mommy.make("UserProfile", administrative_units=[au2])
+        for user, unit, amounts in (
+            (u1, au1, (100, 50)),
+            (u1, au2, (10,)),
+            (u2, au2, ()),
+        ):
+            channel = mommy.make(
+                "DonorPaymentChannel",
+                user=user,
+                money_account__administrative_unit=unit,
+            )
+            for amount in amounts:
+                mommy.make("Payment", user_donor_payment_channel=channel, amount=amount)
+        request = RequestFactory().get("/")
+        request.user = superuser
+        model_admin = admin.UserProfileAdmin(UserProfile, django_admin.site)
+        model_admin.request = request
+        profiles = list(
+            UserProfile.objects.filter(pk__in=(u1.pk, u2.pk))
+            .prefetch_related("administrative_units")
+            .order_by("pk")
+        )
+
+        with self.assertNumQueries(1):
+            model_admin.attach_total_payments(profiles)
+            self.assertEqual(
+                model_admin.total_payment(profiles[0]), "test1: 150 Kč (2)"
+            )
+            self.assertEqual(
+                model_admin.total_payment(profiles[1]), "test2: None Kč (0)"
+            )
+
+    def test_search(self):
+        """Profiles are searched in the search documents, ranked by relevance"""
+        user = mommy.make("UserProfile", is_staff=True, is_superuser=True)
+        self.client.force_login(user)
+        novak = mommy.make("UserProfile", first_name="Jan", last_name="Novák")
+        mommy.make("Telephone", user=novak, telephone="777123456")
+        mommy.make("DonorPaymentChannel", user=novak, VS="987654")
+        novakova = mommy.make(
+            "UserProfile", first_name="Jana", last_name="Nováková", city="Brno"
+        )
+        mommy.make("ProfileEmail", user=novakova, email="Jana@Example.com")
+        company = mommy.make("CompanyProfile", name="Firma")
+        mommy.make("CompanyContact", company=company, email="info@firma.cz")
+
+        def search(model_name, term):
+            response = self.client.get(
+                reverse(f"admin:aklub_{model_name}_changelist"), {"q": term}
+            )
+            self.assertEqual(response.status_code, 200)
+            return list(response.context["cl"].result_list)
+
+        self.assertEqual(search("userprofile", "123456"), [novak])
+        self.assertEqual(search("userprofile", "987654"), [novak])
+        self.assertEqual(search("userprofile", "jana@example"), [novakova])
+        self.assertEqual(search("userprofile", "nová brno"), [novakova])
+        self.assertEqual(search("userprofile", "jan"), [novak, novakova])
+        self.assertEqual(search("companyprofile", "info@firma"), [company])
+        self.assertEqual(search("profile", "info@firma"), [company])
+
+        novak.last_name = "Dvořák"
+        novak.save()
+        self.assertEqual(search("userprofile", "nová"), [novakova])
+
+
+class FastChangeListTests(CreateSuperUserMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.superuser)
+        for day in (1, 2, 2, 3, 4):
+            mommy.make("Payment", date=datetime.date(2020, 1, day), amount=day)
+        self.payments = list(Payment.objects.order_by("-date", "-pk"))
+
+    @patch.object(admin.PaymentAdmin, "list_per_page", 2)
+    def test_keyset_pagination(self):
+        address = reverse("admin:aklub_payment_changelist")
+        response = self.client.get(address)
+        self.assertTrue(response.context["cl"].keyset_pagination)
+        self.assertEqual(list(response.context["cl"].result_list), self.payments[:2])
+
+        pages = []
+        while response.context["cl"].next_page_url:
+            response = self.client.get(address + response.context["cl"].next_page_url)
+            self.assertEqual(response.status_code, 200)
+            pages += response.context["cl"].result_list
+        self.assertEqual(pages, self.payments[2:])
+
+        # sorted by a column the pages are numbered
+        response = self.client.get(address, {"o": "2"})
+        self.assertFalse(response.context["cl"].keyset_pagination)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=-1)
+    def test_estimated_count(self):
+        address = reverse("admin:aklub_payment_changelist")
+        response = self.client.get(address)
+        self.assertTrue(response.context["cl"].result_count_estimated)
+        self.assertContains(response, "The number of results is estimated.")
+
+        response = self.client.get(address + response.context["cl"].exact_count_url)
+        self.assertFalse(response.context["cl"].result_count_estimated)
+        self.assertEqual(response.context["cl"].result_count, 5)
+
+
+class EventAdminTests(CreateSuperUserMixin, TestCase):
+    def test_coordinator_columns_queries(self):
+        """Coordinator columns of the whole page are loaded at once"""
+        self.client.force_login(self.superuser)
+        position = mommy.make("events.OrganizationPosition", name="Hlavní organizátor")
+        interaction_type = mommy.make(
+            "interactions.InteractionType",
+            name="Organizace lokality Zažít město jinak",
+        )
+
+        def make_events(count):
+            for i in range(count):
+                event = mommy.make("events.Event")
+                profile = mommy.make("UserProfile", first_name="Coordinator")
+                mommy.make("Telephone", user=profile, telephone="123456789")
+                mommy.make(
+                    "events.OrganizationTeam",
+                    event=event,
+                    profile=profile,
+                    position=position,
+                )
+                mommy.make(
+                    "interactions.Interaction", user=profile, type=interaction_type
+                )
+
+        address = reverse("admin:events_event_changelist")
+        make_events(1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(address)
+        self.assertContains(response, "<b>Coordinator </b>", count=1)
+
+        make_events(4)
+        with CaptureQueriesContext(connection) as more_queries:
+            response = self.client.get(address)
+        self.assertContains(response, "<b>Coordinator </b>", count=5)
+        self.assertContains(response, "123456789", count=5)
+        self.assertContains(
+            response,
+            '<td class="field-has_any_coordinator_interaction_with_organize_zmj">'
+            '<img src="/media/admin/img/icon-yes.svg" alt="True"/></td>',
+            count=5,
+            html=True,
+        )
+        self.assertEqual(len(more_queries), len(queries))
+
 
 class AdminActionsTests(CreateSuperUserMixin, RunCommitHooksMixin, TestCase):
     """Admin actions tests"""
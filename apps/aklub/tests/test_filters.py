@@ -20,13 +20,18 @@
 
 from unittest.mock import MagicMock
 
-from django.test import RequestFactory, TestCase
+from django.contrib.admin import site
+from django.contrib.admin.utils import get_fields_from_path
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
 
 from events.models import Event
 
 from model_mommy import mommy
 
-from aklub import admin, filters
+from .utils import RunCommitHooksMixin
+from aklub import admin, duplicates, filters
+from aklub.utils import get_unit_access
 from aklub.models import (
     CompanyProfile,
     DonorPaymentChannel,
@@ -76,11 +81,68 @@ class FilterTests(FilterTestCase):
         q = f.queryset(self.request, CompanyProfile.objects.all())
         self.assertQuerysetEqual(q, ["<CompanyProfile: Company>"])
 
+    def test_email_filter_duplicate(self):
+        user_profile1 = mommy.make("UserProfile", first_name="Foo", last_name="")
+        mommy.make("ProfileEmail", email="foo@example.com", user=user_profile1)
+        user_profile2 = mommy.make("UserProfile", first_name="Bar", last_name="")
+        mommy.make("ProfileEmail", email="Foo@Example.com", user=user_profile2)
+        mommy.make("UserProfile", first_name="Baz", last_name="")
+        duplicates.rebuild()
+        f = filters.EmailFilter(self.request, {"email": "duplicate"}, UserProfile, None)
+        q = f.queryset(
+            self.request, UserProfile.objects.all().exclude(is_superuser=True)
+        )
+        self.assertQuerysetEqual(
+            q,
+            [
+                "<UserProfile: Foo>",
+                "<UserProfile: Bar>",
+            ],
+            ordered=False,
+        )
+
+    def test_name_filter_duplicate_address(self):
+        mommy.make(
+            "UserProfile",
+            first_name="Foo",
+            last_name="Bar",
+            street="Street 1",
+            city="City",
+        )
+        mommy.make(
+            "UserProfile",
+            first_name="Foo",
+            last_name="Bar",
+            street="street 1 ",
+            city="City",
+        )
+        mommy.make(
+            "UserProfile",
+            first_name="Foo",
+            last_name="Bar",
+            street="Street 2",
+            city="City",
+        )
+        duplicates.rebuild()
+        f = filters.NameFilter(
+            self.request, {"name": "duplicate-address"}, UserProfile, None
+        )
+        q = f.queryset(self.request, UserProfile.objects.all())
+        self.assertEqual(q.count(), 2)
+        self.assertEqual(
+            duplicates.ProfileDuplicate.objects.filter(kind="name")
+            .values("cluster")
+            .distinct()
+            .count(),
+            1,
+        )
+
     def test_telephone_filter_duplicate(self):
         user_profile1 = mommy.make("UserProfile", first_name="Foo", last_name="")
         mommy.make("Telephone", telephone="123456", user=user_profile1)
         user_profile2 = mommy.make("UserProfile", first_name="Bar", last_name="")
-        mommy.make("Telephone", telephone="123456", user=user_profile2)
+        mommy.make("Telephone", telephone="123 456", user=user_profile2)
+        duplicates.rebuild()
         f = filters.TelephoneFilter(
             self.request, {"telephone": "duplicate"}, UserProfile, None
         )
@@ -100,6 +162,7 @@ class FilterTests(FilterTestCase):
         mommy.make("CompanyContact", telephone="123456", company=company_profile1)
         company_profile2 = mommy.make("CompanyProfile", name="Company2")
         mommy.make("CompanyContact", telephone="123456", company=company_profile2)
+        duplicates.rebuild()
         f = filters.TelephoneFilter(
             self.request, {"telephone": "duplicate"}, CompanyProfile, None
         )
@@ -183,20 +246,22 @@ class FilterTests(FilterTestCase):
 
     def test_name_filter_duplicate(self):
         mommy.make("UserProfile", first_name="Foo", last_name="")
-        mommy.make("UserProfile", first_name="Foo", last_name="")
+        mommy.make("UserProfile", first_name="foo ", last_name="")
+        duplicates.rebuild()
         f = filters.NameFilter(self.request, {"name": "duplicate"}, UserProfile, None)
         q = f.queryset(self.request, UserProfile.objects.all())
         self.assertQuerysetEqual(
             q,
             [
                 "<UserProfile: Foo>",
-                "<UserProfile: Foo>",
+                "<UserProfile: foo >",
             ],
             ordered=False,
         )
 
         mommy.make("CompanyProfile", name="Company")
         mommy.make("CompanyProfile", name="Company")
+        duplicates.rebuild()
         f = filters.NameFilter(
             self.request, {"name": "duplicate"}, CompanyProfile, None
         )
@@ -237,6 +302,66 @@ class FilterTests(FilterTestCase):
         self.assertQuerysetEqual(q, ["<CompanyProfile: company_username>"])
 
 
+class UnitAccessTests(FilterTestCase):
+    def test_unit_access(self):
+        """Units of the request user are loaded once per request"""
+        unit1, unit2 = mommy.make("aklub.AdministrativeUnit", _quantity=2)
+        self.request.user = mommy.make(
+            "aklub.UserProfile", administrated_units=[unit2, unit1]
+        )
+        unit_access = get_unit_access(self.request)
+        self.assertFalse(unit_access.all_units)
+        self.assertEqual(unit_access.unit_ids, [unit1.pk, unit2.pk])
+
+        with self.assertNumQueries(0):
+            unit_access = get_unit_access(self.request)
+            self.assertFalse(unit_access.all_units)
+            self.assertEqual(unit_access.first_unit, unit1)
+            f = filters.PreferenceMailingListAllowed(
+                self.request, {"mailing_list_allowed": "yes"}, UserProfile, None
+            )
+            f.queryset(self.request, UserProfile.objects.all())
+
+
+class ListFilterChoicesTests(RunCommitHooksMixin, FilterTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def get_event_filter(self):
+        field_path = "userchannels__event__id"
+        return filters.ProfileMultiSelectDonorEvent(
+            get_fields_from_path(UserProfile, field_path)[-1],
+            self.request,
+            {},
+            UserProfile,
+            admin.UserProfileAdmin(UserProfile, site),
+            field_path,
+        )
+
+    def test_event_choices_cached(self):
+        """Event choices are cached until an event changes"""
+        unit = mommy.make("aklub.AdministrativeUnit")
+        event = mommy.make("events.Event", name="Foo", administrative_units=[unit])
+        mommy.make("events.Event", name="Other")
+        self.assertEqual(len(self.get_event_filter().lookup_choices), 2)
+
+        self.request = self.factory.get("")
+        self.request.user = mommy.make("aklub.UserProfile", administrated_units=[unit])
+        self.assertEqual(self.get_event_filter().lookup_choices, [(event.pk, "Foo")])
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.get_event_filter().lookup_choices, [(event.pk, "Foo")]
+            )
+
+        event.name = "Bar"
+        event.save()
+        # cached version is changed only after commit
+        self.assertEqual(self.get_event_filter().lookup_choices, [(event.pk, "Foo")])
+        self.run_commit_hooks()
+        self.assertEqual(self.get_event_filter().lookup_choices, [(event.pk, "Bar")])
+
+
 class FixtureFilterTests(FilterTestCase):
     fixtures = ["conditions", "users", "communications"]
 
@@ -272,6 +397,25 @@ class FixtureFilterTests(FilterTestCase):
         admin.show_payments_by_year(m, self.request, DonorPaymentChannel.objects.all())
         m.message_user.assert_called_once_with(self.request, "2016: 480<br/>TOT.: 480")
 
+    @override_settings(PAYMENTS_BY_YEAR_BACKGROUND_LIMIT=0)
+    def test_show_payments_by_year_background(self):
+        m = MagicMock()
+        admin.show_payments_by_year(m, self.request, DonorPaymentChannel.objects.all())
+        m.message_user.assert_called_once_with(
+            self.request, "Payments by year will be sent to you as a notification"
+        )
+        notification = self.request.user.notifications.get()
+        self.assertEqual(notification.description, "2016: 480, TOT.: 480")
+
+    def test_download_payments_by_year(self):
+        response = admin.download_payments_by_year(
+            MagicMock(), self.request, DonorPaymentChannel.objects.all()
+        )
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            response.content.decode(), "Year,Amount\r\n2016,480\r\nTotal,480\r\n"
+        )
+
     def test_email_filter(self):
         f = filters.EmailFilter(self.request, {}, Profile, None)
         q = f.queryset(self.request, Profile.objects.all().exclude(is_superuser=True))
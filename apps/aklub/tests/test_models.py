@@ -21,7 +21,9 @@
 import datetime
 
 from django.core import mail
-from django.test import TestCase
+from django.db.models import Q
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
 
 from events.models import Event
 
@@ -31,8 +33,16 @@ from interactions.models import Interaction
 
 from model_mommy import mommy
 
+from .test_admin import CreateSuperUserMixin
 from .utils import ICON_FALSE, ICON_UNKNOWN
-from aklub.models import DonorPaymentChannel, Payment, UserProfile
+from aklub import time_series
+from aklub.models import (
+    DashboardTimeSeries,
+    DonorPaymentChannel,
+    OutdatedStatisticsMonth,
+    Payment,
+    UserProfile,
+)
 
 
 @freeze_time("2016-5-1")
@@ -153,3 +163,129 @@ class CommunicationTest(TestCase):
             administrative_unit=unit,
         )
         self.assertEqual(len(mail.outbox), 0)
+
+
+@freeze_time("2016-03-10")
+class DashboardTimeSeriesTest(CreateSuperUserMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().get("/")
+        self.request.user = self.superuser
+        self.stats = mommy.make(
+            "admin_tools_stats.DashboardStats",
+            graph_key="payment_amount",
+            model_app_name="aklub",
+            model_name="Payment",
+            date_field_name="date",
+            type_operation_field_name="Sum",
+            operation_field_name="amount",
+            user_field_name=None,
+            distinct=False,
+        )
+        for date, amount in (
+            ("2016-02-27", 1000),
+            ("2016-03-01", 100),
+            ("2016-03-02", 50),
+            ("2016-03-09", 20),
+        ):
+            mommy.make("aklub.Payment", date=date, amount=amount, type="cash")
+
+    def get_time_series(self):
+        return list(
+            self.stats.get_time_series(
+                {},
+                [],
+                self.request,
+                timezone.make_aware(datetime.datetime(2016, 2, 28, 12)),
+                timezone.make_aware(datetime.datetime(2016, 3, 10, 23, 59)),
+                "days",
+            )
+        )
+
+    def test_time_series(self):
+        """Test, that closed buckets are stored and invalidated by payment change"""
+        self.assertEqual(
+            self.get_time_series(),
+            [
+                (datetime.date(2016, 3, 1), 100),
+                (datetime.date(2016, 3, 2), 50),
+                (datetime.date(2016, 3, 9), 20),
+            ],
+        )
+        series = DashboardTimeSeries.objects.get()
+        self.assertEqual(series.buckets.count(), 2)
+        self.assertEqual(
+            series.covered_since,
+            timezone.make_aware(datetime.datetime(2016, 2, 29)),
+        )
+        self.assertEqual(
+            series.covered_until,
+            timezone.make_aware(datetime.datetime(2016, 3, 9)),
+        )
+
+        # the outdated month starts the refresh task, eager in the tests
+        mommy.make("aklub.Payment", date="2016-03-01", amount=1, type="cash")
+        self.assertEqual(
+            self.get_time_series(),
+            [
+                (datetime.date(2016, 3, 1), 101),
+                (datetime.date(2016, 3, 2), 50),
+                (datetime.date(2016, 3, 9), 20),
+            ],
+        )
+        self.assertFalse(OutdatedStatisticsMonth.objects.exists())
+
+    def test_uncovered_criteria(self):
+        """Charts filtered by fields without outdated months are not stored"""
+        self.assertTrue(
+            time_series.is_covered(
+                self.stats,
+                {"user_donor_payment_channel__event__id__in": [1], "type": "cash"},
+                [None],
+            ),
+        )
+        self.assertFalse(
+            time_series.is_covered(
+                self.stats,
+                {"user_donor_payment_channel__user__first_name": "Foo"},
+                [None],
+            ),
+        )
+        self.assertFalse(
+            time_series.is_covered(
+                self.stats,
+                {},
+                [Q(user_donor_payment_channel__user__is_active=True)],
+            ),
+        )
+
+    def test_units_mark_outdated_months(self):
+        """Changed units of profiles and money accounts mark outdated months"""
+        unit = mommy.make("aklub.AdministrativeUnit")
+        profile = mommy.make(
+            "aklub.UserProfile",
+            date_joined=timezone.make_aware(datetime.datetime(2015, 6, 10)),
+        )
+        bank_account = mommy.make("aklub.BankAccount")
+        mommy.make(
+            "aklub.Payment",
+            date="2015-04-10",
+            user_donor_payment_channel=mommy.make(
+                "aklub.DonorPaymentChannel",
+                user=profile,
+                money_account=bank_account,
+            ),
+        )
+        OutdatedStatisticsMonth.objects.all().delete()
+
+        profile.administrative_units.add(unit)
+        bank_account.administrative_unit = unit
+        bank_account.save()
+        self.assertQuerysetEqual(
+            OutdatedStatisticsMonth.objects.order_by("month"),
+            [
+                (OutdatedStatisticsMonth.PAYMENTS, datetime.date(2015, 4, 1)),
+                (OutdatedStatisticsMonth.MEMBERS, datetime.date(2015, 6, 1)),
+            ],
+            transform=lambda outdated: (outdated.statistics, outdated.month),
+        )
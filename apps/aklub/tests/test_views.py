@@ -17,9 +17,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+import datetime
+from unittest.mock import patch
 
 from django.conf import settings
 from django.core import mail
+from django.core.management import call_command
 from django.core.cache import cache
 
 try:
@@ -36,6 +39,7 @@ from sesame import utils as sesame_utils
 
 from .test_admin import CreateSuperUserMixin
 from .utils import print_response  # noqa
+from aklub import dashboard, tasks
 from aklub.models import DonorPaymentChannel, ProfileEmail
 
 
@@ -709,6 +713,51 @@ class ViewsTests(CreateSuperUserMixin, ClearCacheMixin, TestCase):
         self.assertEqual(response["number-of-all-members"], 3)
         self.assertEqual(response["number-of-confirmed-members"], 0)
 
+    def test_event_statistics_cached(self):
+        """
+        statistics are cached with validators until a new payment arrives
+        """
+        dpch = mommy.make(
+            "aklub.donorpaymentchannel",
+            money_account=self.money,
+            event=self.event,
+            regular_payments="regular",
+            regular_amount=100,
+            regular_frequency="quaterly",
+        )
+        mommy.make(
+            "aklub.donorpaymentchannel",
+            money_account=self.money,
+            event=self.event,
+            regular_payments="regular",
+            regular_amount=100,
+            regular_frequency="monthly",
+        )
+        address = reverse(
+            "campaign-statistics", kwargs={"campaign_slug": self.event.slug}
+        )
+        response = self.client.get(address)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["expected-yearly-income"], 0)
+        self.assertEqual(response.json()["number-of-all-members"], 2)
+        self.assertIn("Last-Modified", response)
+
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(address, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+        mommy.make(
+            "aklub.payment",
+            recipient_account=self.money,
+            amount=100,
+            user_donor_payment_channel=dpch,
+        )
+        response = self.client.get(address, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["expected-yearly-income"], 400)
+        self.assertEqual(response.json()["number-of-active-members"], 1)
+        self.assertEqual(response.json()["number-of-regular-members"], 1)
+
     def test_donators(self):
         """
         count users who donating for selected administrative units total/regular
@@ -764,12 +813,34 @@ class AdminViewTests(CreateSuperUserMixin, ClearCacheMixin, TestCase):
             html=True,
         )
 
+    def test_main_admin_page_precomputed_conditions(self):
+        """Test, that dashboard doesn't evaluate conditions in the request"""
+        dashboard.precompute_conditions()
+        with patch(
+            "flexible_filter_conditions.models.NamedCondition.filter_queryset",
+            side_effect=AssertionError,
+        ):
+            response = self.client.get("/")
+        self.assertContains(response, "Nestará registrace: 3 položek")
+        self.assertContains(response, "Computed at: ")
+
+    def test_main_admin_page_precompute_once(self):
+        """Test, that missing results are computed by one task at a time"""
+        cache.set(dashboard.PRECOMPUTE_CONDITIONS_LOCK_KEY, 1)
+        with patch("aklub.tasks.precompute_dashboard_conditions.delay") as delay:
+            self.client.get("/")
+        delay.assert_not_called()
+
+        dashboard.precompute_conditions()
+        self.assertIsNone(cache.get(dashboard.PRECOMPUTE_CONDITIONS_LOCK_KEY))
+
     def test_aklub_admin_page(self):
         address = "/aklub/"
         response = self.client.get(address)
         self.assertContains(response, "<h2>Nedávné akce</h2>", html=True)
 
     def test_stat_members(self):
+        call_command("rebuild_statistics_rollups")
         address = reverse("stat-members")
         response = self.client.get(address)
         self.assertContains(
@@ -780,6 +851,7 @@ class AdminViewTests(CreateSuperUserMixin, ClearCacheMixin, TestCase):
         self.assertContains(response, "<h1>Statistiky členů klubu</h1>", html=True)
 
     def test_stat_payments(self):
+        call_command("rebuild_statistics_rollups")
         address = reverse("stat-payments")
         response = self.client.get(address)
         self.assertContains(
@@ -789,6 +861,43 @@ class AdminViewTests(CreateSuperUserMixin, ClearCacheMixin, TestCase):
         )
         self.assertContains(response, "<h1>Statistiky plateb</h1>", html=True)
 
+    def test_stat_rollups_updated(self):
+        """Test, that statistics rollups are updated after payment and channel change"""
+        call_command("rebuild_statistics_rollups")
+        response = self.client.get(reverse("stat-payments"))
+        total_amount = response.context["total_amount"]
+        mommy.make(
+            "aklub.Payment",
+            date="2030-01-15",
+            amount=500,
+            type="bank-transfer",
+            user_donor_payment_channel_id=2979,
+        )
+        tasks.refresh_statistics_rollups()
+        response = self.client.get(reverse("stat-payments"))
+        self.assertEqual(
+            response.context["payments_by_months"][-1],
+            {
+                "month": datetime.date(2030, 1, 1),
+                "total": 500,
+                "donors": 1,
+                "run_total": total_amount + 500,
+            },
+        )
+        self.assertEqual(response.context["total_amount"], total_amount + 500)
+
+        response = self.client.get(reverse("stat-members"))
+        regular = sum(row["regular"] for row in response.context["members_by_months"])
+        channel = DonorPaymentChannel.objects.get(pk=2979)
+        channel.regular_payments = "regular"
+        channel.save()
+        tasks.refresh_statistics_rollups()
+        response = self.client.get(reverse("stat-members"))
+        self.assertEqual(
+            sum(row["regular"] for row in response.context["members_by_months"]),
+            regular + 1,
+        )
+
 
 class VariableSymbolTests(TestCase):
     # TODO ... add test if there is no more VS available for event
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+""" Materialized time series of the dashboard charts """
+import datetime
+import decimal
+import hashlib
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Trunc
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from .models import (
+    DashboardTimeSeries,
+    DashboardTimeSeriesValue,
+    OutdatedStatisticsMonth,
+)
+from .utils import get_unit_access
+
+# charts of these models are materialized,
+# outdated months of the statistics invalidate the stored buckets
+STATISTICS_BY_MODEL = {
+    "Payment": OutdatedStatisticsMonth.PAYMENTS,
+    "UserProfile": OutdatedStatisticsMonth.MEMBERS,
+}
+
+# changes of these fields mark the outdated statistics months,
+# "*" covers all fields of the model itself,
+# charts with criteria on other fields are always computed from the model
+COVERED_FIELDS = {
+    "Payment": {
+        "*",
+        "user_donor_payment_channel__event",
+        "user_donor_payment_channel__money_account",
+        "user_donor_payment_channel__money_account__administrative_unit",
+        "user_donor_payment_channel__regular_payments",
+    },
+    "UserProfile": {
+        "id",
+        "profile_ptr",
+        "date_joined",
+        "is_active",
+        "administrative_units",
+        "userchannels",
+        "userchannels__event",
+        "userchannels__money_account",
+        "userchannels__regular_payments",
+    },
+}
+
+KINDS = ("hour", "day", "week", "month", "year")
+
+
+def field_path(model, lookup):
+    """Field names of the lookup without the lookups, transforms and related pk"""
+    names = []
+    for name in lookup.split(LOOKUP_SEP):
+        if name == "pk":
+            name = model._meta.pk.name
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            break
+        if names and getattr(field, "primary_key", False):
+            break
+        names.append(field.name)
+        if not field.is_relation:
+            break
+        model = field.related_model
+    return LOOKUP_SEP.join(names)
+
+
+def criteria_lookups(stats, kwargs, dynamic_kwargs):
+    yield stats.date_field_name
+    if stats.operation_field_name:
+        yield stats.operation_field_name
+    yield from kwargs
+    queries = [dynamic_q for dynamic_q in dynamic_kwargs if dynamic_q is not None]
+    while queries:
+        for child in queries.pop().children:
+            if isinstance(child, Q):
+                queries.append(child)
+            else:
+                yield child[0]
+
+
+def is_covered(stats, kwargs, dynamic_kwargs):
+    """Are all the criteria of the chart covered by the outdated months?"""
+    model = apps.get_model(stats.model_app_name, stats.model_name)
+    covered = COVERED_FIELDS[stats.model_name]
+    for lookup in criteria_lookups(stats, kwargs, dynamic_kwargs):
+        path = field_path(model, lookup)
+        if path in covered:
+            continue
+        if not path or LOOKUP_SEP in path or "*" not in covered:
+            return False
+    return True
+
+
+def to_datetime(value):
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def truncate(value, kind):
+    """Start of the bucket in the current timezone, same as Trunc() in the DB"""
+    value = timezone.localtime(value).replace(tzinfo=None)
+    if kind == "hour":
+        value = value.replace(minute=0, second=0, microsecond=0)
+    else:
+        value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if kind == "week":
+        value -= datetime.timedelta(days=value.weekday())
+    elif kind == "month":
+        value = value.replace(day=1)
+    elif kind == "year":
+        value = value.replace(month=1, day=1)
+    return timezone.make_aware(value)
+
+
+def next_bucket(value, kind):
+    value = timezone.localtime(value).replace(tzinfo=None)
+    if kind == "hour":
+        value += datetime.timedelta(hours=1)
+    elif kind == "day":
+        value += datetime.timedelta(days=1)
+    elif kind == "week":
+        value += datetime.timedelta(days=7)
+    elif kind == "month":
+        value = (value + datetime.timedelta(days=32)).replace(day=1)
+    else:
+        value = value.replace(year=value.year + 1)
+    return timezone.make_aware(value)
+
+
+def get_series(stats, request, kwargs, dynamic_kwargs, kind):
+    """
+    Return materialized series of the chart or None,
+    if the chart has to be computed from the model
+    """
+    if stats.model_name not in STATISTICS_BY_MODEL or kind not in KINDS:
+        return None
+    if stats.user_field_name and not request.user.is_superuser:
+        return None
+    if not is_covered(stats, kwargs, dynamic_kwargs):
+        return None
+    unit_access = get_unit_access(request)
+    if unit_access.all_units:
+        unit = None
+    else:
+        if len(unit_access.unit_ids) != 1:
+            return None
+        unit = unit_access.first_unit
+    criteria = repr(
+        (
+            stats.model_name,
+            stats.date_field_name,
+            stats.type_operation_field_name,
+            stats.operation_field_name,
+            stats.distinct,
+            sorted(kwargs.items()),
+            [str(dynamic_q) for dynamic_q in dynamic_kwargs],
+        )
+    )
+    series, created = DashboardTimeSeries.objects.get_or_create(
+        stats=stats,
+        administrative_unit=unit,
+        interval=kind,
+        criteria=hashlib.md5(criteria.encode()).hexdigest(),
+    )
+    return series
+
+
+def query(queryset, date_field_name, kind, aggregate_dict, start, end, end_lookup):
+    return list(
+        queryset.filter(
+            **{
+                f"{date_field_name}__gte": start,
+                f"{date_field_name}__{end_lookup}": end,
+            }
+        )
+        .annotate(d=Trunc(date_field_name, kind))
+        .values_list("d")
+        .order_by("d")
+        .annotate(**aggregate_dict)
+    )
+
+
+def to_json(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+@atomic
+def store(series, queryset, aggregate_dict, start, end):
+    """Compute the closed buckets between start and end not stored yet"""
+    series = DashboardTimeSeries.objects.select_for_update().get(pk=series.pk)
+    if series.covered_since is None:
+        ranges = [(start, end)]
+        series.covered_since, series.covered_until = start, end
+    else:
+        ranges = [
+            (start, series.covered_since),
+            (series.covered_until, end),
+        ]
+        series.covered_since = min(start, series.covered_since)
+        series.covered_until = max(end, series.covered_until)
+    for range_start, range_end in ranges:
+        if range_start >= range_end:
+            continue
+        series.buckets.filter(bucket__gte=range_start, bucket__lt=range_end).delete()
+        DashboardTimeSeriesValue.objects.bulk_create(
+            [
+                DashboardTimeSeriesValue(
+                    series=series,
+                    bucket=to_datetime(bucket),
+                    values=[to_json(value) for value in values],
+                )
+                for bucket, *values in query(
+                    queryset,
+                    series.stats.date_field_name,
+                    series.interval,
+                    aggregate_dict,
+                    range_start,
+                    range_end,
+                    "lt",
+                )
+            ],
+            batch_size=1000,
+        )
+    series.save()
+    return series
+
+
+def get_series_values(series, queryset, aggregate_dict, time_since, time_until):
+    """
+    Closed buckets are read from the stored series, only the partial first
+    bucket and the recent buckets are computed from the queryset
+    """
+    kind = series.interval
+    date_field_name = series.stats.date_field_name
+    time_since, time_until = to_datetime(time_since), to_datetime(time_until)
+    start = truncate(time_since, kind)
+    if start < time_since:
+        start = next_bucket(start, kind)
+    if time_until < start:
+        return query(
+            queryset,
+            date_field_name,
+            kind,
+            aggregate_dict,
+            time_since,
+            time_until,
+            "lte",
+        )
+    horizon = truncate(
+        timezone.now()
+        - datetime.timedelta(days=settings.DASHBOARD_TIME_SERIES_OPEN_DAYS),
+        kind,
+    )
+    end = max(start, min(horizon, truncate(time_until, kind)))
+
+    values = []
+    if time_since < start:
+        values = query(
+            queryset, date_field_name, kind, aggregate_dict, time_since, start, "lt"
+        )
+    if start < end:
+        if not (
+            series.covered_since is not None
+            and series.covered_since <= start
+            and end <= series.covered_until
+        ):
+            series = store(series, queryset, aggregate_dict, start, end)
+        is_date = not isinstance(
+            queryset.model._meta.get_field(date_field_name),
+            models.DateTimeField,
+        )
+        for value in series.buckets.filter(bucket__gte=start, bucket__lt=end).order_by(
+            "bucket"
+        ):
+            bucket = timezone.localtime(value.bucket)
+            values.append((bucket.date() if is_date else bucket, *value.values))
+    values += query(
+        queryset, date_field_name, kind, aggregate_dict, end, time_until, "lte"
+    )
+    return values
+
+
+def get_values(
+    stats,
+    request,
+    queryset,
+    kwargs,
+    dynamic_kwargs,
+    aggregate_dict,
+    time_since,
+    time_until,
+    kind,
+):
+    """Values of the chart, read from the materialized series if possible"""
+    if stats.model_name in STATISTICS_BY_MODEL:
+        from .stat_rollups import request_refresh
+
+        # outdated months invalidate the series before it is loaded
+        request_refresh(STATISTICS_BY_MODEL[stats.model_name])
+    series = get_series(stats, request, kwargs, dynamic_kwargs, kind)
+    if series is None:
+        return query(
+            queryset,
+            stats.date_field_name,
+            kind,
+            aggregate_dict,
+            time_since,
+            time_until,
+            "lte",
+        )
+    return get_series_values(series, queryset, aggregate_dict, time_since, time_until)
+
+
+def invalidate(statistics, months):
+    """Forget stored buckets since the first changed month"""
+    first = to_datetime(min(months))
+    model_names = [
+        model_name
+        for model_name, model_statistics in STATISTICS_BY_MODEL.items()
+        if model_statistics == statistics
+    ]
+    kinds = (
+        DashboardTimeSeries.objects.filter(stats__model_name__in=model_names)
+        .order_by()
+        .values_list("interval", flat=True)
+        .distinct()
+    )
+    for kind in list(kinds):
+        bucket = truncate(first, kind)
+        series = DashboardTimeSeries.objects.filter(
+            stats__model_name__in=model_names,
+            interval=kind,
+        )
+        series.filter(covered_since__gte=bucket).update(
+            covered_since=None,
+            covered_until=None,
+        )
+        series.filter(covered_until__gt=bucket).update(covered_until=bucket)
@@ -1,77 +1,56 @@
 # -*- coding: utf-8 -*-
 import datetime
-import operator
-from functools import reduce
+import hashlib
+import time
 
 from django.contrib import messages
-from django.contrib.admin.utils import lookup_needs_distinct
-from django.core.exceptions import FieldDoesNotExist
-from django.db import models
-from django.db.models.constants import LOOKUP_SEP
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Sum
+from django.db.models.functions import ExtractYear
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
 from django.utils.html import format_html_join, mark_safe
 from django.utils.translation import ugettext_lazy as _
 
 from . import models as aklub_models
 
 
-def annotation_friendly_search_results(self, request, queryset, search_term):  # noqa
-    """
-    - fully copied from django.... used nested select insteed of classic one
-    - should be used if search is made by FK for example: userprofile__telephone...
-    - why? because if not, django joins search tables and annotation result is multiplicated :(
-    - see below
-    """
-    # Apply keyword searches.
-    def construct_search(field_name):
-        if field_name.startswith("^"):
-            return "%s__istartswith" % field_name[1:]
-        elif field_name.startswith("="):
-            return "%s__iexact" % field_name[1:]
-        elif field_name.startswith("@"):
-            return "%s__search" % field_name[1:]
-        # Use field_name if it includes a lookup.
-        opts = queryset.model._meta
-        lookup_fields = field_name.split(LOOKUP_SEP)
-        # Go through the fields, following all relations.
-        prev_field = None
-        for path_part in lookup_fields:
-            if path_part == "pk":
-                path_part = opts.pk.name
-            try:
-                field = opts.get_field(path_part)
-            except FieldDoesNotExist:
-                # Use valid query lookups.
-                if prev_field and prev_field.get_lookup(path_part):
-                    return field_name
-            else:
-                prev_field = field
-                if hasattr(field, "get_path_info"):
-                    # Update opts to follow the relation.
-                    opts = field.get_path_info()[-1].to_opts
-        # Otherwise, use the field with icontains.
-        return "%s__icontains" % field_name
-
-    use_distinct = False
-    search_fields = self.get_search_fields(request)
-    if search_fields and search_term:
-        orm_lookups = [
-            construct_search(str(search_field)) for search_field in search_fields
-        ]
-        for bit in search_term.split():
-            or_queries = [models.Q(**{orm_lookup: bit}) for orm_lookup in orm_lookups]
-            # THIS IS CHANGED!!!!
-            # queryset = queryset.filter(reduce(operator.or_, or_queries))
-            filtered_ids = self.model.objects.filter(
-                reduce(operator.or_, or_queries)
-            ).values_list("id", flat=True)
-            queryset = queryset.filter(id__in=filtered_ids)
-            # ^^^^^^^
-        use_distinct |= any(
-            lookup_needs_distinct(self.opts, search_spec) for search_spec in orm_lookups
-        )
+class UnitAccess:
+    """Permission to edit all units and administrated units of the user"""
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def all_units(self):
+        return self.user.has_perm("aklub.can_edit_all_units")
+
+    @cached_property
+    def administrated_units(self):
+        return list(self.user.administrated_units.order_by("pk"))
+
+    @cached_property
+    def unit_ids(self):
+        return [unit.pk for unit in self.administrated_units]
+
+    @property
+    def first_unit(self):
+        return self.administrated_units[0] if self.administrated_units else None
 
-    return queryset, use_distinct
+    @property
+    def units(self):
+        """Queryset of the administrated units, e.g. for the form fields"""
+        return aklub_models.AdministrativeUnit.objects.filter(pk__in=self.unit_ids)
+
+
+def get_unit_access(request):
+    """Unit access of the request user, computed once per request"""
+    if getattr(request, "unit_access", None) is None:
+        request.unit_access = UnitAccess(request.user)
+    return request.unit_access
 
 
 def sweet_text(generator):
@@ -185,10 +164,11 @@ def check_annotate_subqueries(self, request):
     """
     from interactions.models import Interaction
 
-    if request.user.has_perm("aklub.can_edit_all_units"):
+    unit_access = get_unit_access(request)
+    if unit_access.all_units:
         unit_filter = {}
     else:
-        unit_filter = {"administrative_unit__in": self.user_administrated_units}
+        unit_filter = {"administrative_unit__in": unit_access.unit_ids}
 
     next_com = Interaction.objects.filter(
         user=models.OuterRef("pk"), **unit_filter
@@ -202,6 +182,94 @@ def check_annotate_subqueries(self, request):
     return annotate_kwargs
 
 
+def paid_section_cache_key(user_id):
+    return f"{user_id}_paid_section"
+
+
+def invalidate_paid_section(user_ids):
+    """Forget cached paid section access of the users"""
+    cache.delete_many([paid_section_cache_key(user_id) for user_id in user_ids])
+
+
+def campaign_statistics_cache_key(event_id):
+    return f"{event_id}_campaign_statistics"
+
+
+def invalidate_campaign_statistics(event_ids):
+    """Forget cached public statistics of the campaigns"""
+    cache.delete_many(
+        [
+            campaign_statistics_cache_key(event_id)
+            for event_id in event_ids
+            if event_id is not None
+        ],
+    )
+
+
+LIST_FILTER_CHOICES_VERSION_KEY = "list_filter_choices_version"
+
+
+def list_filter_choices_cache_key(name, unit_ids=None):
+    """
+    Key of the cached choices of the list filter for the units,
+    None means all units
+    """
+    version = cache.get_or_set(LIST_FILTER_CHOICES_VERSION_KEY, time.time_ns, None)
+    units = "all" if unit_ids is None else ",".join(str(pk) for pk in sorted(unit_ids))
+    digest = hashlib.md5(f"{name}|{units}".encode()).hexdigest()
+    return f"{version}_{digest}_list_filter_choices"
+
+
+def invalidate_list_filter_choices():
+    """
+    Forget cached choices of the event and unit list filters after commit,
+    so the choices of the uncommitted rows are not cached under the new version
+    """
+    transaction.on_commit(
+        lambda: cache.set(LIST_FILTER_CHOICES_VERSION_KEY, time.time_ns(), None),
+    )
+
+
+def payments_by_year(channels):
+    """Sums of the payments of the channels per year, ordered by the year"""
+    return list(
+        aklub_models.Payment.objects.filter(user_donor_payment_channel__in=channels)
+        .annotate(year=ExtractYear("date"))
+        .order_by("year")
+        .values_list("year")
+        .annotate(amount=Sum("amount"))
+    )
+
+
+def payments_by_year_lines(years):
+    """Lines with the sums per year followed by the total"""
+    lines = ["%s: %s" % (year, amount) for year, amount in years]
+    lines.append(_("TOT.: %s") % sum(amount for year, amount in years))
+    return lines
+
+
+def month_start(value):
+    """Return first day of the month of the date, datetime or date string"""
+    if isinstance(value, str):
+        value = parse_date(value)
+    if isinstance(value, datetime.datetime):
+        value = timezone.localtime(value).date()
+    return value.replace(day=1)
+
+
+def normalize_telephone(telephone):
+    """
+    Return "+" and the last 12 digits of the number, it is not a full E.164
+    parsing, numbers of up to 9 digits are Czech numbers without country code
+    """
+    digits = "".join(char for char in telephone or "" if char.isdigit())
+    if not digits:
+        return None
+    if len(digits) > 9:
+        return "+" + digits[-12:]
+    return "+420" + digits[-9:]
+
+
 class WithAdminUrl:
     def get_admin_url(self):
         return reverse(
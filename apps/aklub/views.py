@@ -19,7 +19,9 @@
 
 # Create your views here.
 import datetime
+import hashlib
 import json
+import time
 from collections import OrderedDict
 
 from django import forms, http
@@ -27,18 +29,18 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.mail import EmailMultiAlternatives
 from django.core.validators import MinLengthValidator, RegexValidator, ValidationError
-from django.db.models import Case, Count, IntegerField, Q, Sum, When
-from django.db.models.functions import TruncMonth
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
 from django.utils.encoding import force_bytes
-from django.utils.http import urlsafe_base64_encode
+from django.utils.http import http_date, quote_etag, urlsafe_base64_encode
 from django.utils.translation import ugettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView, View
@@ -52,13 +54,13 @@ from sesame.backends import ModelBackend
 
 import betterforms.multiform
 
-from . import autocom
+from . import autocom, stat_rollups
+from .utils import campaign_statistics_cache_key
 from aklub.models import (
     AdministrativeUnit,
     BankAccount,
     DonorPaymentChannel,
     MoneyAccount,
-    Payment,
     Preference,
     Profile,
     ProfileEmail,
@@ -405,8 +407,8 @@ def get_or_create_new_user_profile(form):
         )
 
     if form.forms["userprofile"].cleaned_data["telephone"]:
-        Telephone.objects.get_or_create(
-            telephone=form.forms["userprofile"].cleaned_data["telephone"], user=user
+        Telephone.objects.get_or_create_number(
+            form.forms["userprofile"].cleaned_data["telephone"], user
         )
 
     return user
@@ -707,66 +709,26 @@ class DonatorsView(View):
 
 
 def stat_members(request):
-    members_by_months = (
-        DonorPaymentChannel.objects.filter(user__is_active=True)
-        .annotate(month=TruncMonth("user__date_joined"))
-        .values("month")
-        .annotate(
-            total=Count("id"),
-            regular=Count(
-                Case(
-                    When(regular_payments="regular", then=1),
-                    output_field=IntegerField(),
-                )
-            ),
-            irregular=Count(
-                Case(
-                    When(~Q(regular_payments="regular"), then=1),
-                    output_field=IntegerField(),
-                )
-            ),
-        )
-        .order_by("month")
-        .all()
-    )
-    run_total = 0
-    for payment in members_by_months:
-        run_total += payment["total"]
-        payment["run_total"] = run_total
+    members_by_months, total_members = stat_rollups.members_by_months()
     return render(
         request,
         "stat-members.html",
         {
             "members_by_months": members_by_months,
-            "total_members": DonorPaymentChannel.objects.all()
-            .filter(user__is_active=True)
-            .aggregate(Count("id"))["id__count"],
+            "total_members": total_members,
             "site_header": _("Member statistics"),
         },
     )
 
 
 def stat_payments(request):
-    payments_by_months = (
-        Payment.objects.filter(~Q(type="expected"))
-        .annotate(month=TruncMonth("date"))
-        .values("month")
-        .annotate(total=Sum("amount"), donors=Count("user_donor_payment_channel"))
-        .order_by("month")
-        .all()
-    )
-    run_total = 0
-    for payment in payments_by_months:
-        run_total += payment["total"]
-        payment["run_total"] = run_total
+    payments_by_months, total_amount = stat_rollups.payments_by_months()
     return render(
         request,
         "stat-payments.html",
         {
             "payments_by_months": payments_by_months,
-            "total_amount": Payment.objects.all()
-            .filter(~Q(type="expected"))
-            .aggregate(Sum("amount"))["amount__sum"],
+            "total_amount": total_amount,
             "site_header": _("Payments statistics"),
         },
     )
@@ -776,24 +738,57 @@ class CampaignStatistics(View):
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
 
+    def get_statistics(self, campaign):
+        """
+        Cached statistics of the campaign with the validators
+        of the conditional requests
+        """
+        cache_key = campaign_statistics_cache_key(campaign.pk)
+        statistics = cache.get(cache_key)
+        if statistics is None:
+            figures = campaign.get_statistics()
+            content = json.dumps(
+                {
+                    "expected-yearly-income": figures["expected_yearly_income"],
+                    "total-income": figures["yield_total"],
+                    "number-of-onetime-members": figures["number_of_onetime_members"],
+                    "number-of-regular-members": figures["number_of_regular_members"],
+                    "number-of-active-members": figures["number_of_active_members"],
+                    "number-of-all-members": figures["number_of_all_members"],
+                    "number-of-confirmed-members": figures[
+                        "number_of_confirmed_members"
+                    ],
+                }
+            )
+            statistics = {
+                "content": content,
+                "etag": quote_etag(hashlib.md5(content.encode()).hexdigest()),
+                "last_modified": int(time.time()),
+            }
+            cache.set(
+                cache_key,
+                statistics,
+                settings.CAMPAIGN_STATISTICS_CACHE_TIMEOUT,
+            )
+        return statistics
+
     def get(self, request, *args, **kwargs):
         campaign = get_object_or_404(
             Event, slug=kwargs["campaign_slug"], allow_statistics=True
         )
-        return http.HttpResponse(
-            json.dumps(
-                {
-                    "expected-yearly-income": campaign.expected_yearly_income(),
-                    "total-income": campaign.yield_total(),
-                    "number-of-onetime-members": campaign.number_of_onetime_members(),
-                    "number-of-regular-members": campaign.number_of_regular_members(),
-                    "number-of-active-members": campaign.number_of_active_members(),
-                    "number-of-all-members": campaign.number_of_all_members(),
-                    "number-of-confirmed-members": campaign.number_of_confirmed_members(),
-                }
-            ),
+        statistics = self.get_statistics(campaign)
+        response = http.HttpResponse(
+            statistics["content"],
             content_type="application/json",
         )
+        response["ETag"] = statistics["etag"]
+        response["Last-Modified"] = http_date(statistics["last_modified"])
+        return get_conditional_response(
+            request,
+            etag=statistics["etag"],
+            last_modified=statistics["last_modified"],
+            response=response,
+        )
 
 
 class PetitionSignatures(View):
@@ -1,4 +1,4 @@
-from django.db.models import Q
+from aklub import profile_search
 from aklub.models import UserProfile, Telephone
 from rest_framework import viewsets, serializers, permissions
 
@@ -40,17 +40,7 @@ class UserSet(viewsets.ReadOnlyModelViewSet):
         search = self.request.query_params.get("q", None)
         q = UserProfile.objects.all()
         if search is not None:
-            q = q.filter(
-                Q(first_name__icontains=search)
-                | (
-                    Q(first_name__in=search.split(" "))
-                    & Q(last_name__in=search.split(" "))
-                )
-                | Q(last_name__icontains=search)
-                | Q(email__icontains=search)
-                | Q(nickname__icontains=search)
-                | Q(maiden_name__icontains=search)
-            )
+            q = profile_search.search(q, search)
         return q
 
 
@@ -12,12 +12,13 @@ from aklub.models import (
 
 from django.contrib.auth.password_validation import validate_password
 from django.core.validators import MinLengthValidator, RegexValidator
-from django.db.models import Count, Sum
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from events.models import Event, EventType, Location
-from interactions.models import InteractionCategory, InteractionType
+from interactions.models import Interaction, InteractionCategory, InteractionType
 
 from notifications_edit.utils import send_notification_to_is_staff_members
 
@@ -199,9 +200,7 @@ class GetOrCreateUserprofile(
         telephone = vd.get("telephone")
         if telephone:
             Telephone.objects.filter(user=user).update(is_primary=None)
-            no, created = Telephone.objects.get_or_create(
-                telephone=telephone, user=user
-            )
+            no, created = Telephone.objects.get_or_create_number(telephone, user)
             if not no.is_primary:
                 no.is_primary = True
                 no.save()
@@ -530,9 +529,11 @@ class EventSerializer(serializers.ModelSerializer):
 
 
 class EventIdLookupSerializer(EventSerializer):
-    users_paid = serializers.SerializerMethodField()
-    total_amount = serializers.SerializerMethodField()
-    registered_users_count_by_interaction_type = serializers.SerializerMethodField()
+    users_paid = serializers.IntegerField(read_only=True)
+    total_amount = serializers.FloatField(read_only=True)
+    registered_users_count_by_interaction_type = serializers.IntegerField(
+        read_only=True,
+    )
 
     class Meta(EventSerializer.Meta):
         model = Event
@@ -542,22 +543,33 @@ class EventIdLookupSerializer(EventSerializer):
             "registered_users_count_by_interaction_type",
         ]
 
-    def get_users_paid(self, obj):
-        return obj.donorpaymentchannel_set.distinct("user").count()
-
-    def get_total_amount(self, obj):
-        return obj.donorpaymentchannel_set.aggregate(sum=Sum("payment_total")).get(
-            "sum"
-        )
+    @staticmethod
+    def annotate_statistics(queryset, interaction_type_id):
+        """Annotate statistics of the events, serialized without queries per event"""
+
+        def event_subquery(model, value, **filters):
+            return Subquery(
+                model.objects.filter(event=OuterRef("pk"), **filters)
+                .order_by()
+                .values("event")
+                .annotate(value=value)
+                .values("value"),
+            )
 
-    def get_registered_users_count_by_interaction_type(self, obj):
-        interaction_type_id = self.context["request"].GET.get(
-            "interaction_type_id", None
-        )
-        return (
-            obj.interaction_set.filter(type__id=interaction_type_id)
-            .distinct("user")
-            .count()
+        return queryset.annotate(
+            users_paid=Coalesce(
+                event_subquery(DonorPaymentChannel, Count("user", distinct=True)),
+                0,
+            ),
+            total_amount=event_subquery(DonorPaymentChannel, Sum("payment_total")),
+            registered_users_count_by_interaction_type=Coalesce(
+                event_subquery(
+                    Interaction,
+                    Count("user", distinct=True),
+                    type__id=interaction_type_id,
+                ),
+                0,
+            ),
         )
 
 
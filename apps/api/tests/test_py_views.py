@@ -1,11 +1,15 @@
 from aklub.models import UserProfile
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from freezegun import freeze_time
 
+from model_mommy import mommy
+
 
 class TestAdministrativeUnitView:
     def test_administrative_unit_get_request(
@@ -156,3 +160,49 @@ class TestEventView:
             telephone_2,
             profileemail_2,
         )
+
+    def test_event_detail_view_statistics(
+        self,
+        event_1,
+        app_request,
+        interaction_type_1,
+        userprofile_1,
+        userprofile_2,
+    ):
+        url = reverse("event_detail", kwargs={"id": event_1.id})
+        url += f"?interaction_type_id={interaction_type_1.id}"
+
+        with CaptureQueriesContext(connection) as empty_queries:
+            response = app_request.get(url)
+        data = response.json()
+        assert data["users_paid"] == 0
+        assert data["total_amount"] is None
+        assert data["registered_users_count_by_interaction_type"] == 0
+
+        for user in (userprofile_1, userprofile_2):
+            dpch = mommy.make(
+                "aklub.DonorPaymentChannel",
+                event=event_1,
+                user=user,
+            )
+            mommy.make(
+                "aklub.Payment",
+                amount=100,
+                user_donor_payment_channel=dpch,
+            )
+            mommy.make(
+                "interactions.Interaction",
+                event=event_1,
+                user=user,
+                type=interaction_type_1,
+                _quantity=2,
+            )
+        mommy.make("interactions.Interaction", event=event_1, user=userprofile_1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = app_request.get(url)
+        assert len(queries) == len(empty_queries)
+        data = response.json()
+        assert data["users_paid"] == 2
+        assert data["total_amount"] == 200
+        assert data["registered_users_count_by_interaction_type"] == 2
@@ -1,5 +1,4 @@
-import json
-from unittest.mock import patch
+import datetime
 
 from api.utils import check_last_month_year_payment
 
@@ -49,10 +48,31 @@ class CheckLastMonthYearPaymentTest(TestCase):
             administrative_unit=self.unit,
         )
 
-    def _mock_darujme_url(self, mock_get):
-        with open("apps/aklub/test_data/darujme_response.json") as json_file:
-            mock_get.return_value.json.return_value = json.load(json_file)
-            mock_get.return_value.status_code = 200
+    def _mirror_darujme_pledges(self):
+        mommy.make(
+            "aklub.DarujmePledge",
+            api_account=self.api,
+            pledge_id=1,
+            email="trickyone@test.cz",
+            pledged_date=datetime.date(2015, 5, 1),
+            is_paid=False,
+        )
+        mommy.make(
+            "aklub.DarujmePledge",
+            api_account=self.api,
+            pledge_id=3,
+            email="big@tester.com",
+            pledged_date=datetime.date(2015, 5, 1),
+            is_paid=True,
+        )
+        mommy.make(
+            "aklub.DarujmePledge",
+            api_account=self.api,
+            pledge_id=2,
+            email="real@one.com",
+            pledged_date=datetime.date(2015, 4, 1),
+            is_paid=True,
+        )
 
     @override_settings(SUM_LAST_YEAR_PAYMENTS=3000, SUM_LAST_MONTH_PAYMENTS=100)
     def test_payment_found_month(self):
@@ -135,9 +155,8 @@ class CheckLastMonthYearPaymentTest(TestCase):
         self.assertTrue(cache.get(f"{self.user.id}_paid_section"))
 
     @override_settings(SUM_LAST_YEAR_PAYMENTS=3000, SUM_LAST_MONTH_PAYMENTS=100)
-    @patch("api.utils.requests.get")
-    def test_darujme_found_payment(self, mock_get):
-        self._mock_darujme_url(mock_get)
+    def test_darujme_found_payment(self):
+        self._mirror_darujme_pledges()
 
         self.dpch.money_account = self.api
         self.dpch.save()
@@ -154,9 +173,8 @@ class CheckLastMonthYearPaymentTest(TestCase):
         self.assertTrue(cache.get(f"{self.user.id}_paid_section"))
 
     @override_settings(SUM_LAST_YEAR_PAYMENTS=3000, SUM_LAST_MONTH_PAYMENTS=100)
-    @patch("api.utils.requests.get")
-    def test_darujme_email_not_found(self, mock_get):
-        self._mock_darujme_url(mock_get)
+    def test_darujme_email_not_found(self):
+        self._mirror_darujme_pledges()
 
         self.dpch.money_account = self.api
         self.dpch.save()
@@ -172,9 +190,8 @@ class CheckLastMonthYearPaymentTest(TestCase):
         self.assertFalse(result)
 
     @override_settings(SUM_LAST_YEAR_PAYMENTS=3000, SUM_LAST_MONTH_PAYMENTS=100)
-    @patch("api.utils.requests.get")
-    def test_darujme_payment_not_done(self, mock_get):
-        self._mock_darujme_url(mock_get)
+    def test_darujme_payment_not_done(self):
+        self._mirror_darujme_pledges()
 
         self.dpch.money_account = self.api
         self.dpch.save()
@@ -188,3 +205,42 @@ class CheckLastMonthYearPaymentTest(TestCase):
 
         result = check_last_month_year_payment(self.user)
         self.assertFalse(result)
+
+    @override_settings(SUM_LAST_YEAR_PAYMENTS=3000, SUM_LAST_MONTH_PAYMENTS=100)
+    def test_darujme_pledge_before_registered_support(self):
+        self._mirror_darujme_pledges()
+
+        self.dpch.money_account = self.api
+        self.dpch.save()
+
+        mommy.make(
+            "aklub.ProfileEmail",
+            email="real@one.com",
+            is_primary=True,
+            user=self.user,
+        )
+
+        result = check_last_month_year_payment(self.user)
+        self.assertFalse(result)
+
+    @override_settings(SUM_LAST_YEAR_PAYMENTS=3000, SUM_LAST_MONTH_PAYMENTS=100)
+    def test_payment_not_found_cached_until_new_payment(self):
+        result = check_last_month_year_payment(self.user)
+        self.assertFalse(result)
+        self.assertIs(cache.get(f"{self.user.id}_paid_section"), False)
+
+        payment = mommy.make(
+            "aklub.Payment",
+            date="2015-04-15",
+            amount=100,
+            user_donor_payment_channel=self.dpch,
+        )
+        self.assertIsNone(cache.get(f"{self.user.id}_paid_section"))
+        result = check_last_month_year_payment(self.user)
+        self.assertTrue(result)
+        self.assertTrue(cache.get(f"{self.user.id}_paid_section"))
+
+        payment.delete()
+        self.assertIsNone(cache.get(f"{self.user.id}_paid_section"))
+        result = check_last_month_year_payment(self.user)
+        self.assertFalse(result)
@@ -1,6 +1,7 @@
 import datetime
 
-from aklub.models import ApiAccount, DonorPaymentChannel, Payment
+from aklub.models import ApiAccount, DarujmePledge, DonorPaymentChannel, Payment
+from aklub.utils import paid_section_cache_key
 
 from django.conf import settings
 from django.core.cache import cache
@@ -8,10 +9,6 @@ from django.db.models import Q, Sum
 from django.db.models.functions import Coalesce
 from django.utils import timezone
 
-import requests
-
-from .exceptions import DarujmeConnectionException
-
 
 def get_or_create_dpch(serializer, profile):
     dpch, created = DonorPaymentChannel.objects.get_or_create(
@@ -39,10 +36,12 @@ def check_last_month_year_payment(user):  # noqa
     if user.is_staff:
         return True
 
-    # check cache first
-    found_payment = cache.get(f"{user.id}_paid_section") or False
+    # check cache first, negative results are cached too
+    # and the cache is invalidated by new payments of the user
+    found_payment = cache.get(paid_section_cache_key(user.id))
 
-    if not found_payment:
+    if found_payment is None:
+        found_payment = False
         # get sum of all payments for last month and last year
         payments_sum = Payment.objects.filter(
             user_donor_payment_channel__user=user,
@@ -83,35 +82,19 @@ def check_last_month_year_payment(user):  # noqa
             if isinstance(api, ApiAccount) and dpch.payment_total == 0:
                 # we are checking only newcomers => so we check if user confirmed it on darujme
                 # filtering from pledgeDate => so from the day, user filled form on darujme and our registered support.
-                url = (
-                    "https://www.darujme.cz/api/v1/organization/{0}/pledges-by-filter/"
-                    "?apiId={1}&apiSecret={2}&projectId={3}&fromPledgedDate={4}".format(
-                        api.api_organization_id,
-                        api.api_id,
-                        api.api_secret,
-                        api.project_id,
-                        dpch.registered_support.date(),
-                    )
-                )
-
-                response = requests.get(url)
-                if response.status_code != 200:
-                    raise DarujmeConnectionException()
-                for pledge in response.json()["pledges"]:
-                    if pledge["donor"]["email"] == user.get_email_str():
-                        transactions = pledge["transactions"]
-                        for transaction in transactions:
-
-                            if transaction["state"] in [
-                                "success",
-                                "sent_to_organization",
-                                "success_money_on_account",
-                            ]:
-                                # we are checking if the user just "donated", we dont know how many... but we let him in.
-                                found_payment = True
-                                break
-        if found_payment:
-            cache.set(
-                f"{user.id}_paid_section", True, timeout=60 * 60 * 3
-            )  # set cache for 3 hours
+                # we are checking if the user just "donated", we dont know how many... but we let him in.
+                # pledges are mirrored periodically by refresh_darujme_pledges task
+                found_payment = DarujmePledge.objects.filter(
+                    api_account=api,
+                    email=user.get_email_str().lower(),
+                    pledged_date__gte=dpch.registered_support.date(),
+                    is_paid=True,
+                ).exists()
+        cache.set(
+            paid_section_cache_key(user.id),
+            found_payment,
+            # payments get older than checked period => set cache for 3 hours
+            # new payments invalidate the cache => set cache for 1 day
+            timeout=60 * 60 * 3 if found_payment else 60 * 60 * 24,
+        )
     return found_payment
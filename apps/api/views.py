@@ -406,6 +406,12 @@ class EventRetrieveView(EventViewMixin, generics.RetrieveAPIView):
     lookup_field = "id"
     serializer_class = EventIdLookupSerializer
 
+    def get_queryset(self):
+        return self.serializer_class.annotate_statistics(
+            super().get_queryset(),
+            self.request.GET.get("interaction_type_id", None),
+        )
+
 
 class AdministrativeUnitView(generics.ListAPIView):
     """
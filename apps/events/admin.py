@@ -3,12 +3,12 @@ import json
 
 from aklub import darujme
 from aklub.filters import unit_admin_mixin_generator
+from aklub.models import Profile
 
 from api.serializers import EventSerializer
 
 from django.contrib import admin
-from django.db.models import Case, CharField, Q, Sum, Value, When, F
-from django.db.models.functions import Concat
+from django.db.models import Q, Sum, prefetch_related_objects
 from django.utils.html import format_html
 from django.utils.translation import ugettext as _
 from django.urls import reverse_lazy
@@ -17,6 +17,9 @@ from django.utils.safestring import mark_safe
 from import_export.admin import ImportExportMixin
 from import_export_celery.admin_actions import create_export_job_action
 from import_export.resources import ModelResource
+
+from interactions.models import Interaction
+
 from rangefilter.filter import DateTimeRangeFilter
 from treenode.admin import TreeNodeModelAdmin
 from treenode.forms import TreeNodeForm
@@ -105,6 +108,19 @@ class EventAdmin(
     none_val = "-"
     yes_icon = '<img src="/media/admin/img/icon-yes.svg" alt="True"/>'
     no_icon = '<img src="/media/admin/img/icon-no.svg" alt="False"/>'
+    organize_zmj_type_name = _("Organizace lokality Zažít město jinak")
+    organize_uso_type_name = _("Účast na setkání organizátorů")
+    contract_type_name = _("Smlouva")
+    contract_signed_result_name = _("Podepsáno")
+    order_signs_type_name = _("Objednal značky")
+    zabor_zmj_type_name = _("Zábor ZMJ")
+    coordinator_interaction_type_names = (
+        organize_zmj_type_name,
+        organize_uso_type_name,
+        contract_type_name,
+        order_signs_type_name,
+        zabor_zmj_type_name,
+    )
     form = EventForm
     inlines = (OrganizationTeamInline,)
     list_display = (
@@ -580,28 +596,88 @@ class EventAdmin(
 
         return mark_safe(f"<a href='{url_with_querystring}'>Show users</a>")
 
-    def _get_unique_organizator_interaction(self, organizators):
-        organizators_with_interaction = []
-        for organizator in organizators:
-            if organizator["id"] not in [
-                o["id"] for o in organizators_with_interaction
-            ]:
-                organizators_with_interaction.append(
-                    {
-                        "id": organizator["id"],
-                        "has_any_coordinator": organizator["has_any_coordinator"],
-                    }
-                )
+    def attach_organization_teams(self, events):
+        """
+        Load organizers of all the events with their contacts
+        and interactions shown in the coordinator columns at once
+        """
+        teams = list(
+            OrganizationTeam.objects.filter(event__in=events)
+            .select_related("position")
+            .order_by("pk")
+        )
+        profiles = {
+            profile.pk: profile
+            for profile in Profile.objects.filter(
+                pk__in={team.profile_id for team in teams},
+            )
+        }
+        user_profiles = [p for p in profiles.values() if p.is_userprofile()]
+        company_profiles = [p for p in profiles.values() if not p.is_userprofile()]
+        prefetch_related_objects(user_profiles, "profileemail_set", "telephone_set")
+        prefetch_related_objects(company_profiles, "companycontact_set")
+        for profile in profiles.values():
+            profile.coordinator_interactions = []
+        for interaction in (
+            Interaction.objects.filter(
+                user__in=profiles.keys(),
+                type__name__in=self.coordinator_interaction_type_names,
+            )
+            .order_by("pk")
+            .values_list("user", "type__name", "result__name", "status", named=True)
+        ):
+            profiles[interaction.user].coordinator_interactions.append(interaction)
+        for event in events:
+            event.organization_teams = [
+                (team.position.name, profiles[team.profile_id])
+                for team in teams
+                if team.event_id == event.pk
+            ]
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        self.attach_organization_teams(list(changelist.result_list))
+        return changelist
+
+    def get_organizators(self, obj, *positions):
+        if not hasattr(obj, "organization_teams"):
+            self.attach_organization_teams([obj])
+        return [
+            profile
+            for position, profile in obj.organization_teams
+            if not positions or position in positions
+        ]
+
+    def coordinator_interaction_icons(
+        self, obj, interaction_type_name, result_name=None, with_status=False
+    ):
+        organizators = self.get_organizators(
+            obj,
+            self.main_coordinator_name,
+            self.secondary_coordinator_name,
+        )
+        icons = []
+        for profile in organizators:
+            interaction = next(
+                (
+                    interaction
+                    for interaction in profile.coordinator_interactions
+                    if interaction.type__name == interaction_type_name
+                    and result_name in (None, interaction.result__name)
+                ),
+                None,
+            )
+            if interaction is None:
+                icons.append(self.no_icon)
+            elif with_status:
+                icons.append(f"{self.yes_icon} {interaction.status or ''}")
             else:
-                if organizator["has_any_coordinator"] == self.yes_icon:
-                    organizators_with_interaction[-1][
-                        "has_any_coordinator"
-                    ] = organizator["has_any_coordinator"]
-        return organizators_with_interaction
+                icons.append(self.yes_icon)
+        return mark_safe("<br>".join(icons)) if icons else self.none_val
 
     def local_organizer(self, obj):
         names = []
-        for profile in obj.organization_team.all():
+        for profile in self.get_organizators(obj):
             if profile.is_userprofile():
                 names.append(
                     "{first_name} {last_name}".format(
@@ -619,20 +695,16 @@ class EventAdmin(
 
     def main_coordinator(self, obj):
         names = []
-        main_organizators = OrganizationTeam.objects.filter(
-            event=obj,
-            position__name=self.main_coordinator_name,
-        )
-        for organizator in main_organizators:
-            if organizator.profile.is_userprofile():
+        for profile in self.get_organizators(obj, self.main_coordinator_name):
+            if profile.is_userprofile():
                 names.append(
                     "<b>{first_name} {last_name}</b>".format(
-                        first_name=organizator.profile.first_name.strip(),
-                        last_name=organizator.profile.last_name.strip(),
+                        first_name=profile.first_name.strip(),
+                        last_name=profile.last_name.strip(),
                     )
                 )
             else:
-                names.append(organizator.profile.get_main_contact_name())
+                names.append(profile.get_main_contact_name())
 
         return mark_safe("<br>".join(names)) if names else self.none_val
 
@@ -640,13 +712,10 @@ class EventAdmin(
     main_coordinator.admin_order_field = "main_coordinator"
 
     def main_coordinator_email(self, obj):
-        emails = []
-        main_organizators = OrganizationTeam.objects.filter(
-            event=obj,
-            position__name=self.main_coordinator_name,
-        )
-        for organizator in main_organizators:
-            emails.append(organizator.profile.get_email())
+        emails = [
+            profile.get_email()
+            for profile in self.get_organizators(obj, self.main_coordinator_name)
+        ]
 
         return mark_safe("<br>".join(emails)) if emails else self.none_val
 
@@ -654,13 +723,10 @@ class EventAdmin(
     main_coordinator_email.admin_order_field = "main_coordinator_email"
 
     def secondary_coordinator_email(self, obj):
-        emails = []
-        secondary_organizators = OrganizationTeam.objects.filter(
-            event=obj,
-            position__name=self.secondary_coordinator_name,
-        )
-        for organizator in secondary_organizators:
-            emails.append(organizator.profile.get_email())
+        emails = [
+            profile.get_email()
+            for profile in self.get_organizators(obj, self.secondary_coordinator_name)
+        ]
 
         return mark_safe("<br>".join(emails)) if emails else self.none_val
 
@@ -668,63 +734,18 @@ class EventAdmin(
     secondary_coordinator_email.admin_order_field = "secondary_coordinator_email"
 
     def main_coordinator_telephone(self, obj):
-        telephones = []
-        main_organizators = OrganizationTeam.objects.filter(
-            event=obj,
-            position__name=self.main_coordinator_name,
-        )
-        for organizator in main_organizators:
-            telephones.append(organizator.profile.get_telephone())
+        telephones = [
+            profile.get_telephone()
+            for profile in self.get_organizators(obj, self.main_coordinator_name)
+        ]
 
         return mark_safe("<br>".join(telephones)) if telephones else self.none_val
 
     main_coordinator_telephone.short_description = _("Contact person main telephone")
     main_coordinator_telephone.admin_order_field = "main_coordinator_telephone"
 
-    def has_any_coordinator_interaction_with_organize_zmj(
-        self,
-        obj,
-        interaction_type_name=_("Organizace lokality Zažít město jinak"),
-        then=None,
-    ):
-        if then is None:
-            then = Value(self.yes_icon)
-        whens = [
-            When(
-                profile__interaction__type__name=interaction_type_name,
-                then=then,
-            ),
-        ]
-        organizators = (
-            OrganizationTeam.objects.filter(
-                event=obj,
-                position__name__in=(
-                    self.main_coordinator_name,
-                    self.secondary_coordinator_name,
-                ),
-            )
-            .annotate(
-                has_any_coordinator=Case(
-                    *whens,
-                    output_field=CharField(),
-                    default=Value(self.no_icon),
-                )
-            )
-            .values()
-        )
-
-        return (
-            mark_safe(
-                "<br>".join(
-                    [
-                        i["has_any_coordinator"]
-                        for i in self._get_unique_organizator_interaction(organizators)
-                    ]
-                )
-            )
-            if organizators
-            else self.none_val
-        )
+    def has_any_coordinator_interaction_with_organize_zmj(self, obj):
+        return self.coordinator_interaction_icons(obj, self.organize_zmj_type_name)
 
     has_any_coordinator_interaction_with_organize_zmj.short_description = _(
         "Have any interaction with organize location ZMJ"
@@ -748,15 +769,8 @@ class EventAdmin(
     specific_location_name.short_description = _("Specific location name")
     specific_location_name.admin_order_field = "specific_location_name"
 
-    def has_any_coordinator_interaction_with_organize_uso(
-        self,
-        obj,
-        interaction_type_name=_("Účast na setkání organizátorů"),
-    ):
-        return self.has_any_coordinator_interaction_with_organize_zmj(
-            obj,
-            interaction_type_name,
-        )
+    def has_any_coordinator_interaction_with_organize_uso(self, obj):
+        return self.coordinator_interaction_icons(obj, self.organize_uso_type_name)
 
     has_any_coordinator_interaction_with_organize_uso.short_description = _(
         "Have any interaction with Účast na setkání organizátorů"
@@ -765,48 +779,11 @@ class EventAdmin(
         "has_any_coordinator_interaction_with_organize_uso"
     )
 
-    def has_any_coordinator_interaction_type_of_contract_with_signed_result(
-        self,
-        obj,
-        interaction_type_name=_("Smlouva"),
-        interaction_result_name=_("Podepsáno"),
-    ):
-        whens = [
-            When(
-                profile__interaction__type__name=interaction_type_name,
-                profile__interaction__result__name=interaction_result_name,
-                then=Value(self.yes_icon),
-            ),
-        ]
-        organizators = (
-            OrganizationTeam.objects.filter(
-                event=obj,
-                position__name__in=(
-                    self.main_coordinator_name,
-                    self.secondary_coordinator_name,
-                ),
-            )
-            .annotate(
-                has_any_coordinator=Case(
-                    *whens,
-                    output_field=CharField(),
-                    default=Value(self.no_icon),
-                )
-            )
-            .values()
-        )
-
-        return (
-            mark_safe(
-                "<br>".join(
-                    [
-                        i["has_any_coordinator"]
-                        for i in self._get_unique_organizator_interaction(organizators)
-                    ]
-                )
-            )
-            if organizators
-            else self.none_val
+    def has_any_coordinator_interaction_type_of_contract_with_signed_result(self, obj):
+        return self.coordinator_interaction_icons(
+            obj,
+            self.contract_type_name,
+            result_name=self.contract_signed_result_name,
         )
 
     has_any_coordinator_interaction_type_of_contract_with_signed_result.short_description = _(
@@ -816,19 +793,11 @@ class EventAdmin(
         "has_any_coordinator_interaction_type_of_contract_with_signed_result"
     )
 
-    def has_any_coordinator_interaction_type_of_order_signs(
-        self,
-        obj,
-        interaction_type_name=_("Objednal značky"),
-    ):
-        return self.has_any_coordinator_interaction_with_organize_zmj(
+    def has_any_coordinator_interaction_type_of_order_signs(self, obj):
+        return self.coordinator_interaction_icons(
             obj,
-            interaction_type_name,
-            then=Concat(
-                Value(self.yes_icon),
-                Value(" "),
-                F("profile__interaction__status"),
-            ),
+            self.order_signs_type_name,
+            with_status=True,
         )
 
     has_any_coordinator_interaction_type_of_order_signs.short_description = _(
@@ -838,19 +807,11 @@ class EventAdmin(
         "has_any_coordinator_interaction_type_of_order_signs"
     )
 
-    def has_any_coordinator_interaction_type_of_zabor_zmj(
-        self,
-        obj,
-        interaction_type_name=_("Zábor ZMJ"),
-    ):
-        return self.has_any_coordinator_interaction_with_organize_zmj(
+    def has_any_coordinator_interaction_type_of_zabor_zmj(self, obj):
+        return self.coordinator_interaction_icons(
             obj,
-            interaction_type_name,
-            then=Concat(
-                Value(self.yes_icon),
-                Value(" "),
-                F("profile__interaction__status"),
-            ),
+            self.zabor_zmj_type_name,
+            with_status=True,
         )
 
     has_any_coordinator_interaction_type_of_zabor_zmj.short_description = _(
@@ -1,11 +1,14 @@
-from aklub.models import DonorPaymentChannel, Recruiter
+from aklub.models import DonorPaymentChannel, Payment, Recruiter
+from aklub.utils import invalidate_campaign_statistics, invalidate_list_filter_choices
 
 from autoslug import AutoSlugField
 
 from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
 from django.conf import settings
 from django.db import models
-from django.db.models import Sum
+from django.db.models import Sum, signals
+from django.db.models.functions import Coalesce
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 from multiselectfield import MultiSelectField
@@ -594,6 +597,84 @@ class Event(TreeNodeModel):
             self.petitionsignature_set.filter(email_confirmed=True).distinct().count()
         )
 
+    def get_statistics(self):
+        """All the figures of the statistics page computed in one query"""
+        from interactions.models import PetitionSignature
+
+        def count(queryset, value=None):
+            return Coalesce(
+                models.Subquery(
+                    queryset.order_by()
+                    .values("event")
+                    .annotate(value=value or models.Count("pk", distinct=True))
+                    .values("value"),
+                    output_field=models.BigIntegerField(),
+                ),
+                0,
+            )
+
+        channels = DonorPaymentChannel.objects.filter(event=models.OuterRef("pk"))
+        active_channels = channels.filter(
+            models.Exists(
+                Payment.objects.filter(
+                    user_donor_payment_channel=models.OuterRef("pk"),
+                    amount__gt=0,
+                ),
+            ),
+        )
+        payments = Payment.objects.filter(
+            user_donor_payment_channel__event=models.OuterRef("pk"),
+        )
+        statistics = (
+            Event.objects.filter(pk=self.pk)
+            .annotate(
+                expected_yearly_income=count(
+                    active_channels,
+                    Sum(DonorPaymentChannel.yearly_regular_amount_expression()),
+                ),
+                payments_total=models.Subquery(
+                    payments.order_by()
+                    .values("user_donor_payment_channel__event")
+                    .annotate(value=Sum("amount"))
+                    .values("value"),
+                    output_field=models.BigIntegerField(),
+                ),
+                number_of_onetime_members=count(
+                    active_channels.exclude(regular_payments="regular"),
+                ),
+                number_of_regular_members=count(
+                    active_channels.filter(regular_payments="regular"),
+                ),
+                number_of_active_members=count(active_channels),
+                number_of_all_members=count(channels),
+                number_of_confirmed_members=count(
+                    PetitionSignature.objects.filter(
+                        event=models.OuterRef("pk"),
+                        email_confirmed=True,
+                    ),
+                ),
+            )
+            .values(
+                "intended_for",
+                "real_yield",
+                "expected_yearly_income",
+                "payments_total",
+                "number_of_onetime_members",
+                "number_of_regular_members",
+                "number_of_active_members",
+                "number_of_all_members",
+                "number_of_confirmed_members",
+            )
+            .get()
+        )
+        if statistics.pop("intended_for") == "newcomers":
+            statistics["yield_total"] = statistics.pop("payments_total")
+            statistics.pop("real_yield")
+        else:
+            statistics["yield_total"] = statistics.pop("real_yield")
+            statistics.pop("payments_total")
+        return statistics
+
     def recruiters(self):
         return Recruiter.objects.filter(campaigns=self)
 
@@ -615,13 +696,18 @@ class Event(TreeNodeModel):
     yield_total.short_description = _("total yield")
 
     def expected_yearly_income(self):
-        income = 0
-        for campaign_member in DonorPaymentChannel.objects.filter(
-            event=self, payment__amount__gt=0
-        ).distinct():
-            # TODO: use aggregate to count this
-            income += campaign_member.yearly_regular_amount()
-        return income
+        income = DonorPaymentChannel.objects.filter(
+            models.Exists(
+                Payment.objects.filter(
+                    user_donor_payment_channel=models.OuterRef("pk"),
+                    amount__gt=0,
+                ),
+            ),
+            event=self,
+        ).aggregate(
+            income=Sum(DonorPaymentChannel.yearly_regular_amount_expression()),
+        )
+        return income["income"] or 0
 
     expected_yearly_income.short_description = _("expected yearly income")
 
@@ -657,6 +743,18 @@ class Event(TreeNodeModel):
         return str(self.name)
 
 
+@receiver(signals.post_save, sender=Event)
+def Event_changed_invalidate_campaign_statistics(sender, instance, **kwargs):
+    invalidate_campaign_statistics([instance.pk])
+
+
+@receiver(signals.post_save, sender=Event)
+@receiver(signals.post_delete, sender=Event)
+@receiver(signals.m2m_changed, sender=Event.administrative_units.through)
+def Event_changed_invalidate_list_filter_choices(sender, **kwargs):
+    invalidate_list_filter_choices()
+
+
 class OrganizationPosition(models.Model):
     class Meta:
         verbose_name = _("Organization position")
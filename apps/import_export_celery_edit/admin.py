@@ -1,4 +1,5 @@
 from aklub.filters import unit_admin_mixin_generator
+from aklub.utils import get_unit_access
 
 from django.contrib import admin
 from django.forms.models import ModelForm
@@ -25,9 +26,9 @@ class InlineMixin(object):
     form = InlineMixinForm
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
-        if not request.user.has_perm("aklub.can_edit_all_units"):
+        if not get_unit_access(request).all_units:
             if db_field.name == "administrative_unit":
-                kwargs["queryset"] = request.user.administrated_units.all()
+                kwargs["queryset"] = get_unit_access(request).units
                 kwargs["required"] = True
                 kwargs["initial"] = kwargs["queryset"].first()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
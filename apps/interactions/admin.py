@@ -1,4 +1,6 @@
+from aklub.admin_views import FastChangeListAdminMixin
 from aklub.models import AdministrativeUnit, CompanyContact, Profile, ProfileEmail
+from aklub.utils import get_unit_access
 
 from django.contrib import admin
 from django.core import serializers
@@ -147,7 +149,9 @@ sync_with_daktela.short_description = _("Sync interactions with Daktela app tick
 
 
 @admin.register(Interaction)
-class InteractionAdmin(ImportExportMixin, RelatedFieldAdmin, admin.ModelAdmin):
+class InteractionAdmin(
+    FastChangeListAdminMixin, ImportExportMixin, RelatedFieldAdmin, admin.ModelAdmin
+):
     resource_class = InteractionResource
     autocomplete_fields = ("user",)
     import_template_name = "admin/import_export/userprofile_import.html"
@@ -209,21 +213,21 @@ class InteractionAdmin(ImportExportMixin, RelatedFieldAdmin, admin.ModelAdmin):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "event":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
+            if not get_unit_access(request).all_units:
                 kwargs["queryset"] = Event.objects.filter(
-                    administrative_units__in=request.user.administrated_units.all()
+                    administrative_units__in=get_unit_access(request).unit_ids
                 )
             else:
                 kwargs["queryset"] = Event.objects.all()
         if db_field.name == "administrative_unit":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
-                kwargs["queryset"] = request.user.administrated_units.all()
+            if not get_unit_access(request).all_units:
+                kwargs["queryset"] = get_unit_access(request).units
             else:
                 kwargs["queryset"] = AdministrativeUnit.objects.all()
         if db_field.name == "user":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
+            if not get_unit_access(request).all_units:
                 kwargs["queryset"] = Profile.objects.filter(
-                    administrative_units__in=request.user.administrated_units.all()
+                    administrative_units__in=get_unit_access(request).unit_ids
                 )
             else:
                 kwargs["queryset"] = Profile.objects.all()
@@ -232,13 +236,10 @@ class InteractionAdmin(ImportExportMixin, RelatedFieldAdmin, admin.ModelAdmin):
 
     def get_readonly_fields(self, request, obj=None):
         if obj:
-            if request.user.has_perm("aklub.can_edit_all_units"):
+            if get_unit_access(request).all_units:
                 fields = super().get_readonly_fields(request, obj)
             else:
-                if (
-                    request.user.administrated_units.all().first()
-                    == obj.administrative_unit
-                ):
+                if get_unit_access(request).first_unit == obj.administrative_unit:
                     fields = super().get_readonly_fields(request, obj)
                 else:
                     fields = [f.name for f in self.model._meta.fields]
@@ -257,9 +258,9 @@ class InteractionAdmin(ImportExportMixin, RelatedFieldAdmin, admin.ModelAdmin):
                 "user__companyprofile",
             )
         )
-        if not request.user.has_perm("aklub.can_edit_all_units"):
+        if not get_unit_access(request).all_units:
             qs = qs.filter(
-                user__administrative_units=request.user.administrated_units.first()
+                user__administrative_units=get_unit_access(request).first_unit
             )
         return qs
 
@@ -380,9 +381,9 @@ class InteractionInline(admin.StackedInline):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "event":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
+            if not get_unit_access(request).all_units:
                 kwargs["queryset"] = Event.objects.filter(
-                    administrative_units__in=request.user.administrated_units.all()
+                    administrative_units__in=get_unit_access(request).unit_ids
                 )
             else:
                 kwargs["queryset"] = Event.objects.all()
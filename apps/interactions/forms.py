@@ -1,3 +1,5 @@
+from aklub.utils import get_unit_access
+
 from django import forms
 
 from .models import Interaction
@@ -10,23 +12,17 @@ class InteractionInlineForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if not self.request.user.has_perm("aklub.can_edit_all_units"):
+        unit_access = get_unit_access(self.request)
+        if not unit_access.all_units:
             if not self.instance.pk:
-                self.fields[
-                    "administrative_unit"
-                ].queryset = self.request.user.administrated_units
+                self.fields["administrative_unit"].queryset = unit_access.units
                 self.fields["administrative_unit"].empty_label = None
             else:
-                if (
-                    self.request.user.administrated_units.first()
-                    != self.instance.administrative_unit
-                ):
+                if unit_access.first_unit != self.instance.administrative_unit:
                     for field_name in self.fields:
                         self.fields[field_name].disabled = True
                 else:
-                    self.fields[
-                        "administrative_unit"
-                    ].queryset = self.request.user.administrated_units
+                    self.fields["administrative_unit"].queryset = unit_access.units
                     self.fields["administrative_unit"].empty_label = None
 
 
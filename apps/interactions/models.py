@@ -1,7 +1,7 @@
 import os.path
 
 from aklub.models import AdministrativeUnit, Profile
-from aklub.utils import WithAdminUrl
+from aklub.utils import WithAdminUrl, invalidate_campaign_statistics
 from events.models import Event
 
 from autoslug import AutoSlugField
@@ -9,6 +9,8 @@ from autoslug import AutoSlugField
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 from django.db import models
+from django.db.models import signals
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 import html2text
@@ -404,6 +406,14 @@ class PetitionSignature(BaseInteraction2):
     )
 
 
+@receiver(signals.post_save, sender=PetitionSignature)
+@receiver(signals.post_delete, sender=PetitionSignature)
+def PetitionSignature_changed_invalidate_campaign_statistics(
+    sender, instance, **kwargs
+):
+    invalidate_campaign_statistics([instance.event_id])
+
+
 class InteractionType(models.Model):
     class Meta:
         verbose_name = _("Interaction Type")
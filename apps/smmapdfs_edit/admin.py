@@ -1,5 +1,6 @@
 from aklub.filters import unit_admin_mixin_generator
 from aklub.models import TaxConfirmationField
+from aklub.utils import get_unit_access
 
 from django.contrib import admin
 from django.forms.models import ModelForm
@@ -25,8 +26,8 @@ class PdfInlineMixin(object):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "administrative_unit":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
-                kwargs["queryset"] = request.user.administrated_units.all()
+            if not get_unit_access(request).all_units:
+                kwargs["queryset"] = get_unit_access(request).units
                 kwargs["initial"] = kwargs["queryset"].first()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
@@ -57,9 +58,10 @@ class _PdfSandwichEmailAdmin(
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "pdfsandwich_type":
-            if not request.user.has_perm("aklub.can_edit_all_units"):
+            unit_access = get_unit_access(request)
+            if not unit_access.all_units:
                 kwargs["queryset"] = PdfSandwichType.objects.filter(
-                    pdfsandwichtypeconnector__administrative_unit__in=request.user.administrated_units.all(),
+                    pdfsandwichtypeconnector__administrative_unit__in=unit_access.unit_ids,
                 )
             else:
                 return super().formfield_for_foreignkey(db_field, request, **kwargs)
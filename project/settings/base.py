@@ -571,6 +571,58 @@ SUM_LAST_YEAR_PAYMENTS = int(os.environ.get("SUM_LAST_YEAR_PAYMENTS", 0))
 DARUJME_EMAIL_AS_USERNAME = os.environ.get(
     "DARUJME_EMAIL_AS_USERNAME", "False"
 ).lower() in ("true", "t")
+# darujme download all pledges every X hours, only new pledges otherwise,
+# new transactions of older recurring pledges are imported by the full download
+DARUJME_FULL_DOWNLOAD_INTERVAL = int(
+    os.environ.get("DARUJME_FULL_DOWNLOAD_INTERVAL", 24)
+)
+# darujme incremental download also gets pledges X days older than the newest one
+DARUJME_INCREMENTAL_DOWNLOAD_OVERLAP = int(
+    os.environ.get("DARUJME_INCREMENTAL_DOWNLOAD_OVERLAP", 7)
+)
+# darujme import parses and saves pledges in batches of X pledges
+DARUJME_IMPORT_BATCH_SIZE = int(os.environ.get("DARUJME_IMPORT_BATCH_SIZE", 500))
+# darujme api accounts are downloaded concurrently by X workers
+DARUJME_DOWNLOAD_WORKERS = int(os.environ.get("DARUJME_DOWNLOAD_WORKERS", 8))
+# darujme pledges of last X days, or since the registration of the oldest
+# newcomer without imported payment, are mirrored for the paid section check
+DARUJME_PLEDGE_MIRROR_DAYS = int(os.environ.get("DARUJME_PLEDGE_MIRROR_DAYS", 62))
+# darujme api request timeout in seconds
+DARUJME_API_TIMEOUT = int(os.environ.get("DARUJME_API_TIMEOUT", 60))
+# darujme downloaded response bigger than X bytes is stored on disk
+DARUJME_SPOOL_MAX_SIZE = int(os.environ.get("DARUJME_SPOOL_MAX_SIZE", 5 * 1024 * 1024))
+
+# dashboard chart buckets of the last X days are always computed from the data,
+# older buckets are stored
+DASHBOARD_TIME_SERIES_OPEN_DAYS = int(
+    os.environ.get("DASHBOARD_TIME_SERIES_OPEN_DAYS", 1)
+)
+
+# tax confirmation PDFs are rendered by parallel tasks in chunks of X confirmations
+TAX_CONFIRMATION_PDF_CHUNK_SIZE = int(
+    os.environ.get("TAX_CONFIRMATION_PDF_CHUNK_SIZE", 200)
+)
+
+# public campaign statistics are cached for X seconds,
+# changed payments and channels of the campaign invalidate them earlier
+CAMPAIGN_STATISTICS_CACHE_TIMEOUT = int(
+    os.environ.get("CAMPAIGN_STATISTICS_CACHE_TIMEOUT", 24 * 60 * 60)
+)
+
+# choices of the event and unit list filters are cached for X seconds,
+# changed events and administrative units invalidate them earlier
+LIST_FILTER_CHOICES_CACHE_TIMEOUT = int(
+    os.environ.get("LIST_FILTER_CHOICES_CACHE_TIMEOUT", 24 * 60 * 60)
+)
+
+# admin changelists estimate the number of results when it is above X,
+# unless exact count is requested
+ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get("ADMIN_EXACT_COUNT_LIMIT", 10000))
+
+# payments by year of more than X payment channels are summed in the background
+PAYMENTS_BY_YEAR_BACKGROUND_LIMIT = int(
+    os.environ.get("PAYMENTS_BY_YEAR_BACKGROUND_LIMIT", 10000)
+)
 
 # django admin action ignored_fields
 UPDATE_ACTION_IGNORED_FIELDS = {
@@ -650,6 +702,22 @@ CELERYBEAT_SCHEDULE = {
         "task": "aklub.tasks.check_celerybeat_liveness",
         "schedule": crontab(minute="*/1"),
     },
+    "refresh_darujme_pledges": {
+        "task": "aklub.tasks.refresh_darujme_pledges",
+        "schedule": crontab(minute="*/5"),
+    },
+    "refresh_statistics_rollups": {
+        "task": "aklub.tasks.refresh_statistics_rollups",
+        "schedule": crontab(minute="*/10"),
+    },
+    "precompute_dashboard_conditions": {
+        "task": "aklub.tasks.precompute_dashboard_conditions",
+        "schedule": crontab(minute=0),
+    },
+    "refresh_profile_duplicates": {
+        "task": "aklub.tasks.refresh_profile_duplicates",
+        "schedule": crontab(minute=30),
+    },
 }
 
 CELERYBEAT_LIVENESS_REDIS_UNIQ_KEY = "celerybeat-liveness"